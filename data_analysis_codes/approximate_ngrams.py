@@ -0,0 +1,127 @@
+import numpy as np
+from external_ngrams import MAX_N, hash_ids, review_ngram_ids, encode_batches
+
+# Approximate phrase counts in a fixed amount of memory, for quick scans of whole categories.
+# Every hashed n-gram is counted in a Count-Min Sketch, which never under-counts; the top_k n-grams with the highest
+# estimates are kept as candidate heavy hitters. A second pass over the reviews flags those containing a heavy hitter.
+# Apart from the token vocabulary, memory is the sketch, the top_k candidates and one batch of n-grams.
+
+SKETCH_MB = 16
+DEPTH = 4
+TOP_K = 1000
+BATCH_TOKENS = 1 << 16
+MIN_WIDTH = 1 << 10
+
+class CountMinSketch:
+    """depth x width counters; an estimate exceeds the true count by more than e / width * total with probability at most exp(-depth)."""
+
+    def __init__(self, memory_mb=SKETCH_MB, depth=DEPTH, seed=0):
+        # Width is a power of two so that each row can pick its counter with a multiply-shift of the 64-bit n-gram hash
+        width = max(MIN_WIDTH, int(memory_mb * 1024 * 1024) // (4 * depth))
+        self.bits = width.bit_length() - 1
+        self.width = 1 << self.bits
+        self.depth = depth
+        self.table = np.zeros((depth, self.width), dtype=np.int32)
+        self.multipliers = np.random.default_rng(seed).integers(0, 2 ** 63, size=depth, dtype=np.uint64) * np.uint64(2) + np.uint64(1)
+        self.total = 0
+
+    def cells(self, hashes):
+        with np.errstate(over='ignore'):
+            return [((hashes * multiplier) >> np.uint64(64 - self.bits)).astype(np.int64) for multiplier in self.multipliers]
+
+    def estimate(self, hashes):
+        cells = self.cells(hashes)
+        return np.min([row[cell] for row, cell in zip(self.table, cells)], axis=0).astype(np.int64) if len(hashes) else np.zeros(0, dtype=np.int64)
+
+    def add(self, hashes, counts):
+        # Conservative update of distinct hashes: a counter is only raised as far as the new estimate of its n-gram needs
+        cells = self.cells(hashes)
+        target = (np.min([row[cell] for row, cell in zip(self.table, cells)], axis=0) + counts).astype(np.int32)
+        for row, cell in zip(self.table, cells):
+            np.maximum.at(row, cell, target)
+        self.total += int(counts.sum())
+
+    def error_bound(self):
+        return np.e / self.width * self.total
+
+    def confidence(self):
+        return 1 - np.exp(-self.depth)
+
+class PhraseSketch:
+    """Approximate n-gram counts of a set of reviews with the top_k most frequent n-grams kept as candidates."""
+
+    def __init__(self, min_length=3, max_n=MAX_N, sketch_mb=SKETCH_MB, depth=DEPTH, top_k=TOP_K):
+        self.min_length = min_length
+        self.max_n = max_n
+        self.top_k = top_k
+        self.sketch = CountMinSketch(sketch_mb, depth)
+        self.vocabulary = {}
+        self.tokens_of_id = []
+        self.hashes = np.empty(0, dtype=np.uint64)
+        self.ids = np.empty((0, MAX_N), dtype=np.int32)
+        self.estimates = np.empty(0, dtype=np.int64)
+        # Highest estimate of an n-gram dropped from the candidates; no n-gram outside them occurs more often than this
+        self.evicted_max = 0
+        self.reviews = 0
+
+    def add_reviews(self, tokenized_reviews):
+        for token_ids, lengths in encode_batches(tokenized_reviews, self.vocabulary, self.tokens_of_id, BATCH_TOKENS):
+            ids = review_ngram_ids(token_ids, lengths, self.min_length, self.max_n)
+            hashes, first, counts = np.unique(hash_ids(ids), return_index=True, return_counts=True)
+            self.sketch.add(hashes, counts)
+            self.update_candidates(hashes, ids[first], self.sketch.estimate(hashes))
+            self.reviews += len(lengths)
+        self.estimates = self.sketch.estimate(self.hashes)
+
+    def update_candidates(self, hashes, ids, estimates):
+        # The n-grams of the batch replace their older entries, then only the top_k estimates are kept
+        keep = ~np.isin(self.hashes, hashes)
+        hashes = np.concatenate([self.hashes[keep], hashes])
+        ids = np.concatenate([self.ids[keep], ids])
+        estimates = np.concatenate([self.estimates[keep], estimates])
+        if len(hashes) > self.top_k:
+            order = np.argpartition(-estimates, self.top_k - 1)
+            self.evicted_max = max(self.evicted_max, int(estimates[order[self.top_k:]].max()))
+            order = order[:self.top_k]
+            hashes, ids, estimates = hashes[order], ids[order], estimates[order]
+        self.hashes, self.ids, self.estimates = hashes, ids, estimates
+
+    def heavy_hitters(self, min_freq):
+        # Candidates that may reach min_freq, and those that reach it even after subtracting the sketch error
+        possible = self.estimates >= min_freq
+        certain = self.estimates - self.sketch.error_bound() >= min_freq
+        return possible, certain
+
+    def complete(self, min_freq):
+        # Every n-gram reaching min_freq is among the candidates unless one with that many occurrences was dropped
+        return self.evicted_max < min_freq
+
+    def common_phrases(self, min_freq):
+        possible, _ = self.heavy_hitters(min_freq)
+        return {tuple(self.tokens_of_id[t] for t in gram[gram >= 0]): int(estimate)
+                for gram, estimate in zip(self.ids[possible], self.estimates[possible])}
+
+    def flag_reviews(self, tokenized_reviews, min_freq):
+        # Second pass: reviews containing a possible heavy hitter, and reviews containing a certain one
+        possible, certain = self.heavy_hitters(min_freq)
+        possible_hashes, certain_hashes = self.hashes[possible], self.hashes[certain]
+        flags_possible, flags_certain = [], []
+        for token_ids, lengths in encode_batches(tokenized_reviews, self.vocabulary, self.tokens_of_id, BATCH_TOKENS):
+            ids, reviews = review_ngram_ids(token_ids, lengths, self.min_length, self.max_n, return_reviews=True)
+            hashes = hash_ids(ids)
+            for flags, heavy in [(flags_possible, possible_hashes), (flags_certain, certain_hashes)]:
+                batch_flags = np.zeros(len(lengths), dtype=bool)
+                batch_flags[reviews[np.isin(hashes, heavy)]] = True
+                flags.append(batch_flags)
+        return np.concatenate(flags_possible), np.concatenate(flags_certain)
+
+def approximate_common_phrases(tokenized_reviews, min_length=3, min_freq=3, sketch_mb=SKETCH_MB, depth=DEPTH, top_k=TOP_K):
+    """Approximate phrases reaching min_freq, the review flags of both heavy hitter sets and the sketch they came from.
+
+    tokenized_reviews is read twice. The share of reviews with a common phrase lies between the certain and the possible
+    flags (each phrase with probability 1 - exp(-depth)), provided the sketch is complete for min_freq.
+    """
+    sketch = PhraseSketch(min_length, MAX_N, sketch_mb, depth, top_k)
+    sketch.add_reviews(tokenized_reviews)
+    flags_possible, flags_certain = sketch.flag_reviews(tokenized_reviews, min_freq)
+    return sketch.common_phrases(min_freq), flags_possible, flags_certain, sketch
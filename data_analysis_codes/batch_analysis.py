@@ -1,26 +1,53 @@
 import os
+import sys
 import subprocess
+from review_loader import WAREHOUSE_ENV
+
+# Run from the folder that holds <folder>_Collected_Reviews; the scripts are found next to this file
+CODE_DIR = os.path.dirname(os.path.abspath(__file__))
+ANALYSIS_SCRIPTS = [
+    'unique_review_analysis.py',
+    'isolation_forest.py',
+    'phrase_repetition_analysis.py',
+    'rating_trend_analysis.py',
+    'word_count_comparison.py',
+    'subdaily_burst_analysis.py',
+]
 
 def get_foldername():
     foldername = input('Enter the folder name containing the CSV files: ')
     return foldername
 
+def list_review_files(foldername, folder_path):
+    # Products in the review warehouse are analyzed even when their CSV file is not on this machine
+    filenames = [f for f in os.listdir(folder_path) if f.endswith('.csv')] if os.path.exists(folder_path) else []
+    warehouse_path = os.environ.get(WAREHOUSE_ENV)
+    if warehouse_path:
+        from review_warehouse import ReviewWarehouse
+        products = ReviewWarehouse(warehouse_path).products
+        products = products[products['active'] & (products['source'] == foldername)]
+        filenames += [f for f in products['filename'] if f not in filenames]
+    return filenames
+
+def run_script(script, *args):
+    subprocess.run([sys.executable, os.path.join(CODE_DIR, script), *args])
+
 def run_analysis_for_all_files(foldername):
     folder_path = os.path.join('.', foldername)
     folder_path = f'{folder_path}_Collected_Reviews'
+    filenames = list_review_files(foldername, folder_path)
     
-    if not os.path.exists(folder_path):
+    if not filenames and not os.path.exists(folder_path):
         print(f"The folder {folder_path} does not exist.")
         return
     
-    for filename in os.listdir(folder_path):
+    for filename in filenames:
         if filename.endswith('.csv'):
             print(f"Processing file: {filename}")
-            subprocess.run(['python', 'unique_review_analysis.py', filename, foldername])
-            subprocess.run(['python', 'isolation_forest.py', filename, foldername])
-            subprocess.run(['python', 'phrase_repetition_analysis.py', filename, foldername])
-            subprocess.run(['python', 'rating_trend_analysis.py', filename, foldername])
-            subprocess.run(['python', 'word_count_comparison.py', filename, foldername])
+            for script in ANALYSIS_SCRIPTS:
+                run_script(script, filename, foldername)
+    
+    run_script('dashboard.py', foldername)
 
 if __name__ == "__main__":
     foldername = get_foldername()
@@ -0,0 +1,561 @@
+import os
+import time
+import tracemalloc
+import shutil
+import argparse
+import numpy as np
+import pandas as pd
+from review_loader import load_reviews, count_words, compact_text, to_minute_offsets, parse_dates, WHITESPACE
+from text_cache import TextCache, normalize_reviews
+from significance import compare_many, N_RESAMPLES
+from duplicate_index import DuplicateIndex, check_product, duplicate_rates
+from review_warehouse import ReviewWarehouse, COLUMNS
+from subdaily_burst_analysis import bucket_counts
+from dashboard import build_dashboard
+from multiscale_burst_scan import scan, window_llr, WINDOWS
+from external_ngrams import count_common_ngrams
+from approximate_ngrams import approximate_common_phrases
+from sample_triage import triage
+from coordinated_campaigns import find_campaigns, shared_bursts, MIN_SHARED
+from duplicate_clusters import UnionFind, review_columns, cluster_reviews, cluster_tables
+from shard_analysis import sharded_phrase_flags, sharded_duplicated, sharded_phrase_postings
+from phrase_index import PhraseIndex, write_phrase_index, review_table, shared_phrases
+
+WORDS = ['배송', '빠르고', '좋아요', '향이', '너무', '좋네요', '재구매', '의사', '있어요', '가격', '대비', '만족', '합니다',
+         '선물용으로', '샀는데', '포장도', '꼼꼼하고', '생각보다', '작아요', '보통', '이에요', '별로', '예요', '추천', '해요']
+
+def make_synthetic_reviews(n_reviews, n_days=730, seed=0):
+    # Saladlab/Crema column layout with a few burst days, copy-pasted texts and repeated phrases
+    rng = np.random.default_rng(seed)
+    start = np.datetime64('2022-01-01')
+    days = rng.integers(0, n_days, n_reviews)
+    burst_days = rng.choice(n_days, size=max(1, n_days // 50), replace=False)
+    in_burst = rng.random(n_reviews) < 0.1
+    days[in_burst] = rng.choice(burst_days, size=in_burst.sum())
+    ratings = rng.choice([1, 2, 3, 4, 5], size=n_reviews, p=[0.03, 0.03, 0.09, 0.2, 0.65])
+    ratings[in_burst] = 5
+
+    lengths = rng.integers(3, 40, n_reviews)
+    word_ids = rng.integers(0, len(WORDS), lengths.sum())
+    offsets = np.concatenate([[0], np.cumsum(lengths)])
+    texts = [' '.join(WORDS[w] for w in word_ids[offsets[i]:offsets[i + 1]]) for i in range(n_reviews)]
+    copied = rng.random(n_reviews) < 0.05
+    for i in np.flatnonzero(copied):
+        texts[i] = texts[rng.integers(0, n_reviews)]
+
+    return pd.DataFrame({
+        'review_uid': np.arange(n_reviews) + 1000000,
+        'product_name': '테스트 상품',
+        'product_price': '29,000원',
+        'product_type': rng.choice(['N/A', '옵션: 50ml', '옵션: 100ml'], size=n_reviews),
+        'username_1': 'N/A',
+        'username_2': [f'user{u}***' for u in rng.integers(0, max(1, n_reviews // 3), n_reviews)],
+        'rating': ratings,
+        'review_content': texts,
+        'review_date': (start + days).astype(str),
+    })
+
+def write_synthetic_csv(path, n_reviews, seed=0):
+    if not os.path.exists(path):
+        make_synthetic_reviews(n_reviews, seed=seed).to_csv(path, index=False)
+    return path
+
+def timed(func, *args, repeat=3):
+    best = float('inf')
+    result = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = func(*args)
+        best = min(best, time.perf_counter() - start)
+    return best, result
+
+def daily_stats(df, date_column):
+    daily = df.groupby(date_column)['rating'].agg(['size', 'mean'])
+    duplicates = df.duplicated('review_content', keep=False).sum()
+    return len(daily), duplicates
+
+def load_default(path):
+    df = pd.read_csv(path)
+    df['review_date'] = pd.to_datetime(df['review_date'])
+    return df
+
+def bench_load_profile(path):
+    default_time, default_df = timed(load_default, path)
+    compact_time, compact_df = timed(load_reviews, path)
+    default_mb = default_df.memory_usage(deep=True).sum() / 1e6
+    compact_mb = compact_df.memory_usage(deep=True).sum() / 1e6
+    print(f"load: default {default_time:.3f}s, compact {compact_time:.3f}s")
+    print(f"memory: default {default_mb:.1f} MB, compact {compact_mb:.1f} MB ({default_mb / compact_mb:.1f}x smaller)")
+
+    default_stage, _ = timed(daily_stats, default_df, 'review_date')
+    compact_stage, _ = timed(daily_stats, compact_df, 'review_day')
+    print(f"daily stats + duplicates: default {default_stage:.3f}s, compact {compact_stage:.3f}s ({default_stage / compact_stage:.1f}x)")
+
+def bench_word_count(path):
+    assert WHITESPACE == ''.join(chr(c) for c in range(0x110000) if chr(c).isspace())
+    texts = load_reviews(path)['review_content']
+    split_time, split_counts = timed(lambda: texts.astype(object).str.split().str.len())
+    count_time, counts = timed(count_words, texts)
+    assert (split_counts.to_numpy() == counts.to_numpy()).all()
+    print(f"word count: split {split_time:.3f}s, vectorized {count_time:.3f}s ({split_time / count_time:.1f}x)")
+
+def bench_text_cache(path):
+    # A daily re-crawl: 98% of the reviews were processed by the previous run
+    texts = load_reviews(path)['review_content']
+    old = texts.iloc[:int(len(texts) * 0.98)]
+    new_reviews = texts.iloc[len(old):] + ' 새 리뷰'
+    recrawl = pd.concat([old, new_reviews])
+    cache_path = os.path.join(os.path.dirname(path), 'bench_text_cache.sqlite')
+    for suffix in ['', '-wal', '-shm']:
+        if os.path.exists(cache_path + suffix):
+            os.remove(cache_path + suffix)
+
+    full_time, full = timed(normalize_reviews, recrawl, None, True, repeat=1)
+    cache = TextCache(cache_path)
+    cold_time, _ = timed(normalize_reviews, old, cache, True, repeat=1)
+    # The previous run was a day ago
+    with cache.conn:
+        cache.conn.execute('UPDATE entries SET last_used = last_used - 86400')
+    warm_time, warm = timed(normalize_reviews, recrawl, cache, True, repeat=1)
+    cache.close()
+    assert (full['word_count'].to_numpy() == warm['word_count'].to_numpy()).all()
+    print(f"text processing: uncached {full_time:.2f}s, first cached run {cold_time:.2f}s, re-crawl with 98% cached {warm_time:.2f}s ({warm_time / full_time * 100:.1f}% of uncached)")
+
+def bench_significance(path, n_products=1000, n_metrics=4):
+    # Rating histograms for n_products x n_metrics comparisons, 10k permutation and bootstrap resamples each
+    rng = np.random.default_rng(0)
+    sizes = rng.integers(20, 5000, n_products * n_metrics)
+    p = [0.0, 0.03, 0.03, 0.09, 0.2, 0.65]
+    hist_a = rng.multinomial(sizes // 5, p)
+    hist_b = rng.multinomial(sizes - sizes // 5, p)
+    elapsed, results = timed(compare_many, hist_a, hist_b, repeat=1)
+    print(f"significance: {n_products} products x {n_metrics} metrics x {N_RESAMPLES} resamples in {elapsed:.1f}s "
+          f"on {os.cpu_count()} cores, {np.mean(results[:, 0] < 0.05) * 100:.1f}% of null comparisons at p < 0.05")
+
+def bench_duplicate_index(path, n_products=200):
+    # Index n_products copies of the synthetic product (each with its own review sample), then check one new product
+    df = load_reviews(path)
+    index_path = os.path.join(os.path.dirname(path), 'bench_duplicate_index')
+    for name in ['main.npy', 'delta.npy', 'products.csv', 'sources.txt']:
+        if os.path.exists(os.path.join(index_path, name)):
+            os.remove(os.path.join(index_path, name))
+    index = DuplicateIndex(index_path)
+    samples = [df.sample(n=min(len(df), 5000), random_state=i) for i in range(n_products + 1)]
+    start = time.perf_counter()
+    for i, sample in enumerate(samples[:-1]):
+        index.add_product('Synthetic', f'product{i}.csv', 0.0, sample)
+    index.save()
+    build_time = time.perf_counter() - start
+    rates_time, _ = timed(duplicate_rates, index, repeat=1)
+    check_time, result = timed(check_product, index, samples[-1])
+    print(f"duplicate index: {len(index.all_postings())} postings built in {build_time:.2f}s, "
+          f"all product rates in {rates_time:.2f}s, new product checked in {check_time * 1000:.1f} ms ({result})")
+
+def open_product(folder, product_id):
+    return ReviewWarehouse(folder).product_frame(product_id)
+
+def scan_catalog(warehouse):
+    # Rating histogram per day over every row, reading the day and rating columns once
+    days, ratings = np.asarray(warehouse.scan('day')), np.asarray(warehouse.scan('rating'))
+    valid = ratings >= 0
+    return np.bincount((days[valid] - days[valid].min()) * 8 + ratings[valid])
+
+def bench_warehouse(path):
+    # The synthetic product as one warehouse product, loaded back from the CSV and from the warehouse
+    warehouse_path = os.path.join(os.path.dirname(path), 'bench_review_warehouse')
+    for name in list(COLUMNS) + ['text_offsets', 'text', 'products', 'schema']:
+        for suffix in ['.bin', '.csv']:
+            if os.path.exists(os.path.join(warehouse_path, name + suffix)):
+                os.remove(os.path.join(warehouse_path, name + suffix))
+    if os.path.exists(os.path.join(warehouse_path, 'extra')):
+        shutil.rmtree(os.path.join(warehouse_path, 'extra'))
+    warehouse = ReviewWarehouse(warehouse_path)
+    build_time, _ = timed(warehouse.add_products, [('Synthetic', os.path.basename(path), 0.0, load_reviews(path, warehouse=False))], repeat=1)
+    csv_time, csv_df = timed(load_reviews, path)
+    open_time, df = timed(open_product, warehouse_path, 0)
+    pd.testing.assert_frame_equal(df, csv_df)
+    scan_time, _ = timed(scan_catalog, warehouse)
+    scanned_mb = warehouse.rows * (COLUMNS['day'].itemsize + COLUMNS['rating'].itemsize) / 1e6
+    print(f"warehouse: {warehouse.rows} rows added in {build_time:.2f}s; product load: CSV {csv_time:.3f}s, "
+          f"warehouse {open_time * 1000:.1f} ms ({csv_time / open_time:.0f}x); catalog scan {scanned_mb / scan_time:.0f} MB/s")
+
+def add_naver_pay_stamps(texts, n_days=730, seed=0):
+    # Registration times as Saladlab and Crema append them, spread over n_days
+    rng = np.random.default_rng(seed)
+    seconds = rng.integers(0, n_days * 86400, len(texts))
+    stamps = (np.datetime64('2022-01-01T00:00:00') + seconds.astype('timedelta64[s]')).astype(str)
+    return texts + pd.Series(np.char.add(np.char.add('(', np.char.replace(stamps, 'T', ' ')), ' 에 등록된 네이버 페이 구매평)'), index=texts.index)
+
+def resample_counts(texts):
+    # The pandas way: parse the timestamps out of the text, then resample a datetime-indexed series
+    stamps = pd.to_datetime(texts.str.extract(r'\((\d{4}-\d{2}-\d{2} \d{2}:\d{2}:\d{2}) 에 등록된')[0])
+    series = pd.Series(1, index=stamps.dropna())
+    return series.resample('h').sum(), series.resample('min').sum()
+
+def bucketed_counts(texts):
+    minutes = to_minute_offsets(texts).dropna().to_numpy(dtype=np.int64)
+    return bucket_counts(minutes, 60)[2], bucket_counts(minutes, 1)[2]
+
+def bench_subdaily(path):
+    texts = add_naver_pay_stamps(load_reviews(path)['review_content'].astype(object).fillna(''))
+    resample_time, (hourly, minutely) = timed(resample_counts, texts.astype(object))
+    bucket_time, (hour_counts, minute_counts) = timed(bucketed_counts, compact_text(texts))
+    assert (hourly.to_numpy() == hour_counts).all() and (minutely.to_numpy() == minute_counts).all()
+    print(f"sub-daily counts: extract + resample {resample_time:.2f}s ({(hourly.memory_usage() + minutely.memory_usage()) / 1e6:.1f} MB), "
+          f"vectorized extract + bincount {bucket_time:.2f}s ({(hour_counts.nbytes + minute_counts.nbytes) / 1e6:.1f} MB), "
+          f"{len(minute_counts)} minute buckets")
+
+def folder_size(folder):
+    return sum(os.path.getsize(os.path.join(root, name)) for root, _, files in os.walk(folder) for name in files)
+
+def bench_dashboard(path, n_products=300, n_days=3650):
+    # n_products analyzed products with ten years of daily counts each; the dashboard against one plotly HTML file per product
+    import plotly.graph_objects as go
+    rng = np.random.default_rng(0)
+    root = os.path.join(os.path.dirname(path), 'bench_dashboard')
+    os.makedirs(os.path.join(root, 'Synthetic_Collected_Reviews'), exist_ok=True)
+    cwd = os.getcwd()
+    os.chdir(root)
+    try:
+        for i in range(n_products):
+            counts = rng.poisson(rng.uniform(1, 20), n_days)
+            daily_reviews = pd.DataFrame({'review_day': np.arange(18000, 18000 + n_days), 'review_count': counts})
+            daily_reviews['rolling_mean'] = daily_reviews['review_count'].rolling(window=3).mean().fillna(0)
+            daily_reviews['anomaly'] = (counts > np.quantile(counts, 0.95)).astype(int)
+            os.makedirs(f'./results/product{i}', exist_ok=True)
+            open(f'./Synthetic_Collected_Reviews/product{i}.csv', 'w').close()
+            daily_reviews.to_csv(f'./results/product{i}/product{i}_daily_reviews.csv', index=False)
+        build_dashboard('Synthetic')
+        build_time, _ = timed(build_dashboard, 'Synthetic', repeat=1)
+        dashboard_mb = (folder_size('./results/Synthetic_dashboard') + folder_size('./results/dashboard_assets')) / 1e6
+        fig = go.Figure(go.Scatter(x=daily_reviews['review_day'], y=daily_reviews['review_count']))
+        html_time, _ = timed(fig.write_html, './results/product0/plot.html', repeat=1)
+        html_mb = os.path.getsize('./results/product0/plot.html') / 1e6
+    finally:
+        os.chdir(cwd)
+    print(f"dashboard: {n_products} products x {n_days} days built in {build_time:.2f}s, {dashboard_mb:.1f} MB in total; "
+          f"one plotly HTML per product would take {html_time * n_products:.1f}s and {html_mb * n_products:.0f} MB")
+
+def synthetic_catalog(n_products, n_days, seed=0):
+    # Review day and rating of every review of n_products products, each with its own daily rate
+    rng = np.random.default_rng(seed)
+    counts = rng.poisson(rng.uniform(0.2, 3, n_products)[:, None], (n_products, n_days))
+    product, day = np.nonzero(counts)
+    repeats = counts[product, day]
+    return np.repeat(product, repeats), np.repeat(day, repeats) + 18000, rng.choice(np.arange(1.0, 6.0), repeats.sum())
+
+def rolling_scan(product, day, n_products, windows):
+    # One product and window length at a time with pandas rolling sums (product must be sorted)
+    best = {}
+    bounds = np.searchsorted(product, np.arange(n_products + 1))
+    for p in range(n_products):
+        days = day[bounds[p]:bounds[p + 1]]
+        counts = pd.Series(np.bincount(days - days.min()).astype(np.float64))
+        for window in windows:
+            window_counts = counts.rolling(window).sum().dropna().to_numpy()
+            expected = counts.sum() / len(counts) * window
+            best[p, window] = window_llr(window_counts, expected, counts.sum()).max()
+    return best
+
+def bench_multiscale(path, n_products=1000, n_days=3650):
+    for products in [n_products // 2, n_products]:
+        product, day, rating = synthetic_catalog(products, n_days)
+        scan_time, (_, _, results) = timed(scan, product, day, rating, products, WINDOWS, repeat=1)
+        print(f"multi-window scan: {products} products x {n_days} days x {len(WINDOWS)} windows ({len(day)} reviews) in {scan_time:.2f}s "
+              f"({products * n_days / scan_time / 1e6:.1f}M product-days/s)")
+    sample = 100
+    loop_time, best = timed(rolling_scan, product, day, sample, WINDOWS, repeat=1)
+    assert all(np.isclose(best[p, w], results[w]['llr'][p]) for p in range(sample) for w in WINDOWS)
+    print(f"per-product rolling loop: {loop_time / sample * n_products:.2f}s for {n_products} products (timed on {sample})")
+
+def peak_memory(func, *args):
+    # Seconds and peak bytes allocated by func (numpy buffers included), not counting its inputs
+    tracemalloc.start()
+    start = time.perf_counter()
+    result = func(*args)
+    elapsed = time.perf_counter() - start
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return elapsed, peak, result
+
+def bench_external_ngrams(path, memory_mb=64, counter_reviews=50000):
+    # Whitespace tokens of the synthetic reviews; the Counter path only on a sample, as it needs memory per distinct n-gram
+    from phrase_repetition_analysis import find_common_phrases
+    tokens = load_reviews(path)['review_content'].astype(object).fillna('').str.split().tolist()
+    sample = tokens[:counter_reviews]
+    counter_time, counter_peak, expected = peak_memory(find_common_phrases, sample)
+    sample_time, sample_peak, result = peak_memory(count_common_ngrams, sample, 3, 3, 5, memory_mb)
+    assert result == expected
+    print(f"n-gram counting on {len(sample)} reviews: Counter {counter_time:.1f}s, peak {counter_peak / 1e6:.0f} MB; "
+          f"external {sample_time:.1f}s, peak {sample_peak / 1e6:.0f} MB ({len(result)} phrases, identical)")
+    full_time, full_peak, result = peak_memory(count_common_ngrams, tokens, 3, 3, 5, memory_mb)
+    print(f"external n-gram counting on all {len(tokens)} reviews with a {memory_mb} MB budget: {full_time:.1f}s, "
+          f"peak {full_peak / 1e6:.0f} MB, {len(result)} phrases")
+
+def bench_approximate_ngrams(path, counter_reviews=50000, min_freq=60, top_k=20000):
+    # Exact Counter path against the sketch at several sizes, on the same sample; the synthetic texts repeat random
+    # word sequences, so min_freq is set where only the most repeated few percent of the phrases reach it
+    from phrase_repetition_analysis import find_common_phrases, contains_common_phrase
+    tokens = load_reviews(path)['review_content'].astype(object).fillna('').str.split().tolist()[:counter_reviews]
+    start = time.perf_counter()
+    exact = find_common_phrases(tokens, min_freq=min_freq)
+    exact_share = np.mean([contains_common_phrase(review, exact) for review in tokens]) * 100
+    counter_time = time.perf_counter() - start
+    print(f"Counter on {len(tokens)} reviews: {counter_time:.1f}s ({len(tokens) / counter_time:.0f} reviews/s), "
+          f"{len(exact)} phrases, {exact_share:.2f}% of reviews")
+    for sketch_mb in [1, 4, 16]:
+        elapsed, peak, (common, flags, certain, sketch) = peak_memory(approximate_common_phrases, tokens, 3, min_freq, sketch_mb, 4, top_k)
+        found = len(set(common) & set(exact))
+        over = max([count - exact.get(phrase, 0) for phrase, count in common.items()] or [0])
+        print(f"sketch {sketch_mb:2d} MB: {elapsed:.1f}s ({len(tokens) / elapsed:.0f} reviews/s), peak {peak / 1e6:.0f} MB, "
+              f"recall {found / max(len(exact), 1):.3f}, precision {found / max(len(common), 1):.3f}, "
+              f"largest over-count {over} (bound {sketch.sketch.error_bound():.1f}), "
+              f"share {flags.mean() * 100:.2f}% in [{certain.mean() * 100:.2f}, {flags.mean() * 100 if sketch.complete(min_freq) else np.nan:.2f}]")
+
+def date_strings(n_dates, formats, seed=0):
+    # review_date text as the collectors write it, one new string object per review as read_csv returns them
+    rng = np.random.default_rng(seed)
+    days = rng.integers(18000, 20000, n_dates)
+    texts = np.empty(n_dates, dtype='U10')
+    for i, date_format in enumerate(formats):
+        rows = np.arange(i, n_dates, len(formats))
+        texts[rows] = pd.to_datetime(days[rows], unit='D').strftime(date_format).to_numpy(dtype='U10')
+    texts[rng.random(n_dates) < 0.001] = '작성일 없음'
+    return pd.Series(texts.astype(object)), days
+
+def inferred_day_offsets(dates):
+    # Parsing before the date formats: pd.to_datetime works out the format from the strings
+    parsed = pd.to_datetime(dates, errors='coerce')
+    return (parsed - pd.Timestamp('1970-01-01')).dt.days
+
+def bench_dates(path, n_dates=10000000):
+    sources = {'Coupang/Crema only': ['%Y.%m.%d'], 'Coupang + Alpha/Cafe24 mixed': ['%Y.%m.%d', '%Y-%m-%d']}
+    for name, formats in sources.items():
+        dates, days = date_strings(n_dates, formats)
+        infer_time, inferred = timed(inferred_day_offsets, dates, repeat=1)
+        fixed_time, (fixed, ok, report) = timed(parse_dates, dates, repeat=1)
+        valid = (dates != '작성일 없음').to_numpy()
+        assert (fixed[ok] == days[ok]).all() and (ok == valid).all()
+        print(f"{name}, {n_dates / 1e6:.0f}M dates: to_datetime inference {infer_time:.2f}s ({n_dates / infer_time / 1e6:.1f}M/s, "
+              f"{int(inferred.isna().sum())} not parsed); format-specific {fixed_time:.2f}s ({n_dates / fixed_time / 1e6:.1f}M/s, "
+              f"{report['failed']} not parsed, formats {report['formats']})")
+
+def bench_triage(path, repeats=10):
+    # Sampled estimates against the census (every review classified, the same numbers as the analyzers). The synthetic
+    # texts are random words, so with the default min_freq every review has a common phrase; it is set a little above the
+    # average count of a 3-gram instead, which leaves about half the reviews without one
+    df = load_reviews(path)
+    words = count_words(df['review_content'].astype(object).fillna('')).sum()
+    min_freq = int(1.05 * (words - 2 * len(df)) / len(WORDS) ** 3)
+    census_time, (census, _) = timed(triage, df, 0, 0.95, len(df), min_freq, repeat=1)
+    print(f"census of {len(df)} reviews (min_freq {min_freq}): {census_time:.1f}s")
+    covered = {name: 0 for name in census}
+    times, sizes = [], []
+    for seed in range(repeats):
+        elapsed, (estimates, sampled) = timed(triage, df, 1.0, 0.95, 2000, min_freq, seed, repeat=1)
+        times.append(elapsed)
+        sizes.append(sampled)
+        for name, (_, low, high) in estimates.items():
+            covered[name] += low <= census[name][0] <= high
+    print(f"samples of {min(sizes)}-{max(sizes)} reviews in {min(times):.1f}-{max(times):.1f}s")
+    for name, (value, low, high) in estimates.items():
+        print(f"{name:40s} census {census[name][0]:7.2f}, last sample {value:7.2f} [{low:.2f}, {high:.2f}], "
+              f"interval covered the census in {covered[name]}/{repeats} samples")
+
+def synthetic_campaign_catalog(n_products, n_days, n_groups=50, seed=0):
+    # Daily review counts of products on sale for part of the n_days each, plus n_groups planted campaigns: 3-20
+    # products (each in one campaign) active over the whole campaign that each get 10-30 extra reviews on the same 3-8 days within two months
+    rng = np.random.default_rng(seed)
+    start = rng.integers(0, n_days // 2, n_products)
+    end = np.minimum(start + rng.integers(n_days // 4, n_days // 2 + 1, n_products), n_days)
+    rate = rng.uniform(0.1, 3, n_products)
+    calendar = np.arange(n_days)
+    products, days, counts = [], [], []
+    for block in range(0, n_products, 1000):
+        rows = np.arange(block, min(block + 1000, n_products))
+        block_counts = rng.poisson(rate[rows, None], (len(rows), n_days))
+        block_counts[(calendar < start[rows, None]) | (calendar >= end[rows, None])] = 0
+        product, day = np.nonzero(block_counts)
+        products.append(product + block)
+        days.append(day)
+        counts.append(block_counts[product, day])
+    groups = []
+    used = np.zeros(n_products, dtype=bool)
+    for _ in range(n_groups):
+        campaign_days = rng.integers(0, n_days - 60) + np.sort(rng.choice(60, rng.integers(3, 9), replace=False))
+        active = np.flatnonzero((start <= campaign_days[0]) & (end > campaign_days[-1]) & ~used)
+        members = rng.choice(active, min(len(active), rng.integers(3, 21)), replace=False)
+        used[members] = True
+        products.append(np.repeat(members, len(campaign_days)))
+        days.append(np.tile(campaign_days, len(members)))
+        counts.append(rng.integers(10, 31, len(members) * len(campaign_days)))
+        groups.append(members)
+    return np.concatenate(products), np.concatenate(days) + 18000, np.concatenate(counts), groups
+
+def pairwise_shared(bursts, n_products, min_shared=MIN_SHARED):
+    # Shared burst days of every pair with Python sets, one pair at a time
+    days = [set(bursts.indices[bursts.indptr[p]:bursts.indptr[p + 1]]) for p in range(n_products)]
+    shared = {}
+    for a in range(n_products):
+        for b in range(a + 1, n_products):
+            common = len(days[a] & days[b])
+            if common >= min_shared:
+                shared[a, b] = common
+    return shared
+
+def bench_coordinated(path, n_days=1825, sample=2000):
+    for n_products in [10000, 40000]:
+        product, day, count, groups = synthetic_campaign_catalog(n_products, n_days)
+        elapsed, peak, (_, matrix, bursts, pairs, labels) = peak_memory(find_campaigns, product, day, count, n_products)
+        planted = np.zeros(n_products, dtype=bool)
+        planted[np.concatenate(groups)] = True
+        # A planted campaign is found when all its members end up in one group
+        found = sum(len(set(labels[members])) == 1 and labels[members[0]] >= 0 for members in groups)
+        print(f"{n_products} products x {n_days} days ({matrix.nnz} product-days): {elapsed:.1f}s, peak {peak / 1e6:.0f} MB; "
+              f"{found}/{len(groups)} planted campaigns found whole in {labels.max() + 1} groups, "
+              f"{(planted & (labels >= 0)).sum()}/{planted.sum()} planted products grouped, {(~planted & (labels >= 0)).sum()} others grouped")
+    loop_time, expected = timed(pairwise_shared, bursts, sample, repeat=1)
+    a, b, shared = shared_bursts(bursts[:sample])
+    assert expected == dict(zip(zip(a.tolist(), b.tolist()), shared.tolist()))
+    print(f"pairwise set loop: {loop_time * (n_products / sample) ** 2:.0f}s for {n_products} products (timed on {sample})")
+
+def synthetic_pairs(n_ids, n_pairs, seed=0):
+    # Pairs of ids drawn inside clusters of about 3 ids (shuffled over the id range), clusters picked by size
+    rng = np.random.default_rng(seed)
+    bounds = np.r_[0, np.flatnonzero(rng.random(n_ids - 1) < 0.3) + 1, n_ids]
+    sizes = np.diff(bounds)
+    members = rng.permutation(n_ids)
+    clusters = rng.choice(np.flatnonzero(sizes > 1), n_pairs, p=sizes[sizes > 1] / sizes[sizes > 1].sum())
+    offsets = (rng.random((2, n_pairs)) * sizes[clusters]).astype(np.int64)
+    return members[bounds[clusters] + offsets[0]], members[bounds[clusters] + offsets[1]]
+
+def python_union_find(n_ids, a, b):
+    # One pair at a time with a parent list and path halving
+    parent = list(range(n_ids))
+    def find(x):
+        while parent[x] != x:
+            parent[x] = parent[parent[x]]
+            x = parent[x]
+        return x
+    for x, y in zip(a.tolist(), b.tolist()):
+        x, y = find(x), find(y)
+        if x != y:
+            parent[max(x, y)] = min(x, y)
+    return [find(x) for x in range(n_ids)]
+
+def merge_pairs(n_ids, a, b):
+    clusters = UnionFind(n_ids)
+    clusters.union(a, b)
+    return clusters.roots()
+
+def same_partition(labels, other):
+    # Two labelings describe the same clusters when each label of one maps to exactly one label of the other
+    pairs = np.unique(np.stack([labels, other]), axis=1)
+    return len(pairs[0]) == len(np.unique(labels)) == len(np.unique(other))
+
+def bench_duplicate_clusters(path, n_ids=20000000, n_pairs=20000000, loop_pairs=1000000):
+    from scipy import sparse
+    from scipy.sparse.csgraph import connected_components
+    a, b = synthetic_pairs(n_ids, n_pairs)
+    elapsed, peak, roots = peak_memory(merge_pairs, n_ids, a, b)
+    print(f"union-find: {n_pairs} pairs over {n_ids} ids in {elapsed:.1f}s, peak {peak / 1e6:.0f} MB beyond the pairs, "
+          f"{len(np.unique(roots))} clusters")
+    graph_time, (_, labels) = timed(lambda: connected_components(sparse.coo_matrix((np.ones(n_pairs, dtype=np.int8), (a, b)), shape=(n_ids, n_ids)), directed=False), repeat=1)
+    assert same_partition(roots, labels)
+    print(f"scipy connected_components on the same pairs: {graph_time:.1f}s (same clusters)")
+    loop_time, expected = timed(python_union_find, n_ids // (n_pairs // loop_pairs), a[:loop_pairs] % (n_ids // (n_pairs // loop_pairs)),
+                                b[:loop_pairs] % (n_ids // (n_pairs // loop_pairs)), repeat=1)
+    print(f"pair-at-a-time Python loop: {loop_time * n_pairs / loop_pairs:.0f}s for {n_pairs} pairs (timed on {loop_pairs})")
+
+    df = load_reviews(path)
+    catalog = review_columns(df, 'Synthetic', 0)
+    elapsed, (clusters, reviews) = timed(lambda: cluster_tables([('synthetic', '')], catalog, cluster_reviews(catalog)), repeat=1)
+    print(f"{len(clusters)} clusters of {len(reviews)} out of {len(df)} synthetic reviews in {elapsed:.1f}s, largest {clusters['size'].max()}")
+
+def bench_sharded(path):
+    # The single-process phrase and duplicate flags against the map-reduce over review shards, on one worker, two
+    # workers and every core; the total time of several workers on one core shows the cost of moving the tables around
+    from phrase_repetition_analysis import find_common_phrases, contains_common_phrase
+    texts = load_reviews(path)['review_content'].astype(object).fillna('')
+    # Token ids, as the text cache gives them; lists of token strings would not fit in memory next to the Counter
+    vocabulary = {}
+    tokens = [[vocabulary.setdefault(word, len(vocabulary)) for word in review.split()] for review in texts]
+    start = time.perf_counter()
+    expected = find_common_phrases(tokens)
+    expected_flags = np.array([contains_common_phrase(review, expected) for review in tokens], dtype=bool)
+    phrase_time = time.perf_counter() - start
+    duplicate_time, expected_duplicates = timed(texts.duplicated, False, repeat=1)
+    print(f"single process on {len(tokens)} reviews: phrases {phrase_time:.1f}s ({len(expected)} common), duplicates {duplicate_time:.1f}s")
+    for workers in sorted({1, 2, os.cpu_count()}):
+        start = time.perf_counter()
+        phrases, flags = sharded_phrase_flags(tokens, workers=workers, return_phrases=True)
+        phrase_time = time.perf_counter() - start
+        duplicate_time, duplicates = timed(sharded_duplicated, texts, workers, repeat=1)
+        assert phrases == expected and np.array_equal(flags, expected_flags) and duplicates.equals(expected_duplicates)
+        print(f"map-reduce with {workers} workers on {os.cpu_count()} cores: phrases {phrase_time:.1f}s, duplicates {duplicate_time:.1f}s (identical)")
+
+def bench_phrase_index(path, other_reviews=200000):
+    # Build the phrase index of the synthetic product and of its first reviews as a second product, then time the
+    # queries against a scan of every review for the most frequent phrase
+    df = load_reviews(path)
+    texts = df['review_content'].astype(object).fillna('')
+    vocabulary = {}
+    tokens = [[vocabulary.setdefault(word, len(vocabulary)) for word in review.split()] for review in texts]
+    words = list(vocabulary)
+    folders = [os.path.join(os.path.dirname(path), f'phrase_index_{name}') for name in ['all', 'first']]
+    for folder, n_reviews in zip(folders, [len(df), other_reviews]):
+        start = time.perf_counter()
+        phrases, counts, starts, postings = sharded_phrase_postings(tokens[:n_reviews])
+        write_phrase_index(folder, [' '.join(words[t] for t in phrase) for phrase in phrases], counts, starts, postings,
+                           review_table(df.iloc[:n_reviews]), {'reviews': n_reviews, 'avg_rating': float(df['rating'][:n_reviews].astype('float64').mean())})
+        size = sum(os.path.getsize(os.path.join(folder, f)) for f in os.listdir(folder))
+        print(f"index of {n_reviews} reviews: {len(phrases)} phrases, {len(postings)} postings, {size / 1e6:.0f} MB, built in {time.perf_counter() - start:.1f}s")
+    index, other = PhraseIndex(folders[0]), PhraseIndex(folders[1])
+    open_time, _ = timed(PhraseIndex, folders[0])
+    top_time, top = timed(index.top, 20, 'freq')
+    skew_time, _ = timed(index.top, 20, 'skew')
+    phrase = top['phrase'].iloc[0]
+    reviews_time, reviews = timed(index.reviews_with, phrase)
+    shared_time, shared = timed(shared_phrases, index, other, repeat=1)
+    target = tuple(vocabulary[word] for word in phrase.split())
+    start = time.perf_counter()
+    scanned = [i for i, review in enumerate(tokens) if any(tuple(review[j:j + len(target)]) == target for j in range(len(review) - len(target) + 1))]
+    scan_time = time.perf_counter() - start
+    assert reviews['review_row'].tolist() == scanned
+    print(f"open {open_time * 1000:.1f} ms, top by freq {top_time * 1000:.1f} ms, top by skew {skew_time * 1000:.1f} ms, "
+          f"{len(reviews)} reviews of '{phrase}' {reviews_time * 1000:.1f} ms (scan of every review: {scan_time:.1f}s, same reviews), "
+          f"{len(shared)} shared phrases {shared_time:.1f}s")
+
+BENCHMARKS = {
+    'load_profile': bench_load_profile,
+    'word_count': bench_word_count,
+    'text_cache': bench_text_cache,
+    'significance': bench_significance,
+    'duplicate_index': bench_duplicate_index,
+    'warehouse': bench_warehouse,
+    'subdaily': bench_subdaily,
+    'dashboard': bench_dashboard,
+    'multiscale': bench_multiscale,
+    'external_ngrams': bench_external_ngrams,
+    'approximate_ngrams': bench_approximate_ngrams,
+    'dates': bench_dates,
+    'triage': bench_triage,
+    'coordinated': bench_coordinated,
+    'duplicate_clusters': bench_duplicate_clusters,
+    'sharded': bench_sharded,
+    'phrase_index': bench_phrase_index,
+}
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark analysis stages on synthetic review data.')
+    parser.add_argument('benchmark', choices=sorted(BENCHMARKS), help='The benchmark to run')
+    parser.add_argument('--reviews', type=int, default=1000000, help='Number of synthetic reviews')
+    parser.add_argument('--data', type=str, default='./benchmark_data', help='Folder for the generated benchmark data')
+    args = parser.parse_args()
+
+    os.makedirs(args.data, exist_ok=True)
+    path = write_synthetic_csv(os.path.join(args.data, f'synthetic_{args.reviews}.csv'), args.reviews)
+    BENCHMARKS[args.benchmark](path)
+
+if __name__ == "__main__":
+    main()
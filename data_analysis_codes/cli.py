@@ -0,0 +1,114 @@
+import os
+import sys
+import time
+import argparse
+import importlib
+import statistics
+import subprocess
+
+# One command for the collection and analysis scripts. Only argparse is imported up front; each subcommand imports
+# its own script when it runs, so --help and the folder-level commands do not load sklearn, statsmodels or nltk.
+# Link this file onto the PATH (ex. ln -s $PWD/cli.py ~/bin/fake-reviews) to run it from any folder.
+
+CODE_DIR = os.path.dirname(os.path.realpath(__file__))
+COLLECTION_DIR = os.path.join(os.path.dirname(CODE_DIR), 'data_collection_codes')
+ANALYZERS = {
+    'unique': 'unique_review_analysis',
+    'anomalies': 'isolation_forest',
+    'phrases': 'phrase_repetition_analysis',
+    'rating-trend': 'rating_trend_analysis',
+    'word-count': 'word_count_comparison',
+    'subdaily': 'subdaily_burst_analysis',
+    'triage': 'sample_triage',
+    'dashboard': 'dashboard',
+}
+COLLECTORS = {
+    'coupang-users': 'coupang_user_crawler',
+    'reviews': 'crawl_scheduler',
+    'stream': 'collection_pipeline',
+}
+# Commands that should start quickly; the folder-level ones run on a folder that does not exist, so they stop after imports
+STARTUP_COMMANDS = [
+    ['--help'],
+    ['analyze', '--help'],
+    ['batch', '--help'],
+    ['combine', '--results', 'no_such_folder'],
+    ['fix-headers', '--folder', 'no_such_folder'],
+]
+
+def get_parser():
+    parser = argparse.ArgumentParser(prog='fake-reviews', description='Collect and analyze product reviews.')
+    parser.add_argument('--root', type=str, default='.', help='Folder that holds <folder>_Collected_Reviews and results (default: current folder)')
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    collect = subparsers.add_parser('collect', help='Run a collector with the arguments that follow (see collect <collector> --help)')
+    collect.add_argument('collector', choices=sorted(COLLECTORS), help='The collector to run')
+    collect.add_argument('collector_args', nargs=argparse.REMAINDER, help='Arguments of the collector')
+
+    analyze = subparsers.add_parser('analyze', help='Run one analyzer; other flags (ex. --plots, --text-cache) are passed on to it')
+    analyze.add_argument('analyzer', choices=sorted(ANALYZERS), help='The analyzer to run')
+    analyze.add_argument('filename', type=str, nargs='?', help='The CSV file (with extension) in <folder>_Collected_Reviews, not used by dashboard')
+    analyze.add_argument('--folder', type=str, required=True, help='The name of the source folder, ex. Coupang')
+
+    batch = subparsers.add_parser('batch', help='Run every analyzer on every product of a folder, then build its dashboard')
+    batch.add_argument('--folder', type=str, required=True, help='The name of the source folder, ex. Coupang')
+
+    combine = subparsers.add_parser('combine', help='Combine the per-product result tables into combined_*.csv')
+    combine.add_argument('--results', type=str, default='results', help='The folder with one subfolder per product')
+
+    fix_headers = subparsers.add_parser('fix-headers', help='Add the column names to review CSV files collected without them')
+    fix_headers.add_argument('--folder', type=str, required=True, help='The folder of the CSV files, ex. Coupang_Collected_Reviews')
+
+    startup = subparsers.add_parser('startup-time', help='Measure how long --help and the lightweight subcommands take to start')
+    startup.add_argument('--repeat', type=int, default=5, help='Runs per command, the median is reported')
+    return parser
+
+def run_script_main(module_name, argv, code_dir=CODE_DIR):
+    # The scripts read their own arguments from sys.argv, as when they are run directly
+    sys.path.insert(0, code_dir)
+    sys.argv = [os.path.join(code_dir, module_name + '.py')] + argv
+    importlib.import_module(module_name).main()
+
+def startup_time(repeat):
+    commands = [[sys.executable, os.path.realpath(__file__)] + command for command in STARTUP_COMMANDS]
+    # For comparison, the help of a script that imports its whole stack at module level
+    commands.append([sys.executable, os.path.join(CODE_DIR, 'isolation_forest.py'), '--help'])
+    for command in commands:
+        times = []
+        for _ in range(repeat):
+            start = time.perf_counter()
+            subprocess.run(command, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL, check=True)
+            times.append(time.perf_counter() - start)
+        print(f"{' '.join(os.path.basename(part) for part in command[1:]):45s} {statistics.median(times) * 1000:7.0f} ms")
+
+def main(argv=None):
+    parser = get_parser()
+    args, extra = parser.parse_known_args(argv)
+    if extra and args.command != 'analyze':
+        parser.error(f"unrecognized arguments: {' '.join(extra)}")
+    os.chdir(args.root)
+    sys.path.insert(0, CODE_DIR)
+
+    if args.command == 'collect':
+        run_script_main(COLLECTORS[args.collector], args.collector_args, COLLECTION_DIR)
+    elif args.command == 'analyze':
+        if args.analyzer == 'dashboard':
+            run_script_main(ANALYZERS[args.analyzer], [args.folder] + extra)
+        elif args.filename is None:
+            parser.error(f"analyze {args.analyzer} needs a filename")
+        else:
+            run_script_main(ANALYZERS[args.analyzer], [args.filename, args.folder] + extra)
+    elif args.command == 'batch':
+        from batch_analysis import run_analysis_for_all_files
+        run_analysis_for_all_files(args.folder)
+    elif args.command == 'combine':
+        from combine_csv import combine_csv_files
+        combine_csv_files(args.results)
+    elif args.command == 'fix-headers':
+        from header_adder import add_headers_to_csv_files
+        add_headers_to_csv_files(args.folder)
+    else:
+        startup_time(args.repeat)
+
+if __name__ == "__main__":
+    main()
@@ -1,6 +1,10 @@
 import os
 import pandas as pd
 
+# The <company>_<name>.csv files of a product folder; folders without any (dashboard_assets, <folder>_dashboard) are skipped
+RESULT_FILES = ['Anomalies', 'phrase_repetition', 'rating_trend', 'unique_nonunique', 'reviewer_activity',
+                'duplicate_index', 'subdaily_bursts', 'multiscale_bursts', 'triage']
+
 def get_main_foldername():
     foldername = input('Enter the main folder name containing company folders: ')
     return foldername
@@ -12,6 +16,11 @@ def combine_csv_files(main_foldername):
     combined_phrase_repetition = []
     combined_rating_trend = []
     combined_unique_nonunique = []
+    combined_reviewer_activity = []
+    combined_duplicate_index = []
+    combined_subdaily_bursts = []
+    combined_multiscale_bursts = []
+    combined_triage = []
     
     if not os.path.exists(main_folder_path):
         print(f"The folder {main_folder_path} does not exist.")
@@ -20,6 +29,8 @@ def combine_csv_files(main_foldername):
     for company_folder in os.listdir(main_folder_path):
         company_folder_path = os.path.join(main_folder_path, company_folder)
         if os.path.isdir(company_folder_path):
+            if not any(os.path.exists(os.path.join(company_folder_path, f"{company_folder}_{name}.csv")) for name in RESULT_FILES):
+                continue
             print(f"Processing folder: {company_folder}")
             try:
                 anomalies_file = os.path.join(company_folder_path, f"{company_folder}_Anomalies.csv")
@@ -41,6 +52,31 @@ def combine_csv_files(main_foldername):
                 if os.path.exists(unique_nonunique_file):
                     unique_nonunique_df = pd.read_csv(unique_nonunique_file)
                     combined_unique_nonunique.append(unique_nonunique_df)
+                
+                reviewer_activity_file = os.path.join(company_folder_path, f"{company_folder}_reviewer_activity.csv")
+                if os.path.exists(reviewer_activity_file):
+                    reviewer_activity_df = pd.read_csv(reviewer_activity_file)
+                    combined_reviewer_activity.append(reviewer_activity_df)
+                
+                duplicate_index_file = os.path.join(company_folder_path, f"{company_folder}_duplicate_index.csv")
+                if os.path.exists(duplicate_index_file):
+                    duplicate_index_df = pd.read_csv(duplicate_index_file)
+                    combined_duplicate_index.append(duplicate_index_df)
+                
+                subdaily_bursts_file = os.path.join(company_folder_path, f"{company_folder}_subdaily_bursts.csv")
+                if os.path.exists(subdaily_bursts_file):
+                    subdaily_bursts_df = pd.read_csv(subdaily_bursts_file)
+                    combined_subdaily_bursts.append(subdaily_bursts_df)
+                
+                multiscale_bursts_file = os.path.join(company_folder_path, f"{company_folder}_multiscale_bursts.csv")
+                if os.path.exists(multiscale_bursts_file):
+                    multiscale_bursts_df = pd.read_csv(multiscale_bursts_file)
+                    combined_multiscale_bursts.append(multiscale_bursts_df)
+                
+                triage_file = os.path.join(company_folder_path, f"{company_folder}_triage.csv")
+                if os.path.exists(triage_file):
+                    triage_df = pd.read_csv(triage_file)
+                    combined_triage.append(triage_df)
             except Exception as e:
                 print(f"Failed to process files in {company_folder}: {e}")
     
@@ -59,6 +95,26 @@ def combine_csv_files(main_foldername):
     if combined_unique_nonunique:
         combined_unique_nonunique_df = pd.concat(combined_unique_nonunique, ignore_index=True)
         combined_unique_nonunique_df.to_csv(os.path.join(main_folder_path, 'combined_unique_nonunique.csv'), index=False)
+    
+    if combined_reviewer_activity:
+        combined_reviewer_activity_df = pd.concat(combined_reviewer_activity, ignore_index=True)
+        combined_reviewer_activity_df.to_csv(os.path.join(main_folder_path, 'combined_reviewer_activity.csv'), index=False)
+    
+    if combined_duplicate_index:
+        combined_duplicate_index_df = pd.concat(combined_duplicate_index, ignore_index=True)
+        combined_duplicate_index_df.to_csv(os.path.join(main_folder_path, 'combined_duplicate_index.csv'), index=False)
+    
+    if combined_subdaily_bursts:
+        combined_subdaily_bursts_df = pd.concat(combined_subdaily_bursts, ignore_index=True)
+        combined_subdaily_bursts_df.to_csv(os.path.join(main_folder_path, 'combined_subdaily_bursts.csv'), index=False)
+    
+    if combined_multiscale_bursts:
+        combined_multiscale_bursts_df = pd.concat(combined_multiscale_bursts, ignore_index=True)
+        combined_multiscale_bursts_df.to_csv(os.path.join(main_folder_path, 'combined_multiscale_bursts.csv'), index=False)
+    
+    if combined_triage:
+        combined_triage_df = pd.concat(combined_triage, ignore_index=True)
+        combined_triage_df.to_csv(os.path.join(main_folder_path, 'combined_triage.csv'), index=False)
 
 if __name__ == "__main__":
     main_foldername = get_main_foldername()
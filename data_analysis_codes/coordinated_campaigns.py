@@ -0,0 +1,223 @@
+import os
+import time
+import argparse
+import numpy as np
+import pandas as pd
+from scipy import sparse
+from scipy.sparse.csgraph import connected_components
+from scipy.stats import poisson, hypergeom
+from review_loader import load_reviews, day_to_timestamp
+from batch_analysis import list_review_files
+
+# Products whose burst days coincide more often than chance, across every collected product at once.
+# Daily review counts are a sparse product x day matrix; a day is a burst when its count is improbably high for the
+# product's own average rate. Shared burst days of every pair come from one sparse product (bursts @ bursts.T), in
+# blocks of products, and each pair is compared with a hypergeometric draw of its burst days over the days both
+# products were on sale. Pairs that pass the false discovery rate are linked into groups.
+
+BURST_ALPHA = 0.001
+MIN_BURST_REVIEWS = 3
+MIN_SHARED = 2
+FDR = 0.05
+BLOCK_PRODUCTS = 4096
+TOP_DATES = 10
+GROUP_COLUMNS = ['group_id', 'n_products', 'company_names', 'product_names', 'significant_pairs', 'min_q_value', 'shared_burst_days',
+                 'first_shared_date', 'last_shared_date', 'shared_day_reviews', 'top_dates']
+
+def get_args():
+    parser = argparse.ArgumentParser(description='Find groups of products whose review bursts fall on the same days.')
+    parser.add_argument('foldernames', type=str, nargs='+', help='The names of the folders, ex. Coupang Saladlab Crema')
+    parser.add_argument('--alpha', type=float, default=BURST_ALPHA, help="Chance of a day this busy at the product's average rate for it to count as a burst")
+    parser.add_argument('--min-reviews', type=int, default=MIN_BURST_REVIEWS, help='Fewest reviews on a burst day')
+    parser.add_argument('--min-shared', type=int, default=MIN_SHARED, help='Fewest shared burst days for a pair to be tested')
+    parser.add_argument('--fdr', type=float, default=FDR, help='False discovery rate of the reported pairs')
+    return parser.parse_args()
+
+def create_folder(folder_path):
+    if not os.path.exists(folder_path):
+        os.makedirs(folder_path)
+
+def load_daily_counts(foldernames):
+    # (product, day, review count) of every product's dated reviews; only the counts are kept in memory
+    names, products, days, counts = [], [], [], []
+    for foldername in foldernames:
+        folder_path = f'./{foldername}_Collected_Reviews'
+        for filename in sorted(list_review_files(foldername, folder_path)):
+            df = load_reviews(os.path.join(folder_path, filename))
+            df = df.dropna(subset=['review_day'])
+            if df.empty:
+                continue
+            day, count = np.unique(df['review_day'].to_numpy(dtype=np.int64), return_counts=True)
+            products.append(np.full(len(day), len(names), dtype=np.int64))
+            names.append((filename.split('.')[0], df['product_name'].iloc[0]))
+            days.append(day)
+            counts.append(count)
+    if not names:
+        return names, np.empty(0, dtype=np.int64), np.empty(0, dtype=np.int64), np.empty(0, dtype=np.int64)
+    return names, np.concatenate(products), np.concatenate(days), np.concatenate(counts)
+
+def daily_matrix(product, day, count, n_products):
+    first_day = int(day.min())
+    n_days = int(day.max()) - first_day + 1
+    matrix = sparse.csr_matrix((count.astype(np.int32), (product, day - first_day)), shape=(n_products, n_days))
+    matrix.sum_duplicates()
+    return first_day, matrix
+
+def active_spans(matrix):
+    # First and last day with reviews of each product (column indices are sorted within every row)
+    first = matrix.indices[matrix.indptr[:-1]]
+    last = matrix.indices[matrix.indptr[1:] - 1]
+    return first.astype(np.int64), last.astype(np.int64)
+
+def burst_matrix(matrix, alpha=BURST_ALPHA, min_reviews=MIN_BURST_REVIEWS):
+    # Days whose count exceeds the Poisson 1 - alpha quantile at the product's average rate over its active span
+    first, last = active_spans(matrix)
+    rate = np.asarray(matrix.sum(axis=1)).ravel() / (last - first + 1)
+    threshold = np.maximum(poisson.isf(alpha, rate), min_reviews - 1)
+    rows = np.repeat(np.arange(matrix.shape[0]), np.diff(matrix.indptr))
+    burst = matrix.data > threshold[rows]
+    return sparse.csr_matrix((np.ones(burst.sum(), dtype=np.int32), (rows[burst], matrix.indices[burst])), shape=matrix.shape)
+
+def shared_bursts(bursts, min_shared=MIN_SHARED, block=BLOCK_PRODUCTS):
+    # Shared burst days of every pair a < b with at least min_shared of them; a block of rows at a time keeps only
+    # that block's co-occurrence counts in memory
+    bursts_t = bursts.T.tocsr()
+    pairs_a, pairs_b, shared = [np.empty(0, dtype=np.int64)], [np.empty(0, dtype=np.int64)], [np.empty(0, dtype=np.int64)]
+    for start in range(0, bursts.shape[0], block):
+        counts = (bursts[start:start + block] @ bursts_t).tocoo()
+        a = counts.row.astype(np.int64) + start
+        keep = (counts.col > a) & (counts.data >= min_shared)
+        pairs_a.append(a[keep])
+        pairs_b.append(counts.col[keep].astype(np.int64))
+        shared.append(counts.data[keep].astype(np.int64))
+    return np.concatenate(pairs_a), np.concatenate(pairs_b), np.concatenate(shared)
+
+def bursts_between(bursts, rows, low, high):
+    # Burst days of each row within [low, high], by binary search over the sorted (row, day) cells
+    n_days = bursts.shape[1]
+    cells = np.repeat(np.arange(bursts.shape[0], dtype=np.int64), np.diff(bursts.indptr)) * n_days + bursts.indices
+    return np.searchsorted(cells, rows * n_days + high, side='right') - np.searchsorted(cells, rows * n_days + low, side='left')
+
+def overlapping_pairs(first, last):
+    # Pairs of products on sale on at least one common day: for each one, the spans starting before its end minus
+    # those ending before its start, itself excluded
+    overlapping = np.searchsorted(np.sort(first), last, side='right') - np.searchsorted(np.sort(last), first, side='left')
+    return int((overlapping.sum() - len(first)) // 2)
+
+def q_values(p_values, n_tests):
+    # Benjamini-Hochberg over n_tests; pairs not listed have fewer shared bursts and are counted as untested ranks
+    order = np.argsort(p_values)
+    ranked = p_values[order] * n_tests / np.arange(1, len(p_values) + 1)
+    q = np.empty_like(p_values)
+    q[order] = np.minimum(np.minimum.accumulate(ranked[::-1])[::-1], 1)
+    return q
+
+def find_campaigns(product, day, count, n_products, alpha=BURST_ALPHA, min_reviews=MIN_BURST_REVIEWS, min_shared=MIN_SHARED, fdr=FDR):
+    """Burst matrix, tested pairs and group label of every product (-1 outside any group)."""
+    first_day, matrix = daily_matrix(product, day, count, n_products)
+    first, last = active_spans(matrix)
+    bursts = burst_matrix(matrix, alpha, min_reviews)
+    # Only products with a burst day take part in the pair counts
+    bursting = np.flatnonzero(np.diff(bursts.indptr))
+    active = bursts[bursting]
+    a, b, shared = shared_bursts(active, min_shared)
+    a, b = bursting[a], bursting[b]
+
+    low, high = np.maximum(first[a], first[b]), np.minimum(last[a], last[b])
+    overlap = high - low + 1
+    bursts_a, bursts_b = bursts_between(bursts, a, low, high), bursts_between(bursts, b, low, high)
+    p_values = hypergeom.sf(shared - 1, overlap, bursts_a, bursts_b)
+    n_tests = overlapping_pairs(first[bursting], last[bursting])
+    pairs = pd.DataFrame({
+        'product_a': a, 'product_b': b, 'shared_burst_days': shared,
+        'burst_days_a': bursts_a, 'burst_days_b': bursts_b, 'overlap_days': overlap,
+        'expected_shared': bursts_a * bursts_b / overlap, 'p_value': p_values,
+        'q_value': q_values(p_values, max(n_tests, len(p_values))),
+    })
+    pairs = pairs[pairs['q_value'] <= fdr].reset_index(drop=True)
+
+    graph = sparse.csr_matrix((np.ones(len(pairs)), (pairs['product_a'], pairs['product_b'])), shape=(n_products, n_products))
+    _, labels = connected_components(graph, directed=False)
+    # Products without a significant pair are their own component; only components of two or more are groups
+    sizes = np.bincount(labels)
+    labels = np.where(sizes[labels] > 1, labels, -1)
+    labels[labels >= 0] = np.unique(labels[labels >= 0], return_inverse=True)[1]
+    pairs['group_id'] = labels[pairs['product_a']]
+    print(f"{n_products} products, {matrix.shape[1]} days: {len(bursting)} with burst days ({bursts.nnz} in all), "
+          f"{len(p_values)} pairs tested out of {n_tests}, {len(pairs)} significant, {labels.max() + 1} groups")
+    return first_day, matrix, bursts, pairs, labels
+
+def group_table(names, first_day, matrix, bursts, pairs, labels):
+    grouped = np.flatnonzero(labels >= 0)
+    n_groups = int(labels.max()) + 1
+    if n_groups == 0:
+        return pd.DataFrame(columns=GROUP_COLUMNS)
+    # Members bursting and member reviews on each day of each group, from one group x product indicator matrix
+    members = sparse.csr_matrix((np.ones(len(grouped), dtype=np.int32), (labels[grouped], grouped)), shape=(n_groups, len(names)))
+    members_bursting = (members @ bursts).tocsr()
+    members_bursting.sort_indices()
+    reviews = (members @ bursts.multiply(matrix)).tocsr()
+    pair_groups = pairs.groupby('group_id')
+
+    rows = []
+    for group in range(n_groups):
+        products = np.flatnonzero(labels == group)
+        start, end = members_bursting.indptr[group], members_bursting.indptr[group + 1]
+        days, bursting = members_bursting.indices[start:end], members_bursting.data[start:end]
+        shared = bursting >= 2
+        days, bursting = days[shared], bursting[shared]
+        day_reviews = reviews[group, days].toarray().ravel() if len(days) else np.empty(0)
+        top = np.argsort(-bursting, kind='stable')[:TOP_DATES]
+        dates = day_to_timestamp(days + first_day).date
+        group_pairs = pair_groups.get_group(group)
+        rows.append({
+            'group_id': group,
+            'n_products': len(products),
+            'company_names': '; '.join(names[p][0] for p in products),
+            'product_names': '; '.join(str(names[p][1]) for p in products),
+            'significant_pairs': len(group_pairs),
+            'min_q_value': group_pairs['q_value'].min(),
+            'shared_burst_days': len(days),
+            'first_shared_date': dates.min() if len(days) else None,
+            'last_shared_date': dates.max() if len(days) else None,
+            'shared_day_reviews': int(day_reviews.sum()),
+            'top_dates': '; '.join(f"{dates[i]} ({bursting[i]})" for i in sorted(top)),
+        })
+    return pd.DataFrame(rows).sort_values(['n_products', 'min_q_value'], ascending=[False, True], kind='stable')
+
+def pair_table(names, pairs):
+    table = pd.DataFrame({
+        'group_id': pairs['group_id'],
+        'company_name_a': [names[p][0] for p in pairs['product_a']],
+        'product_name_a': [names[p][1] for p in pairs['product_a']],
+        'company_name_b': [names[p][0] for p in pairs['product_b']],
+        'product_name_b': [names[p][1] for p in pairs['product_b']],
+    })
+    for col in ['shared_burst_days', 'burst_days_a', 'burst_days_b', 'overlap_days']:
+        table[col] = pairs[col]
+    table['expected_shared'] = pairs['expected_shared'].round(2)
+    table['p_value'] = pairs['p_value']
+    table['q_value'] = pairs['q_value']
+    return table.sort_values(['group_id', 'q_value'], kind='stable')
+
+def main():
+    args = get_args()
+    names, product, day, count = load_daily_counts(args.foldernames)
+    if not names:
+        print("No dated reviews found")
+        return
+    start = time.perf_counter()
+    first_day, matrix, bursts, pairs, labels = find_campaigns(product, day, count, len(names), args.alpha, args.min_reviews, args.min_shared, args.fdr)
+    print(f"Compared the burst days of {len(names)} products in {time.perf_counter() - start:.2f}s")
+
+    folder_path = './results'
+    create_folder(folder_path)
+    prefix = '_'.join(args.foldernames)
+    for table, suffix in [(group_table(names, first_day, matrix, bursts, pairs, labels), 'coordinated_campaigns'),
+                          (pair_table(names, pairs), 'coordinated_campaign_pairs')]:
+        output_path = os.path.join(folder_path, f"{prefix}_{suffix}.csv")
+        table.to_csv(output_path, index=False)
+        print(f"CSV file saved to {output_path}")
+
+if __name__ == "__main__":
+    main()
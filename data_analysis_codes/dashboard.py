@@ -0,0 +1,280 @@
+import os
+import json
+import time
+import argparse
+import numpy as np
+import pandas as pd
+import plotly
+from plotly.offline import get_plotlyjs
+from batch_analysis import list_review_files
+from word_count_comparison import LABELS, load_baseline, to_percentages
+
+# One dashboard page for all analyzed products of a folder, built from the CSV results: a sortable product table and,
+# for the selected product, its daily review counts with anomalies and the Poisson threshold, rating distributions and
+# word count comparison. Daily series longer than --max-points are downsampled with LTTB, each product's data is a small
+# script loaded only when the product is opened, and plotly.js is stored once in results/dashboard_assets.
+
+# Result tables of the analyzers (one row per product) shown in the dashboard
+SUMMARY_TABLES = ['Anomalies', 'rating_trend', 'phrase_repetition', 'unique_nonunique', 'reviewer_activity', 'duplicate_index']
+# Columns of the product table; every other column is shown when a product is opened
+TABLE_COLUMNS = [
+    'percentage_anomalies',
+    'high_volume_review_percentage',
+    'percentage_of_review_w_common_phrases',
+    'percentage_non_unique',
+    'active_reviewer_review_percentage',
+    'cross_product_duplicate_percentage',
+]
+MAX_POINTS = 1000
+
+def get_args():
+    parser = argparse.ArgumentParser(description='Build one interactive dashboard for all analyzed products of a folder.')
+    parser.add_argument('foldername', type=str, help='The name of the folder, ex. Coupang')
+    parser.add_argument('--max-points', type=int, default=MAX_POINTS, help='Daily series longer than this are downsampled with LTTB')
+    return parser.parse_args()
+
+def create_folder(folder_path):
+    if not os.path.exists(folder_path):
+        os.makedirs(folder_path)
+
+def lttb(x, y, n_out):
+    # Largest-Triangle-Three-Buckets: indices of n_out points (first and last included) that keep the visual shape of y.
+    # Each bucket keeps the point forming the largest triangle with the previous kept point and the next bucket's mean.
+    n = len(x)
+    if n_out >= n or n_out < 3:
+        return np.arange(n)
+    edges = np.linspace(1, n - 1, n_out - 1).astype(np.int64)
+    sizes = np.diff(edges)
+    mean_x = np.add.reduceat(x[:n - 1], edges[:-1]) / sizes
+    mean_y = np.add.reduceat(y[:n - 1], edges[:-1]) / sizes
+    mean_x, mean_y = np.append(mean_x[1:], x[-1]), np.append(mean_y[1:], y[-1])
+    selected = np.empty(n_out, dtype=np.int64)
+    selected[0], selected[-1] = 0, n - 1
+    a = 0
+    for i in range(n_out - 2):
+        start, end = edges[i], edges[i + 1]
+        area = np.abs((x[a] - mean_x[i]) * (y[start:end] - y[a]) - (x[a] - x[start:end]) * (mean_y[i] - y[a]))
+        a = start + int(np.argmax(area))
+        selected[i + 1] = a
+    return selected
+
+def daily_series(daily_reviews, max_points):
+    # Every day from the first to the last review (days without reviews as 0, as rating_trend_analysis counts them),
+    # downsampled for display; anomaly days are always kept so the markers sit on the line
+    first_day = int(daily_reviews['review_day'].min())
+    offsets = daily_reviews['review_day'].to_numpy(dtype=np.int64) - first_day
+    n_days = int(offsets.max()) + 1
+    counts = np.zeros(n_days)
+    rolling = np.zeros(n_days)
+    counts[offsets] = daily_reviews['review_count'].to_numpy(dtype=np.float64)
+    rolling[offsets] = daily_reviews['rolling_mean'].to_numpy(dtype=np.float64)
+    anomalies = offsets[daily_reviews['anomaly'].to_numpy() == 1]
+    days = np.arange(n_days, dtype=np.float64)
+    kept = np.union1d(lttb(days, counts, max_points), anomalies)
+    return {
+        'day': (kept + first_day).tolist(),
+        'review_count': counts[kept].astype(np.int64).tolist(),
+        'rolling_mean': np.round(rolling[kept], 2).tolist(),
+        'anomaly_day': (anomalies + first_day).tolist(),
+        'anomaly_count': counts[anomalies].astype(np.int64).tolist(),
+        'total_days': n_days,
+    }
+
+def read_table(path):
+    return pd.read_csv(path) if os.path.exists(path) else None
+
+def product_data(company_name, folder_path, word_counts, max_points):
+    summary = {}
+    for table in SUMMARY_TABLES:
+        df = read_table(os.path.join(folder_path, f"{company_name}_{table}.csv"))
+        if df is not None and len(df):
+            summary.update({k: v.item() if isinstance(v, np.generic) else v for k, v in df.iloc[0].to_dict().items()})
+    data = {
+        'company_name': company_name,
+        'product_name': str(summary.pop('product_name', '')),
+        'summary': {k: v for k, v in summary.items() if k != 'company_name'},
+    }
+    daily_reviews = read_table(os.path.join(folder_path, f"{company_name}_daily_reviews.csv"))
+    if daily_reviews is not None and len(daily_reviews):
+        data['daily'] = daily_series(daily_reviews, max_points)
+    for table in ['unique_nonunique_ratings', 'phrase_repetition_ratings']:
+        ratings = read_table(os.path.join(folder_path, f"{company_name}_{table}.csv"))
+        if ratings is not None:
+            data[table] = ratings.to_dict(orient='list')
+    subdaily = read_table(os.path.join(folder_path, f"{company_name}_subdaily_bursts.csv"))
+    if subdaily is not None:
+        data['subdaily_bursts'] = subdaily.drop(columns=['company_name', 'product_name']).astype(str).to_dict(orient='records')
+    if company_name in word_counts:
+        data['word_counts'] = word_counts[company_name]
+    return data
+
+def word_count_percentages(foldername):
+    # Each product's word count distribution and that of the sum of the other products, from the baseline
+    baseline = load_baseline(f'./results/{foldername}_word_count_baseline.csv')
+    histograms = baseline.to_numpy(dtype=np.int64)
+    others = histograms.sum(axis=0) - histograms
+    return {company_name: {'labels': LABELS, 'product': np.round(to_percentages(histograms[i]), 2).tolist(),
+                           'others': np.round(to_percentages(others[i]), 2).tolist()}
+            for i, company_name in enumerate(baseline.index)}
+
+def write_script(path, text):
+    with open(path, 'w', encoding='utf-8') as f:
+        f.write(text)
+
+def write_plotly_bundle(assets_path):
+    # One copy of plotly.js per version, shared by the dashboards of every folder
+    create_folder(assets_path)
+    bundle_filename = f"plotly-{plotly.__version__}.min.js"
+    bundle_path = os.path.join(assets_path, bundle_filename)
+    if not os.path.exists(bundle_path):
+        write_script(bundle_path, get_plotlyjs())
+    return bundle_filename
+
+def build_dashboard(foldername, max_points=MAX_POINTS):
+    folder_path = f'./{foldername}_Collected_Reviews'
+    company_names = [f.split('.')[0] for f in list_review_files(foldername, folder_path)]
+    company_names = [c for c in sorted(company_names) if os.path.isdir(f'./results/{c}')]
+    data_path = f'./results/{foldername}_dashboard'
+    create_folder(data_path)
+    bundle_filename = write_plotly_bundle('./results/dashboard_assets')
+    word_counts = word_count_percentages(foldername)
+
+    # Per product a small script that is only loaded when the product is opened; the index keeps the table columns
+    products = []
+    for i, company_name in enumerate(company_names):
+        data = product_data(company_name, f'./results/{company_name}', word_counts, max_points)
+        write_script(os.path.join(data_path, f'{i}.js'), f'dashboardLoaded({i}, {json.dumps(data, ensure_ascii=False, default=str)});\n')
+        products.append([company_name, data['product_name']] + [data['summary'].get(col) for col in TABLE_COLUMNS])
+    write_script(os.path.join(data_path, 'products.js'),
+                 f'var DASHBOARD_COLUMNS = {json.dumps(TABLE_COLUMNS)};\n'
+                 f'var DASHBOARD_PRODUCTS = {json.dumps(products, ensure_ascii=False, default=str)};\n')
+
+    html_path = f'./results/{foldername}_dashboard.html'
+    with open(html_path, 'w', encoding='utf-8') as f:
+        f.write(DASHBOARD_HTML.replace('{title}', f'{foldername} Reviews')
+                .replace('{plotly}', f'dashboard_assets/{bundle_filename}')
+                .replace('{data}', f'{foldername}_dashboard'))
+    return html_path, len(company_names)
+
+DASHBOARD_HTML = """<!DOCTYPE html>
+<html>
+<head>
+<meta charset="utf-8">
+<title>{title}</title>
+<style>
+body { font-family: "Nanum Gothic", sans-serif; margin: 0; display: flex; height: 100vh; }
+#list { width: 45%; overflow: auto; border-right: 1px solid #ccc; }
+#detail { flex: 1; overflow: auto; padding: 0 12px; }
+table { border-collapse: collapse; font-size: 12px; width: 100%; }
+th { position: sticky; top: 0; background: #eee; cursor: pointer; }
+td, th { padding: 3px 6px; border-bottom: 1px solid #eee; text-align: right; }
+td:first-child, th:first-child { text-align: left; }
+tr.product:hover, tr.selected { background: #def; cursor: pointer; }
+#filter { width: 95%; margin: 6px; }
+.plot { height: 320px; }
+</style>
+<script src="{plotly}"></script>
+<script src="{data}/products.js"></script>
+</head>
+<body>
+<div id="list"><input id="filter" placeholder="Filter products"><table id="products"></table></div>
+<div id="detail"><h3 id="title">Select a product</h3><div id="info"></div>
+<div id="daily" class="plot"></div><div id="ratings" class="plot"></div><div id="words" class="plot"></div>
+<table id="summary"></table></div>
+<script>
+var loaded = {}, sortColumn = -1, sortAscending = true, selected = -1;
+var headers = ['product'].concat(DASHBOARD_COLUMNS);
+
+function dayToDate(days) { return days.map(function (d) { return new Date(d * 86400000); }); }
+
+function cell(row, tag, text) { var c = document.createElement(tag); c.textContent = text; row.appendChild(c); return c; }
+
+function renderTable() {
+  var table = document.getElementById('products'), filter = document.getElementById('filter').value.toLowerCase();
+  var order = DASHBOARD_PRODUCTS.map(function (p, i) { return i; });
+  if (sortColumn >= 0) {
+    order.sort(function (a, b) {
+      var x = DASHBOARD_PRODUCTS[a][sortColumn + 1], y = DASHBOARD_PRODUCTS[b][sortColumn + 1];
+      if (x === y) return 0;
+      if (x === null || x !== x) return 1;
+      if (y === null || y !== y) return -1;
+      return (x < y ? -1 : 1) * (sortAscending ? 1 : -1);
+    });
+  }
+  table.textContent = '';
+  var head = table.insertRow();
+  headers.forEach(function (h, j) { cell(head, 'th', h).onclick = function () { sortAscending = sortColumn === j ? !sortAscending : false; sortColumn = j; renderTable(); }; });
+  order.forEach(function (i) {
+    var p = DASHBOARD_PRODUCTS[i];
+    if (filter && (p[0] + ' ' + p[1]).toLowerCase().indexOf(filter) < 0) return;
+    var row = table.insertRow();
+    row.className = i === selected ? 'product selected' : 'product';
+    cell(row, 'td', p[1] || p[0]).title = p[0];
+    p.slice(2).forEach(function (v) { cell(row, 'td', v === null ? '' : v); });
+    row.onclick = function () { openProduct(i); };
+  });
+}
+
+function openProduct(i) {
+  selected = i;
+  renderTable();
+  if (loaded[i]) { renderProduct(loaded[i]); return; }
+  var script = document.createElement('script');
+  script.src = '{data}/' + i + '.js';
+  document.head.appendChild(script);
+}
+
+function dashboardLoaded(i, data) { loaded[i] = data; if (i === selected) renderProduct(data); }
+
+function ratingBars(data, table, names) {
+  var t = data[table];
+  return names.map(function (n) { return {type: 'bar', name: n[1], x: t.rating, y: t[n[0]]}; });
+}
+
+function renderProduct(data) {
+  document.getElementById('title').textContent = data.product_name || data.company_name;
+  var d = data.daily, traces = [];
+  if (d) {
+    document.getElementById('info').textContent = d.total_days + ' days, ' + d.day.length + ' shown';
+    traces = [{x: dayToDate(d.day), y: d.review_count, name: 'Review Count', mode: 'lines'},
+              {x: dayToDate(d.day), y: d.rolling_mean, name: 'Rolling Mean', mode: 'lines'},
+              {x: dayToDate(d.anomaly_day), y: d.anomaly_count, name: 'Anomaly', mode: 'markers', marker: {color: 'red', symbol: 'x'}}];
+  }
+  var layout = {title: 'Review Counts and Anomalies', margin: {t: 40, b: 40}};
+  if (d && data.summary.max_reviews_per_day !== undefined) {
+    layout.shapes = [{type: 'line', xref: 'paper', x0: 0, x1: 1, y0: data.summary.max_reviews_per_day, y1: data.summary.max_reviews_per_day, line: {color: 'green', dash: 'dash'}}];
+  }
+  Plotly.react('daily', traces, layout);
+
+  var bars = [];
+  if (data.unique_nonunique_ratings) bars = bars.concat(ratingBars(data, 'unique_nonunique_ratings', [['unique_reviews', 'Unique'], ['non_unique_reviews', 'Non-Unique']]));
+  if (data.phrase_repetition_ratings) bars = bars.concat(ratingBars(data, 'phrase_repetition_ratings', [['with_phrases', 'With Repetitive Phrases'], ['without_phrases', 'Without Repetitive Phrases']]));
+  Plotly.react('ratings', bars, {title: 'Ratings', barmode: 'group', margin: {t: 40, b: 40}});
+
+  var w = data.word_counts, words = [];
+  if (w) words = [{x: w.labels, y: w.product, fill: 'tozeroy', name: 'This Product'}, {x: w.labels, y: w.others, fill: 'tozeroy', name: 'Other Products'}];
+  Plotly.react('words', words, {title: 'Word Count Comparison (% of reviews)', margin: {t: 40, b: 40}});
+
+  var summary = document.getElementById('summary');
+  summary.textContent = '';
+  Object.keys(data.summary).forEach(function (k) { var row = summary.insertRow(); cell(row, 'td', k); cell(row, 'td', data.summary[k]); });
+  (data.subdaily_bursts || []).forEach(function (r) {
+    Object.keys(r).forEach(function (k) { var row = summary.insertRow(); cell(row, 'td', 'subdaily ' + r.resolution + ' ' + k); cell(row, 'td', r[k]); });
+  });
+}
+
+document.getElementById('filter').oninput = renderTable;
+renderTable();
+</script>
+</body>
+</html>
+"""
+
+def main():
+    args = get_args()
+    start = time.perf_counter()
+    html_path, n_products = build_dashboard(args.foldername, args.max_points)
+    print(f"Dashboard of {n_products} products saved to {html_path} ({time.perf_counter() - start:.2f}s)")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,207 @@
+import os
+import time
+import argparse
+import numpy as np
+import pandas as pd
+from review_loader import load_reviews, day_to_timestamp
+from batch_analysis import list_review_files
+from duplicate_index import hash_review_texts, review_uid_numbers
+from reviewer_index import reviewer_keys
+from text_cache import normalize_texts
+
+# Groups of copied reviews across every collected product. Each pair source links reviews by integer review id (the
+# row of the review in the catalog); the pairs are merged by a union-find, so a group is every review reachable
+# through any chain of pairs. Exact copies use the text hash of unique_review_analysis.py; near copies are texts that
+# are the same once lowercased and stripped of punctuation and whitespace.
+
+# Short reviews like 좋아요 repeat by chance, so texts shorter than this once normalized are not linked
+MIN_CHARS = 10
+PAIR_SOURCES = ['exact', 'near']
+RATING_VALUES = [1, 2, 3, 4, 5]
+MAX_NAMES = 10
+CLUSTER_COLUMNS = ['cluster_id', 'size', 'distinct_texts', 'n_products', 'company_names', 'distinct_reviewers', 'first_date', 'last_date',
+                   'date_span_days'] + [f'rating_{value}' for value in RATING_VALUES] + ['avg_rating']
+REVIEW_COLUMNS = ['cluster_id', 'company_name', 'review_uid', 'review_date', 'rating']
+
+def get_args():
+    parser = argparse.ArgumentParser(description='Cluster duplicate and near-duplicate reviews across products.')
+    parser.add_argument('foldernames', type=str, nargs='+', help='The names of the folders, ex. Coupang Saladlab Crema')
+    parser.add_argument('--pairs', type=str, nargs='+', choices=PAIR_SOURCES, default=PAIR_SOURCES, help='Which pairs link reviews')
+    parser.add_argument('--min-chars', type=int, default=MIN_CHARS, help='Shorter texts (after normalizing) are not linked; 0 links every text')
+    parser.add_argument('--min-size', type=int, default=2, help='Smallest cluster to report')
+    return parser.parse_args()
+
+def create_folder(folder_path):
+    if not os.path.exists(folder_path):
+        os.makedirs(folder_path)
+
+class UnionFind:
+    """Disjoint sets of the ids 0..n-1, merged a whole array of pairs at a time."""
+
+    def __init__(self, n):
+        self.parent = np.arange(n, dtype=np.int32 if n < 2 ** 31 else np.int64)
+
+    def find(self, ids):
+        # Follow the parents up to the roots, each step only for the ids not there yet, then point every queried id
+        # straight at its root
+        roots = self.parent[ids]
+        up = self.parent[roots]
+        moving = np.flatnonzero(up != roots)
+        up = up[moving]
+        while len(moving):
+            roots[moving] = up
+            up = self.parent[up]
+            climbing = up != roots[moving]
+            moving, up = moving[climbing], up[climbing]
+        self.parent[ids] = roots
+        return roots
+
+    def union(self, a, b):
+        # Each round hooks the larger root of every pair under the smallest root it is paired with; pairs whose roots
+        # still differ afterwards (their larger root was hooked elsewhere) go to the next round
+        a, b = np.asarray(a, dtype=self.parent.dtype), np.asarray(b, dtype=self.parent.dtype)
+        while len(a):
+            a, b = self.find(a), self.find(b)
+            apart = a != b
+            a, b = np.maximum(a[apart], b[apart]), np.minimum(a[apart], b[apart])
+            np.minimum.at(self.parent, a, b)
+
+    def roots(self):
+        # Full path compression: jump to the grandparent until every id points at its root
+        while True:
+            grand = self.parent[self.parent]
+            if np.array_equal(grand, self.parent):
+                return self.parent
+            self.parent = grand
+
+def hash_pairs(hashes, ids):
+    # Every review with a hash seen before is paired with the first review of that hash, a star per hash
+    order = np.argsort(hashes, kind='stable')
+    sorted_hashes = hashes[order]
+    first = np.r_[True, sorted_hashes[1:] != sorted_hashes[:-1]]
+    group_first = order[np.flatnonzero(first)[np.cumsum(first) - 1]]
+    return ids[group_first[~first]], ids[order[~first]]
+
+def near_hashes(texts):
+    compact = normalize_texts(texts).str.replace(r'\s+', '', regex=True)
+    return pd.util.hash_array(compact.astype(object).to_numpy(dtype=object)), compact.str.len().to_numpy()
+
+def review_columns(df, source, product):
+    # The columns the clusters need, for the reviews of one product that have a text
+    df = df[df['review_content'].notna()]
+    reviewer, known = reviewer_keys(df, source)
+    near, chars = near_hashes(df['review_content'])
+    return {
+        'product': np.full(len(df), product, dtype=np.int32),
+        'review_uid': review_uid_numbers(df['review_uid']) if 'review_uid' in df.columns else np.arange(len(df)),
+        'day': df['review_day'].astype('float64').to_numpy(),
+        'rating': df['rating'].astype('float64').to_numpy(),
+        'reviewer': reviewer,
+        'known': known,
+        'exact': hash_review_texts(df['review_content']),
+        'near': near,
+        'chars': chars,
+    }
+
+def load_catalog(foldernames):
+    # One row per review of every product, without the texts: only their hashes are kept
+    names, products = [], []
+    for foldername in foldernames:
+        folder_path = f'./{foldername}_Collected_Reviews'
+        for filename in sorted(list_review_files(foldername, folder_path)):
+            df = load_reviews(os.path.join(folder_path, filename))
+            if df['review_content'].isna().all():
+                continue
+            products.append(review_columns(df, foldername, len(names)))
+            names.append((filename.split('.')[0], df['product_name'].iloc[0]))
+    if not names:
+        return names, None
+    return names, {key: np.concatenate([columns[key] for columns in products]) for key in products[0]}
+
+def cluster_reviews(catalog, pair_sources=PAIR_SOURCES, min_chars=MIN_CHARS):
+    """Root id of every review's cluster."""
+    ids = np.flatnonzero(catalog['chars'] >= min_chars)
+    clusters = UnionFind(len(catalog['chars']))
+    for source in pair_sources:
+        start = time.perf_counter()
+        a, b = hash_pairs(catalog[source][ids], ids)
+        clusters.union(a, b)
+        print(f"{source}: merged {len(a)} pairs in {time.perf_counter() - start:.2f}s")
+    return clusters.roots()
+
+def joined_names(values):
+    values = list(values)
+    return '; '.join(values[:MAX_NAMES]) + (f'; ... ({len(values)} in all)' if len(values) > MAX_NAMES else '')
+
+def cluster_tables(names, catalog, roots, min_size=2):
+    # Clusters with at least min_size reviews, biggest first, and their member reviews
+    sizes = np.bincount(roots)
+    members = np.flatnonzero(sizes[roots] >= min_size)
+    if not len(members):
+        return pd.DataFrame(columns=CLUSTER_COLUMNS), pd.DataFrame(columns=REVIEW_COLUMNS)
+    members = members[np.lexsort((members, roots[members], -sizes[roots[members]]))]
+    cluster = np.cumsum(np.r_[True, roots[members][1:] != roots[members][:-1]]) - 1
+    df = pd.DataFrame({
+        'cluster_id': cluster,
+        'product': catalog['product'][members],
+        'reviewer': np.where(catalog['known'][members], catalog['reviewer'][members], 0),
+        'day': catalog['day'][members],
+        'rating': catalog['rating'][members],
+        'exact': catalog['exact'][members],
+    })
+    grouped = df.groupby('cluster_id', sort=True)
+    first_day, last_day = grouped['day'].min(), grouped['day'].max()
+    rating_codes = df['rating'].round().clip(RATING_VALUES[0], RATING_VALUES[-1])
+    n_clusters = cluster[-1] + 1
+    rated = rating_codes.notna().to_numpy()
+    rating_counts = np.bincount(cluster[rated] * len(RATING_VALUES) + rating_codes[rated].to_numpy(dtype=np.int64) - RATING_VALUES[0],
+                                minlength=n_clusters * len(RATING_VALUES)).reshape(n_clusters, -1)
+    products = grouped['product'].unique()
+    clusters = pd.DataFrame({
+        'cluster_id': np.arange(n_clusters),
+        'size': grouped.size().to_numpy(),
+        'distinct_texts': grouped['exact'].nunique().to_numpy(),
+        'n_products': products.map(len).to_numpy(),
+        'company_names': [joined_names(names[p][0] for p in ps) for ps in products],
+        'distinct_reviewers': df[df['reviewer'] != 0].groupby('cluster_id')['reviewer'].nunique().reindex(range(n_clusters), fill_value=0).to_numpy(),
+        'first_date': day_to_timestamp(first_day.fillna(0)).date,
+        'last_date': day_to_timestamp(last_day.fillna(0)).date,
+        'date_span_days': (last_day - first_day + 1).astype('Int64').to_numpy(),
+    })
+    clusters.loc[first_day.isna().to_numpy(), ['first_date', 'last_date']] = None
+    for i, value in enumerate(RATING_VALUES):
+        clusters[f'rating_{value}'] = rating_counts[:, i]
+    with np.errstate(invalid='ignore'):
+        clusters['avg_rating'] = np.round(grouped['rating'].mean().to_numpy(), 2)
+
+    reviews = pd.DataFrame({
+        'cluster_id': cluster,
+        'company_name': [names[p][0] for p in df['product']],
+        'review_uid': catalog['review_uid'][members],
+        'review_date': day_to_timestamp(df['day'].fillna(0)).date,
+        'rating': df['rating'],
+    })
+    reviews.loc[df['day'].isna().to_numpy(), 'review_date'] = None
+    return clusters, reviews
+
+def main():
+    args = get_args()
+    names, catalog = load_catalog(args.foldernames)
+    if not names:
+        print("No reviews found")
+        return
+    start = time.perf_counter()
+    roots = cluster_reviews(catalog, args.pairs, args.min_chars)
+    clusters, reviews = cluster_tables(names, catalog, roots, args.min_size)
+    print(f"{len(clusters)} clusters of {len(reviews)} reviews out of {len(roots)} in {time.perf_counter() - start:.2f}s")
+
+    folder_path = './results'
+    create_folder(folder_path)
+    prefix = '_'.join(args.foldernames)
+    for table, suffix in [(clusters, 'duplicate_clusters'), (reviews, 'duplicate_cluster_reviews')]:
+        output_path = os.path.join(folder_path, f"{prefix}_{suffix}.csv")
+        table.to_csv(output_path, index=False)
+        print(f"CSV file saved to {output_path}")
+
+if __name__ == "__main__":
+    main()
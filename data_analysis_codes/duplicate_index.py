@@ -0,0 +1,223 @@
+import os
+import time
+import argparse
+import numpy as np
+import pandas as pd
+from review_loader import load_reviews
+
+# Sorted postings live in main.npy and are memory-mapped for lookups; new postings are appended to delta.npy
+# and merged into main once the delta grows past MERGE_FRACTION of it.
+POSTING_DTYPE = np.dtype([('hash', '<u8'), ('source', '<u2'), ('product', '<u4'), ('review_uid', '<i8')])
+PRODUCT_COLUMNS = ['product', 'source', 'filename', 'product_name', 'mtime', 'total_reviews', 'active']
+HASH_KEY = 'duplicate-idx-v1'
+MERGE_FRACTION = 0.1
+
+def get_args():
+    parser = argparse.ArgumentParser(description='Global exact-duplicate index over all collected reviews.')
+    subparsers = parser.add_subparsers(dest='command', required=True)
+    build = subparsers.add_parser('build', help='Add new or changed review files and save per-product duplicate rates')
+    build.add_argument('foldernames', type=str, nargs='+', help='The names of the folders, ex. Coupang Saladlab Crema')
+    check = subparsers.add_parser('check', help='Check one review file against the index without adding it')
+    check.add_argument('filename', type=str, help='The CSV file to check')
+    for subparser in [build, check]:
+        subparser.add_argument('--index', type=str, default='./duplicate_index', help='Folder of the duplicate index')
+    return parser.parse_args()
+
+def create_folder(folder_path):
+    if not os.path.exists(folder_path):
+        os.makedirs(folder_path)
+
+def preprocess_reviews(reviews):
+    # Same cleaning as unique_review_analysis, so within-product rates agree with percentage_non_unique
+    reviews = reviews.str.replace(r"\(\d{4}-\d{2}-\d{2} \d{2}:\d{2}:\d{2} 에 등록된 네이버 페이 구매평\)", "", regex=True)
+    return reviews.str.replace("쇼핑몰 추천 리뷰", "", regex=False)
+
+def hash_review_texts(reviews):
+    return pd.util.hash_array(preprocess_reviews(reviews).astype(object).to_numpy(dtype=object), hash_key=HASH_KEY)
+
+def review_uid_numbers(review_uids):
+    numbers = pd.to_numeric(review_uids, errors='coerce')
+    hashed = pd.util.hash_array(review_uids.astype(str).to_numpy(dtype=object)).view(np.int64)
+    return np.where(numbers.notna(), numbers.fillna(0).to_numpy(dtype=np.float64).astype(np.int64), hashed)
+
+def product_postings(df, source_id, product_id):
+    has_text = df['review_content'].notna().to_numpy()
+    postings = np.empty(has_text.sum(), dtype=POSTING_DTYPE)
+    postings['hash'] = hash_review_texts(df['review_content'][has_text])
+    postings['source'] = source_id
+    postings['product'] = product_id
+    postings['review_uid'] = review_uid_numbers(df['review_uid'][has_text]) if 'review_uid' in df.columns else np.flatnonzero(has_text)
+    return postings
+
+class DuplicateIndex:
+    def __init__(self, folder):
+        self.folder = folder
+        create_folder(folder)
+        self.main_path = os.path.join(folder, 'main.npy')
+        self.delta_path = os.path.join(folder, 'delta.npy')
+        self.products_path = os.path.join(folder, 'products.csv')
+        self.sources_path = os.path.join(folder, 'sources.txt')
+        if os.path.exists(self.products_path):
+            self.products = pd.read_csv(self.products_path, float_precision='round_trip')
+        else:
+            self.products = pd.DataFrame({col: pd.Series(dtype=dtype) for col, dtype in zip(PRODUCT_COLUMNS, [np.int64, str, str, str, np.float64, np.int64, bool])})
+        self.sources = open(self.sources_path, encoding='utf-8').read().split('\n') if os.path.exists(self.sources_path) else []
+        self.main = self.load_postings(self.main_path, mmap=True)
+        self.delta = self.load_postings(self.delta_path)
+
+    @staticmethod
+    def load_postings(path, mmap=False):
+        if not os.path.exists(path):
+            return np.empty(0, dtype=POSTING_DTYPE)
+        return np.load(path, mmap_mode='r' if mmap else None)
+
+    def source_id(self, source):
+        if source not in self.sources:
+            self.sources.append(source)
+        return self.sources.index(source)
+
+    def needs_update(self, source, filename, mtime):
+        current = self.products[(self.products['source'] == source) & (self.products['filename'] == filename) & self.products['active']]
+        return current.empty or current['mtime'].iloc[0] != mtime
+
+    def add_product(self, source, filename, mtime, df):
+        # A changed file gets a new product id; postings of the old id are dropped when the index is saved
+        stale = (self.products['source'] == source) & (self.products['filename'] == filename)
+        self.products.loc[stale, 'active'] = False
+        product_id = int(self.products['product'].max() + 1) if len(self.products) else 0
+        product_name = str(df['product_name'].iloc[0]) if len(df) else ''
+        self.products.loc[len(self.products)] = [product_id, source, filename, product_name, mtime, len(df), True]
+        postings = product_postings(df, self.source_id(source), product_id)
+        self.delta = np.concatenate([self.delta, postings])
+        return product_id
+
+    def active_products(self):
+        return self.products.loc[self.products['active'], 'product'].to_numpy(dtype=np.int64)
+
+    def merge(self):
+        # Rewrite main as the sorted union of main and delta, without postings of replaced files
+        combined = np.concatenate([np.asarray(self.main), self.delta])
+        combined = combined[np.isin(combined['product'], self.active_products())]
+        combined = combined[np.argsort(combined['hash'], kind='stable')]
+        self.main = None
+        np.save(self.main_path + '.tmp.npy', combined)
+        os.replace(self.main_path + '.tmp.npy', self.main_path)
+        self.main = self.load_postings(self.main_path, mmap=True)
+        self.delta = np.empty(0, dtype=POSTING_DTYPE)
+
+    def save(self):
+        # Postings of replaced files are filtered out of the delta; main is only rewritten when it still holds some of
+        # them or the delta outgrew it. Either way no stale posting is left, so the replaced products are forgotten.
+        stale = self.products.loc[~self.products['active'], 'product'].to_numpy(dtype=np.int64)
+        self.delta = self.delta[~np.isin(self.delta['product'], stale)]
+        if len(self.delta) > MERGE_FRACTION * len(self.main) or (len(stale) and np.isin(self.main['product'], stale).any()):
+            self.merge()
+        self.products = self.products[self.products['active']].reset_index(drop=True)
+        np.save(self.delta_path, self.delta)
+        self.products.to_csv(self.products_path, index=False)
+        with open(self.sources_path, 'w', encoding='utf-8') as f:
+            f.write('\n'.join(self.sources))
+
+    def lookup(self, hashes):
+        # All postings with one of the given hashes: binary search into the memory-mapped main, linear scan of the small delta
+        hashes = np.unique(np.asarray(hashes, dtype=np.uint64))
+        main_hashes = self.main['hash']
+        starts = np.searchsorted(main_hashes, hashes, side='left')
+        ends = np.searchsorted(main_hashes, hashes, side='right')
+        lengths = ends - starts
+        rows = np.arange(lengths.sum()) + np.repeat(starts - (np.cumsum(lengths) - lengths), lengths)
+        matches = np.concatenate([np.asarray(self.main[rows]), self.delta[np.isin(self.delta['hash'], hashes)]])
+        return matches[np.isin(matches['product'], self.active_products())]
+
+    def all_postings(self):
+        postings = np.concatenate([np.asarray(self.main), self.delta])
+        return postings[np.isin(postings['product'], self.active_products())]
+
+def duplicate_flags(hashes, products):
+    # Per posting: is the text repeated within its own product, and does it appear in any other product
+    order = np.lexsort((products, hashes))
+    sorted_hashes, sorted_products = hashes[order], products[order]
+    new_hash = np.r_[True, sorted_hashes[1:] != sorted_hashes[:-1]]
+    new_pair = new_hash | np.r_[True, sorted_products[1:] != sorted_products[:-1]]
+    hash_group = np.cumsum(new_hash) - 1
+    pair_group = np.cumsum(new_pair) - 1
+    within = np.bincount(pair_group)[pair_group] > 1
+    products_per_hash = np.bincount(hash_group, weights=new_pair)[hash_group]
+    cross = products_per_hash > 1
+    within_flags = np.empty(len(order), dtype=bool)
+    cross_flags = np.empty(len(order), dtype=bool)
+    within_flags[order] = within
+    cross_flags[order] = cross
+    return within_flags, cross_flags
+
+def duplicate_rates(index):
+    postings = index.all_postings()
+    within, cross = duplicate_flags(postings['hash'], postings['product'].astype(np.int64))
+    counts = pd.DataFrame({'product': postings['product'].astype(np.int64), 'within': within, 'cross': cross})
+    counts = counts.groupby('product')[['within', 'cross']].sum()
+    products = index.products[index.products['active']].set_index('product')
+    products = products.join(counts).fillna({'within': 0, 'cross': 0})
+    total = products['total_reviews'].where(products['total_reviews'] > 0)
+    products['within_product_duplicate_percentage'] = (products['within'] / total * 100).round(2)
+    products['cross_product_duplicate_percentage'] = (products['cross'] / total * 100).round(2)
+    return products.reset_index()
+
+def check_product(index, df):
+    # Rates for a product that is not in the index: only its own hashes are looked up
+    hashes = hash_review_texts(df['review_content'].dropna())
+    matches = index.lookup(hashes)
+    within = pd.Series(hashes).duplicated(keep=False).to_numpy()
+    cross = np.isin(hashes, matches['hash'])
+    total = len(df)
+    return {
+        'within_product_duplicate_percentage': round(within.sum() / total * 100, 2) if total else np.nan,
+        'cross_product_duplicate_percentage': round(cross.sum() / total * 100, 2) if total else np.nan,
+        'matched_products': len(np.unique(matches['product'])),
+    }
+
+def build(index, foldernames):
+    for foldername in foldernames:
+        folder_path = f'./{foldername}_Collected_Reviews'
+        if not os.path.exists(folder_path):
+            print(f"The folder {folder_path} does not exist.")
+            continue
+        for filename in sorted(os.listdir(folder_path)):
+            if not filename.endswith('.csv'):
+                continue
+            file_path = os.path.join(folder_path, filename)
+            mtime = os.path.getmtime(file_path)
+            if not index.needs_update(foldername, filename, mtime):
+                continue
+            print(f"Indexing file: {filename}")
+            index.add_product(foldername, filename, mtime, load_reviews(file_path))
+    index.save()
+
+def save_results(rates, foldernames):
+    for _, row in rates[rates['source'].isin(foldernames)].iterrows():
+        company_name = row['filename'].split('.')[0]
+        folder_path = f'./results/{company_name}'
+        create_folder(folder_path)
+        results_df = pd.DataFrame({
+            'company_name': [company_name],
+            'product_name': [row['product_name']],
+            'within_product_duplicate_percentage': [row['within_product_duplicate_percentage']],
+            'cross_product_duplicate_percentage': [row['cross_product_duplicate_percentage']]
+        })
+        output_path = os.path.join(folder_path, f"{company_name}_duplicate_index.csv")
+        results_df.to_csv(output_path, index=False)
+        print(f"CSV file saved to {output_path}")
+
+def main():
+    args = get_args()
+    index = DuplicateIndex(args.index)
+    if args.command == 'build':
+        build(index, args.foldernames)
+        save_results(duplicate_rates(index), args.foldernames)
+    else:
+        df = load_reviews(args.filename)
+        start = time.perf_counter()
+        result = check_product(index, df)
+        print(f"{result} ({(time.perf_counter() - start) * 1000:.1f} ms)")
+
+if __name__ == "__main__":
+    main()
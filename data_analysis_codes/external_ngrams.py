@@ -0,0 +1,207 @@
+import os
+import tempfile
+import numpy as np
+
+# N-gram counting with a fixed memory budget, for products too large for one in-memory Counter.
+# N-grams are encoded as rows of MAX_N token ids (padded with -1) plus a 64-bit hash used as the sort key. A buffer of
+# encoded n-grams is collapsed into sorted (hash, ids, count) records and spilled to disk as a run whenever it is full;
+# the runs are then merged block by block in hash order, and only n-grams reaching min_freq are kept.
+# The budget does not cover the token vocabulary and the returned phrases.
+
+MAX_N = 5
+RUN_COLUMNS = [('hash', np.dtype(np.uint64), ()), ('ids', np.dtype(np.int32), (MAX_N,)), ('count', np.dtype(np.int64), ())]
+RECORD_BYTES = 8 + 4 * MAX_N + 8
+# Sorting a block needs the records, their sort order and a sorted copy
+WORKING_COPIES = 4
+MIN_BLOCK_ROWS = 4096
+HASH_MULTIPLIERS = np.array([0x9E3779B97F4A7C15, 0xC2B2AE3D27D4EB4F, 0x165667B19E3779F9, 0xD6E8FEB86659FD93, 0xFF51AFD7ED558CCD], dtype=np.uint64)
+
+def hash_ids(ids):
+    # Multiply-xor of the token ids, finished with a splitmix64 step; equal n-grams always get equal hashes
+    with np.errstate(over='ignore'):
+        h = np.zeros(len(ids), dtype=np.uint64)
+        for column in range(ids.shape[1]):
+            h ^= (ids[:, column].astype(np.int64).astype(np.uint64) + np.uint64(1)) * HASH_MULTIPLIERS[column]
+            h = (h << np.uint64(31)) | (h >> np.uint64(33))
+        h ^= h >> np.uint64(30)
+        h *= np.uint64(0xBF58476D1CE4E5B9)
+        h ^= h >> np.uint64(27)
+        h *= np.uint64(0x94D049BB133111EB)
+        h ^= h >> np.uint64(31)
+    return h
+
+def collapse(hashes, ids, counts):
+    # Sort by (hash, ids) and sum the counts of identical n-grams
+    order = np.lexsort([ids[:, column] for column in range(ids.shape[1] - 1, -1, -1)] + [hashes])
+    hashes, ids, counts = hashes[order], ids[order], counts[order]
+    new = np.ones(len(hashes), dtype=bool)
+    new[1:] = (hashes[1:] != hashes[:-1]) | (ids[1:] != ids[:-1]).any(axis=1)
+    starts = np.flatnonzero(new)
+    return hashes[starts], ids[starts], np.add.reduceat(counts, starts) if len(starts) else counts[:0]
+
+class NgramSpiller:
+    """Bounded buffer of encoded n-grams that is written to sorted runs on disk when full."""
+
+    def __init__(self, folder, memory_bytes):
+        self.folder = folder
+        self.buffer_rows = max(MIN_BLOCK_ROWS, memory_bytes // (RECORD_BYTES * WORKING_COPIES))
+        self.ids = np.empty((self.buffer_rows, MAX_N), dtype=np.int32)
+        self.filled = 0
+        self.runs = []
+        self.runs_written = 0
+
+    def add(self, ids):
+        while len(ids):
+            take = min(len(ids), self.buffer_rows - self.filled)
+            self.ids[self.filled:self.filled + take] = ids[:take]
+            self.filled += take
+            ids = ids[take:]
+            if self.filled == self.buffer_rows:
+                self.spill()
+
+    def spill(self):
+        if not self.filled:
+            return
+        ids = self.ids[:self.filled]
+        self.write_run(*collapse(hash_ids(ids), ids, np.ones(self.filled, dtype=np.int64)))
+        self.filled = 0
+
+    def new_run(self):
+        path = os.path.join(self.folder, f'run{self.runs_written}')
+        self.runs.append(path)
+        self.runs_written += 1
+        return RunWriter(path)
+
+    def write_run(self, hashes, ids, counts):
+        with self.new_run() as writer:
+            writer.write(hashes, ids, counts)
+
+class RunWriter:
+    """Appends sorted records to the column files of one run."""
+
+    def __init__(self, path):
+        self.files = [open(f'{path}.{name}.bin', 'wb') for name, _, _ in RUN_COLUMNS]
+
+    def write(self, hashes, ids, counts):
+        for f, array in zip(self.files, [hashes, ids, counts]):
+            np.ascontiguousarray(array).tofile(f)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        for f in self.files:
+            f.close()
+
+def open_run(path):
+    columns = []
+    for name, dtype, shape in RUN_COLUMNS:
+        file_path = f'{path}.{name}.bin'
+        rows = os.path.getsize(file_path) // (dtype.itemsize * int(np.prod(shape)))
+        columns.append(np.memmap(file_path, dtype=dtype, mode='r', shape=(rows,) + shape) if rows else np.empty((0,) + shape, dtype=dtype))
+    return columns
+
+def remove_run(path):
+    for name, _, _ in RUN_COLUMNS:
+        os.remove(f'{path}.{name}.bin')
+
+def merge_runs(runs, memory_bytes, emit):
+    # Streaming k-way merge: each step reads the next block of every run and merges every record whose hash is below
+    # the smallest last hash of those blocks, so every copy of an n-gram is merged in the same step
+    opened = [open_run(path) for path in runs]
+    positions = [0] * len(opened)
+    block_rows = max(MIN_BLOCK_ROWS // 4, memory_bytes // (RECORD_BYTES * WORKING_COPIES * max(len(opened), 1)))
+    while True:
+        blocks = [(i, run[0][positions[i]:positions[i] + block_rows]) for i, run in enumerate(opened) if positions[i] < len(run[0])]
+        if not blocks:
+            return
+        partial = [block[-1] for i, block in blocks if positions[i] + len(block) < len(opened[i][0])]
+        bound = min(partial) if partial else None
+        parts = []
+        for i, block in blocks:
+            take = len(block) if bound is None else int(np.searchsorted(block, bound, side='left'))
+            if take:
+                hashes, ids, counts = opened[i]
+                parts.append((np.asarray(hashes[positions[i]:positions[i] + take]), np.asarray(ids[positions[i]:positions[i] + take]),
+                              np.asarray(counts[positions[i]:positions[i] + take])))
+                positions[i] += take
+        if not parts:
+            # One hash fills a whole block of some run; read bigger blocks until it fits
+            block_rows *= 2
+            continue
+        emit(*collapse(*(np.concatenate(column) for column in zip(*parts))))
+
+def merge_passes(spiller, memory_bytes):
+    # Too many runs for the memory budget are merged in groups first, keeping every count
+    max_runs = max(2, memory_bytes // (RECORD_BYTES * WORKING_COPIES * (MIN_BLOCK_ROWS // 4)))
+    while len(spiller.runs) > max_runs:
+        groups = [spiller.runs[i:i + max_runs] for i in range(0, len(spiller.runs), max_runs)]
+        spiller.runs = []
+        for group in groups:
+            with spiller.new_run() as writer:
+                merge_runs(group, memory_bytes, writer.write)
+            for path in group:
+                remove_run(path)
+
+def encode_batches(tokenized_reviews, vocabulary, tokens_of_id, batch_tokens):
+    # Token ids and lengths of consecutive reviews, about batch_tokens tokens at a time; new tokens join the vocabulary
+    batch, lengths = [], []
+    for tokens in tokenized_reviews:
+        for token in tokens:
+            if token not in vocabulary:
+                vocabulary[token] = len(tokens_of_id)
+                tokens_of_id.append(token)
+        batch.extend(vocabulary[token] for token in tokens)
+        lengths.append(len(tokens))
+        if len(batch) >= batch_tokens:
+            yield np.array(batch, dtype=np.int32), np.array(lengths, dtype=np.int64)
+            batch, lengths = [], []
+    yield np.array(batch, dtype=np.int32), np.array(lengths, dtype=np.int64)
+
+def review_ngram_ids(token_ids, lengths, min_n, max_n, return_reviews=False):
+    # Every n-gram (min_n <= n <= max_n) of a batch of reviews, given as one flat array of token ids and the review lengths,
+    # and optionally the index of the review each n-gram comes from
+    review_start = np.repeat(np.cumsum(lengths) - lengths, lengths)
+    review_end = review_start + np.repeat(lengths, lengths)
+    review = np.repeat(np.arange(len(lengths)), lengths)
+    position = np.arange(len(token_ids))
+    padded = np.concatenate([token_ids, np.full(MAX_N, -1, dtype=np.int32)])
+    rows, reviews = [], []
+    for n in range(min_n, max_n + 1):
+        start = position[position + n <= review_end]
+        gram = np.full((len(start), MAX_N), -1, dtype=np.int32)
+        for k in range(n):
+            gram[:, k] = padded[start + k]
+        rows.append(gram)
+        reviews.append(review[start])
+    ids = np.concatenate(rows) if rows else np.empty((0, MAX_N), dtype=np.int32)
+    if return_reviews:
+        return ids, np.concatenate(reviews) if reviews else np.empty(0, dtype=np.int64)
+    return ids
+
+def count_common_ngrams(tokenized_reviews, min_length=3, min_freq=3, max_n=MAX_N, memory_mb=256, spill_dir=None):
+    """Same result as counting every n-gram in a Counter and keeping those with freq >= min_freq, in bounded memory.
+
+    Only the token vocabulary and the n-grams that reach min_freq are held in memory besides the memory_mb budget.
+    """
+    memory_bytes = int(memory_mb * 1024 * 1024)
+    vocabulary = {}
+    tokens_of_id = []
+    common = {}
+    with tempfile.TemporaryDirectory(dir=spill_dir) as folder:
+        spiller = NgramSpiller(folder, memory_bytes // 2)
+        # Reviews are encoded in batches of about a quarter of the buffer, so the batch arrays stay within the budget too
+        batch_tokens = max(1, spiller.buffer_rows // (4 * max(1, max_n - min_length + 1)))
+        for token_ids, lengths in encode_batches(tokenized_reviews, vocabulary, tokens_of_id, batch_tokens):
+            spiller.add(review_ngram_ids(token_ids, lengths, min_length, max_n))
+        spiller.spill()
+        spiller.ids = None
+        merge_passes(spiller, memory_bytes)
+
+        def emit(hashes, ids, counts):
+            for row in np.flatnonzero(counts >= min_freq):
+                gram = ids[row]
+                common[tuple(tokens_of_id[t] for t in gram[gram >= 0])] = int(counts[row])
+
+        merge_runs(spiller.runs, memory_bytes, emit)
+    return common
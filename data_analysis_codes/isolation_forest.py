@@ -1,30 +1,33 @@
 import pandas as pd
 import numpy as np
-import matplotlib.pyplot as plt
 from sklearn.ensemble import IsolationForest
 import os
 import argparse
+from review_loader import load_reviews, day_to_timestamp
+from significance import significance_columns
 
 def get_filename():
     parser = argparse.ArgumentParser(description='Process some CSV files.')
     parser.add_argument('filename', type=str, help='The filename of the CSV (with extension)')
     parser.add_argument('foldername', type=str, help='The name of the folder')
+    parser.add_argument('--plots', action='store_true', help='Also save the per-product plot images (dashboard.py builds one dashboard per folder)')
     args = parser.parse_args()
-    return args.filename, args.foldername
+    return args.filename, args.foldername, args.plots
 
 def create_folder(folder_path):
     if not os.path.exists(folder_path):
         os.makedirs(folder_path)
 
 def load_data(filename):
-    return pd.read_csv(filename)
+    return load_reviews(filename)
 
 def preprocess_data(df):
-    df['review_date'] = pd.to_datetime(df['review_date'])
+    df = df.dropna(subset=['review_day'])
     return df
 
 def compute_daily_reviews(df):
-    daily_reviews = df.groupby('review_date').size().reset_index(name='review_count')
+    daily_reviews = df.groupby('review_day').size().reset_index(name='review_count')
+    daily_reviews['review_date'] = day_to_timestamp(daily_reviews['review_day'])
     return daily_reviews
 
 def compute_rolling_mean(daily_reviews, window=3):
@@ -33,22 +36,32 @@ def compute_rolling_mean(daily_reviews, window=3):
 
 def detect_anomalies(daily_reviews):
     X = daily_reviews[['review_count', 'rolling_mean']]
-    model = IsolationForest(contamination=0.05)
+    model = IsolationForest(contamination=0.05, random_state=0)
     model.fit(X)
     daily_reviews['anomaly'] = model.predict(X)
     daily_reviews['anomaly'] = daily_reviews['anomaly'].map({1: 0, -1: 1})
     return daily_reviews
 
 def calculate_statistics(df, daily_reviews):
+    high_review_days = daily_reviews[daily_reviews['anomaly'] == 1]['review_day']
     high_review_dates = daily_reviews[daily_reviews['anomaly'] == 1]['review_date']
-    anomalies = df[df['review_date'].isin(high_review_dates)]
-    non_anomalies = df[~df['review_date'].isin(high_review_dates)]
+    anomalies = df[df['review_day'].isin(high_review_days)]
+    non_anomalies = df[~df['review_day'].isin(high_review_days)]
     avg_rating_anomalies = anomalies['rating'].mean()
     avg_rating_non_anomalies = non_anomalies['rating'].mean()
     percentage_anomalies = (len(high_review_dates) / len(daily_reviews)) * 100
     return avg_rating_anomalies, avg_rating_non_anomalies, percentage_anomalies, high_review_dates
 
+def calculate_significance(df, daily_reviews):
+    high_review_days = daily_reviews[daily_reviews['anomaly'] == 1]['review_day']
+    is_anomaly = df['review_day'].isin(high_review_days)
+    significance = significance_columns('rating_diff_anomalies', df[is_anomaly]['rating'], df[~is_anomaly]['rating'])
+    print(f"Anomalies vs non-anomalies rating difference: p={significance['rating_diff_anomalies_p_value'][0]}, "
+          f"95% CI [{significance['rating_diff_anomalies_ci_low'][0]}, {significance['rating_diff_anomalies_ci_high'][0]}]")
+    return significance
+
 def plot_results(daily_reviews, high_review_dates, company_name, folder_path):
+    import matplotlib.pyplot as plt  # only needed with --plots
     plt.figure(figsize=(14, 7))
     plt.plot(daily_reviews['review_date'], daily_reviews['review_count'], label='Review Count')
     plt.plot(daily_reviews['review_date'], daily_reviews['rolling_mean'], color='orange', label='Rolling Mean')
@@ -65,13 +78,20 @@ def plot_results(daily_reviews, high_review_dates, company_name, folder_path):
     plt.close()
     print(f"Anomaly detection plot saved to {anomaly_plot_path}")
 
-def save_results(company_name, product_name, avg_rating_anomalies, avg_rating_non_anomalies, percentage_anomalies, folder_path):
+def save_daily_reviews(daily_reviews, company_name, folder_path):
+    # The series behind the plot, read by dashboard.py
+    daily_reviews_path = os.path.join(folder_path, f"{company_name}_daily_reviews.csv")
+    daily_reviews[['review_day', 'review_count', 'rolling_mean', 'anomaly']].to_csv(daily_reviews_path, index=False)
+    print(f"Daily review counts saved to {daily_reviews_path}")
+
+def save_results(company_name, product_name, avg_rating_anomalies, avg_rating_non_anomalies, percentage_anomalies, significance, folder_path):
     results_df = pd.DataFrame({
         'company_name': [company_name],
         'product_name': [product_name],
         'avg_rating_anomalies': [round(avg_rating_anomalies, 2)],
         'avg_rating_non_anomalies': [round(avg_rating_non_anomalies, 2)],
-        'percentage_anomalies': [round(percentage_anomalies, 2)]
+        'percentage_anomalies': [round(percentage_anomalies, 2)],
+        **significance
     })
     anomaly_data_filename = f"{company_name}_Anomalies.csv"
     anomaly_data_path = os.path.join(folder_path, anomaly_data_filename)
@@ -79,7 +99,7 @@ def save_results(company_name, product_name, avg_rating_anomalies, avg_rating_no
     print(f"Anomaly data saved to {anomaly_data_path}")
 
 def main():
-    input_filename, foldername = get_filename()
+    input_filename, foldername, plots = get_filename()
     filename = os.path.join(f'./{foldername}_Collected_Reviews', input_filename)
     company_name = input_filename.split('.')[0]
     folder_path = f'./results/{company_name}'
@@ -92,10 +112,13 @@ def main():
     daily_reviews = detect_anomalies(daily_reviews)
     
     avg_rating_anomalies, avg_rating_non_anomalies, percentage_anomalies, high_review_dates = calculate_statistics(df, daily_reviews)
+    significance = calculate_significance(df, daily_reviews)
     
-    plot_results(daily_reviews, high_review_dates, company_name, folder_path)
+    save_daily_reviews(daily_reviews, company_name, folder_path)
+    if plots:
+        plot_results(daily_reviews, high_review_dates, company_name, folder_path)
     product_name = df['product_name'].iloc[0],
-    save_results(company_name, product_name, avg_rating_anomalies, avg_rating_non_anomalies, percentage_anomalies, folder_path)
+    save_results(company_name, product_name, avg_rating_anomalies, avg_rating_non_anomalies, percentage_anomalies, significance, folder_path)
 
 if __name__ == "__main__":
     main()
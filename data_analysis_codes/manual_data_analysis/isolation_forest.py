@@ -30,7 +30,7 @@ def compute_rolling_mean(daily_reviews, window=3):
 
 def detect_anomalies(daily_reviews):
     X = daily_reviews[['review_count', 'rolling_mean']]
-    model = IsolationForest(contamination=0.05)
+    model = IsolationForest(contamination=0.05, random_state=0)
     model.fit(X)
     daily_reviews['anomaly'] = model.predict(X)
     daily_reviews['anomaly'] = daily_reviews['anomaly'].map({1: 0, -1: 1})
@@ -0,0 +1,177 @@
+import os
+import time
+import argparse
+import numpy as np
+import pandas as pd
+from scipy.special import xlogy
+from scipy.stats import poisson
+from review_loader import load_reviews, day_to_timestamp
+from significance import RATING_VALUES, N_RESAMPLES, compare_many
+from batch_analysis import list_review_files
+
+# Review bursts of every product over several window lengths at once. The daily review counts and rating sums of all
+# products are one product x day matrix, and every window length is scanned with prefix sums in a few vectorized
+# passes. The fullest window of each length is the one with the highest Kulldorff Poisson scan statistic (llr); its
+# p-value is corrected for the number of windows scanned.
+
+WINDOWS = [1, 3, 7, 14, 30]
+
+def get_args():
+    parser = argparse.ArgumentParser(description='Scan every product for review bursts over several window lengths at once.')
+    parser.add_argument('foldernames', type=str, nargs='+', help='The names of the folders, ex. Coupang Saladlab Crema')
+    parser.add_argument('--windows', type=int, nargs='+', default=WINDOWS, help='Window lengths in days')
+    parser.add_argument('--resamples', type=int, default=N_RESAMPLES, help='Significance resamples per product and window, 0 to skip')
+    return parser.parse_args()
+
+def create_folder(folder_path):
+    if not os.path.exists(folder_path):
+        os.makedirs(folder_path)
+
+def load_catalog(foldernames):
+    # Review days and ratings of every product, concatenated, with the product index of each review
+    names, days, ratings, products = [], [], [], []
+    for foldername in foldernames:
+        folder_path = f'./{foldername}_Collected_Reviews'
+        for filename in sorted(list_review_files(foldername, folder_path)):
+            df = load_reviews(os.path.join(folder_path, filename))
+            df = df.dropna(subset=['review_day'])
+            if df.empty:
+                continue
+            products.append(np.full(len(df), len(names), dtype=np.int64))
+            names.append((filename.split('.')[0], df['product_name'].iloc[0]))
+            days.append(df['review_day'].to_numpy(dtype=np.int64))
+            ratings.append(df['rating'].astype('float64').to_numpy())
+    if not names:
+        return names, np.empty(0, dtype=np.int64), np.empty(0, dtype=np.int64), np.empty(0)
+    return names, np.concatenate(products), np.concatenate(days), np.concatenate(ratings)
+
+def daily_matrices(product, day, rating, n_products):
+    # Product x day matrices of review counts, rating sums and rated reviews, all products on the same calendar
+    first_day = int(day.min())
+    n_days = int(day.max()) - first_day + 1
+    cell = product * n_days + (day - first_day)
+    rated = ~np.isnan(rating)
+    counts = np.bincount(cell, minlength=n_products * n_days).reshape(n_products, n_days)
+    rating_sums = np.bincount(cell[rated], weights=rating[rated], minlength=n_products * n_days).reshape(n_products, n_days)
+    rated_counts = np.bincount(cell[rated], minlength=n_products * n_days).reshape(n_products, n_days)
+    return first_day, counts, rating_sums, rated_counts
+
+def prefix_sums(matrix):
+    # Column t holds the sum of days [0, t), so any window is the difference of two columns
+    prefix = np.zeros((matrix.shape[0], matrix.shape[1] + 1), dtype=np.float64 if matrix.dtype.kind == 'f' else np.int64)
+    np.cumsum(matrix, axis=1, out=prefix[:, 1:])
+    return prefix
+
+def window_llr(counts, expected, totals):
+    # Kulldorff's Poisson scan statistic: likelihood ratio of a higher rate inside the window than outside it
+    outside = totals - counts
+    llr = xlogy(counts, counts / expected) + xlogy(outside, outside / np.maximum(totals - expected, 1e-12))
+    return np.where(counts > expected, llr, 0.0)
+
+def scan(product, day, rating, n_products, windows=WINDOWS):
+    # Every window length from the same prefix sums; each one is a single vectorized pass over the product x day matrix
+    first_day, counts, rating_sums, rated_counts = daily_matrices(product, day, rating, n_products)
+    prefix_counts, prefix_ratings, prefix_rated = prefix_sums(counts), prefix_sums(rating_sums), prefix_sums(rated_counts)
+    first = np.full(n_products, counts.shape[1])
+    last = np.full(n_products, -1)
+    np.minimum.at(first, product, day - first_day)
+    np.maximum.at(last, product, day - first_day)
+    span = last - first + 1
+    totals = prefix_counts[:, -1].astype(np.float64)
+    rows = np.arange(n_products)
+
+    results = {}
+    for window in windows:
+        best = np.zeros(n_products, dtype=np.int64)
+        scanned = np.clip(span - window + 1, 0, None)
+        if window <= counts.shape[1]:
+            # Within a product the statistic only grows with the window count, so the fullest window is the most anomalous
+            window_counts = prefix_counts[:, window:] - prefix_counts[:, :-window]
+            starts = np.arange(window_counts.shape[1])
+            inside = (starts >= first[:, None]) & (starts + window - 1 <= last[:, None])
+            best = np.argmax(np.where(inside, window_counts, -1), axis=1)
+        end = np.minimum(best + window, counts.shape[1])
+        window_reviews = prefix_counts[rows, end] - prefix_counts[rows, best]
+        window_rating_sum = prefix_ratings[rows, end] - prefix_ratings[rows, best]
+        window_rated = prefix_rated[rows, end] - prefix_rated[rows, best]
+        expected_reviews = totals / span * window
+        with np.errstate(invalid='ignore', divide='ignore'):
+            best_llr = np.where(scanned > 0, window_llr(window_reviews.astype(np.float64), expected_reviews, totals), np.nan)
+        results[window] = {
+            'window_start_day': best + first_day,
+            'window_reviews': window_reviews,
+            'expected_reviews': expected_reviews,
+            'llr': best_llr,
+            'windows_scanned': scanned,
+            'rating_sum': window_rating_sum,
+            'rated': window_rated,
+        }
+    total_ratings = prefix_ratings[:, -1], prefix_rated[:, -1]
+    return first_day, total_ratings, results
+
+def window_histograms(product, day, rating, n_products, start_day, window):
+    # Rating counts of the reviews inside each product's window and of all its reviews
+    rated = ~np.isnan(rating)
+    codes = np.clip(np.round(rating[rated]), RATING_VALUES[0], RATING_VALUES[-1]).astype(np.int64) - RATING_VALUES[0]
+    product, day = product[rated], day[rated]
+    inside = (day >= start_day[product]) & (day < start_day[product] + window)
+    size = n_products * len(RATING_VALUES)
+    all_reviews = np.bincount(product * len(RATING_VALUES) + codes, minlength=size).reshape(n_products, -1)
+    in_window = np.bincount(product[inside] * len(RATING_VALUES) + codes[inside], minlength=size).reshape(n_products, -1)
+    return in_window, all_reviews - in_window
+
+def result_table(names, product, day, rating, windows, resamples):
+    n_products = len(names)
+    start = time.perf_counter()
+    first_day, (total_rating_sum, total_rated), results = scan(product, day, rating, n_products, windows)
+    print(f"Scanned {n_products} products x {len(windows)} window lengths in {time.perf_counter() - start:.2f}s")
+
+    tables = []
+    for window, r in results.items():
+        with np.errstate(invalid='ignore', divide='ignore'):
+            # Chance of a window this full under the product's average rate, Bonferroni-corrected for the windows scanned
+            p_value = np.minimum(poisson.sf(r['window_reviews'] - 1, r['expected_reviews']) * np.maximum(r['windows_scanned'], 1), 1)
+            table = pd.DataFrame({
+                'company_name': [name[0] for name in names],
+                'product_name': [name[1] for name in names],
+                'window_days': window,
+                'window_start': day_to_timestamp(r['window_start_day']).date,
+                'window_reviews': r['window_reviews'],
+                'expected_reviews': np.round(r['expected_reviews'], 2),
+                'burst_ratio': np.round(r['window_reviews'] / r['expected_reviews'], 2),
+                'llr': np.round(r['llr'], 2),
+                'window_p_value': np.round(p_value, 4),
+                'avg_rating_in_window': np.round(r['rating_sum'] / r['rated'], 2),
+                'avg_rating_outside_window': np.round((total_rating_sum - r['rating_sum']) / (total_rated - r['rated']), 2),
+            })
+        if resamples:
+            hist_in, hist_out = window_histograms(product, day, rating, n_products, r['window_start_day'], window)
+            significance = compare_many(hist_in, hist_out, resamples)
+            table['rating_diff_in_window_p_value'] = np.round(significance[:, 0], 4)
+            table['rating_diff_in_window_ci_low'] = np.round(significance[:, 1], 2)
+            table['rating_diff_in_window_ci_high'] = np.round(significance[:, 2], 2)
+        # Products whose reviews span fewer days than the window have no window of that length
+        table.loc[np.isnan(r['llr']), table.columns[4:].drop(['expected_reviews', 'llr'])] = np.nan
+        table['window_reviews'] = table['window_reviews'].astype('Int64')
+        tables.append(table)
+    return pd.concat(tables).sort_values(['company_name', 'window_days'], kind='stable')
+
+def save_results(results_df):
+    for company_name, rows in results_df.groupby('company_name', sort=False):
+        folder_path = f'./results/{company_name}'
+        create_folder(folder_path)
+        output_path = os.path.join(folder_path, f"{company_name}_multiscale_bursts.csv")
+        rows.to_csv(output_path, index=False)
+        print(f"CSV file saved to {output_path}")
+
+def main():
+    args = get_args()
+    names, product, day, rating = load_catalog(args.foldernames)
+    if not names:
+        print("No dated reviews found")
+        return
+    results_df = result_table(names, product, day, rating, sorted(args.windows), args.resamples)
+    save_results(results_df)
+
+if __name__ == "__main__":
+    main()
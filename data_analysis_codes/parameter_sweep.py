@@ -0,0 +1,235 @@
+import os
+import json
+import math
+import time
+import argparse
+import itertools
+import numpy as np
+import pandas as pd
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor
+from sklearn.ensemble import IsolationForest
+from nltk.util import ngrams
+from review_loader import load_reviews
+from significance import RATING_VALUES, N_RESAMPLES, compare_histograms
+from text_cache import normalize_reviews, open_cache, DEFAULT_CACHE_PATH
+from isolation_forest import preprocess_data, compute_daily_reviews, compute_rolling_mean
+from rating_trend_analysis import get_review_counts, add_missing_dates, fit_poisson_model
+from batch_analysis import list_review_files
+
+# Parameter sweeps of the isolation forest (window, contamination), the Poisson threshold (poisson_ceiling) and the phrase
+# detector (min_length, min_freq, max_n). The daily series, forest scores and n-gram counts are computed once per
+# product and shared by every grid point.
+
+# Each detector is swept over its own parameters only; the values used by the analyzer scripts are always included
+DEFAULT_GRID = {
+    'window': [3, 7, 14],
+    'contamination': [0.01, 0.02, 0.05, 0.1, 0.2],
+    'poisson_ceiling': [True, False],
+    'min_length': [2, 3, 4],
+    'min_freq': [2, 3, 5, 10],
+    'max_n': [4, 5],
+}
+DETECTORS = {
+    'anomalies': ['window', 'contamination'],
+    'rating_trend': ['poisson_ceiling'],
+    'phrase_repetition': ['min_length', 'min_freq', 'max_n'],
+}
+
+def get_args():
+    parser = argparse.ArgumentParser(description='Evaluate the burst and phrase detectors over a parameter grid.')
+    parser.add_argument('foldername', type=str, help='The name of the folder, ex. Coupang')
+    parser.add_argument('filenames', type=str, nargs='*', help='Only these CSV files (default: every file of the folder)')
+    parser.add_argument('--grid', type=str, default=None, help='JSON object or JSON file of parameter lists, merged over the default grid')
+    parser.add_argument('--workers', type=int, default=None, help='Products evaluated in parallel (default: all cores)')
+    parser.add_argument('--resamples', type=int, default=N_RESAMPLES, help='Significance resamples per grid point, 0 to skip')
+    parser.add_argument('--seed', type=int, default=0, help='Random state of the isolation forests')
+    parser.add_argument('--text-cache', type=str, default=DEFAULT_CACHE_PATH, help='Cache of normalized and tokenized reviews, empty to disable')
+    return parser.parse_args()
+
+def create_folder(folder_path):
+    if not os.path.exists(folder_path):
+        os.makedirs(folder_path)
+
+def load_grid(grid_arg):
+    grid = dict(DEFAULT_GRID)
+    if grid_arg:
+        if os.path.exists(grid_arg):
+            with open(grid_arg, encoding='utf-8') as f:
+                grid.update(json.load(f))
+        else:
+            grid.update(json.loads(grid_arg))
+    return grid
+
+def grid_points(grid, detector):
+    names = DETECTORS[detector]
+    points = [dict(zip(names, values)) for values in itertools.product(*(grid[name] for name in names))]
+    if detector == 'phrase_repetition':
+        points = [p for p in points if p['min_length'] <= p['max_n']]
+    return points
+
+def rating_codes(ratings):
+    # Index into RATING_VALUES per review, -1 for a missing rating
+    ratings = ratings.astype('float64').round().clip(RATING_VALUES[0], RATING_VALUES[-1])
+    return ratings.fillna(RATING_VALUES[0] - 1).to_numpy().astype(np.int64) - RATING_VALUES[0]
+
+def histogram_of(codes, mask):
+    selected = codes[mask]
+    return np.bincount(selected[selected >= 0], minlength=len(RATING_VALUES))
+
+def mean_of(histogram):
+    total = histogram.sum()
+    return histogram @ RATING_VALUES / total if total else np.nan
+
+def daily_rating_histograms(days, codes):
+    # (distinct days, rating values) counts, rows in the order of np.unique(days)
+    unique_days, day_index = np.unique(days, return_inverse=True)
+    valid = codes >= 0
+    flat = np.bincount(day_index[valid] * len(RATING_VALUES) + codes[valid], minlength=len(unique_days) * len(RATING_VALUES))
+    return unique_days, flat.reshape(len(unique_days), len(RATING_VALUES))
+
+def phrase_inputs(tokens, min_n, max_n):
+    # n-gram counts are computed once for every n in the grid; per review, the highest count among its n-grams for each n
+    counts = Counter()
+    for token_list in tokens:
+        for n in range(min_n, max_n + 1):
+            counts.update(ngrams(token_list, n))
+    review_max = np.zeros((len(tokens), max_n + 1), dtype=np.int64)
+    for i, token_list in enumerate(tokens):
+        for n in range(min_n, max_n + 1):
+            review_max[i, n] = max((counts[gram] for gram in ngrams(token_list, n)), default=0)
+    count_by_n = [np.sort(np.array([c for gram, c in counts.items() if len(gram) == n], dtype=np.int64)) for n in range(max_n + 1)]
+    return review_max, count_by_n
+
+def product_inputs(df, tokens, grid, seed):
+    # Everything the grid points share: the daily series, per-day rating histograms, forest scores and n-gram counts
+    dated = preprocess_data(df)
+    codes = rating_codes(df['rating'])
+    dated_codes = rating_codes(dated['rating'])
+    dated_days = dated['review_day'].to_numpy(dtype=np.int64)
+    unique_days, day_histograms = daily_rating_histograms(dated_days, dated_codes)
+
+    daily_reviews = compute_daily_reviews(dated)
+    forest_scores = {}
+    for window in grid['window']:
+        series = compute_rolling_mean(daily_reviews.copy(), window=window)
+        X = series[['review_count', 'rolling_mean']]
+        # contamination only sets the score threshold, so one forest per window serves every contamination value
+        forest_scores[window] = IsolationForest(random_state=seed).fit(X).score_samples(X)
+
+    review_counts_df = add_missing_dates(get_review_counts(dated))
+    max_mu = fit_poisson_model(review_counts_df).mu.max()
+
+    review_max, count_by_n = phrase_inputs(tokens, min(grid['min_length']), max(grid['max_n']))
+    return {
+        'codes': codes,
+        'unique_days': unique_days,
+        'day_histograms': day_histograms,
+        'daily_days': daily_reviews['review_day'].to_numpy(dtype=np.int64),
+        'forest_scores': forest_scores,
+        'review_counts': review_counts_df,
+        'max_mu': max_mu,
+        'dated_reviews': len(dated),
+        'review_max': review_max,
+        'count_by_n': count_by_n,
+    }
+
+def significance_values(metric, hist_a, hist_b, resamples):
+    if not resamples:
+        return {}
+    p_value, ci_low, ci_high = compare_histograms(hist_a, hist_b, resamples, 0)[0]
+    return {f'{metric}_p_value': round(p_value, 4), f'{metric}_ci_low': round(ci_low, 2), f'{metric}_ci_high': round(ci_high, 2)}
+
+def day_split(inputs, flagged_days):
+    in_flagged = np.isin(inputs['unique_days'], flagged_days)
+    return inputs['day_histograms'][in_flagged].sum(axis=0), inputs['day_histograms'][~in_flagged].sum(axis=0)
+
+def evaluate_anomalies(inputs, point, resamples):
+    scores = inputs['forest_scores'][point['window']]
+    # Same rule as IsolationForest(contamination=c).predict: anomalous below the c-th percentile of the scores
+    anomaly = scores < np.percentile(scores, 100.0 * point['contamination'])
+    hist_a, hist_b = day_split(inputs, inputs['daily_days'][anomaly])
+    return {
+        'avg_rating_anomalies': round(mean_of(hist_a), 2),
+        'avg_rating_non_anomalies': round(mean_of(hist_b), 2),
+        'percentage_anomalies': round(anomaly.sum() / len(anomaly) * 100, 2),
+        **significance_values('rating_diff_anomalies', hist_a, hist_b, resamples),
+    }
+
+def evaluate_rating_trend(inputs, point, resamples):
+    max_reviews_per_day = math.ceil(inputs['max_mu']) if point['poisson_ceiling'] else inputs['max_mu']
+    review_counts_df = inputs['review_counts']
+    higher = review_counts_df[review_counts_df['review_count'] > max_reviews_per_day]
+    hist_a, hist_b = day_split(inputs, higher['review_day'].to_numpy())
+    return {
+        'max_reviews_per_day': round(max_reviews_per_day, 2),
+        'num_dates_higher_than_max': len(higher),
+        'total_reviews_higher_than_max': int(higher['review_count'].sum()),
+        'high_volume_review_percentage': round(higher['review_count'].sum() / inputs['dated_reviews'] * 100, 2),
+        'avg_ratings_higher_than_max': round(mean_of(hist_a), 2),
+        'avg_ratings_lower_than_max': round(mean_of(hist_b), 2),
+        **significance_values('rating_diff_higher_than_max', hist_a, hist_b, resamples),
+    }
+
+def evaluate_phrase_repetition(inputs, point, resamples):
+    lengths = range(point['min_length'], point['max_n'] + 1)
+    with_phrase = inputs['review_max'][:, lengths.start:lengths.stop].max(axis=1) >= point['min_freq']
+    common = sum(len(c) - np.searchsorted(c, point['min_freq']) for c in inputs['count_by_n'][lengths.start:lengths.stop])
+    hist_a, hist_b = histogram_of(inputs['codes'], with_phrase), histogram_of(inputs['codes'], ~with_phrase)
+    return {
+        'common_phrases': int(common),
+        'ratings_with_phrases': round(mean_of(hist_a), 2),
+        'ratings_without_phrases': round(mean_of(hist_b), 2),
+        'percentage_of_review_w_common_phrases': round(with_phrase.sum() / len(with_phrase) * 100, 2) if len(with_phrase) else np.nan,
+        **significance_values('rating_diff_with_phrases', hist_a, hist_b, resamples),
+    }
+
+EVALUATORS = {
+    'anomalies': evaluate_anomalies,
+    'rating_trend': evaluate_rating_trend,
+    'phrase_repetition': evaluate_phrase_repetition,
+}
+
+def sweep_product(task):
+    file_path, grid, resamples, seed, text_cache_path = task
+    company_name = os.path.basename(file_path).split('.')[0]
+    start = time.perf_counter()
+    df = load_reviews(file_path)
+    cache = open_cache(text_cache_path)
+    tokens = normalize_reviews(df['review_content'], cache, tokenize=True)['tokens'].tolist()
+    inputs = product_inputs(df, tokens, grid, seed)
+    shared_time = time.perf_counter() - start
+
+    rows = {}
+    for detector, evaluate in EVALUATORS.items():
+        rows[detector] = [{'company_name': company_name, 'product_name': df['product_name'].iloc[0], **point, **evaluate(inputs, point, resamples)}
+                          for point in grid_points(grid, detector)]
+    print(f"{company_name}: shared inputs {shared_time:.2f}s, {sum(len(r) for r in rows.values())} grid points "
+          f"{time.perf_counter() - start - shared_time:.2f}s")
+    return rows
+
+def run_sweep(file_paths, grid, resamples=N_RESAMPLES, seed=0, text_cache_path=DEFAULT_CACHE_PATH, workers=None):
+    tasks = [(path, grid, resamples, seed, text_cache_path) for path in file_paths]
+    workers = workers or os.cpu_count()
+    if workers == 1 or len(tasks) <= 1:
+        results = [sweep_product(task) for task in tasks]
+    else:
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            results = list(executor.map(sweep_product, tasks))
+    return {detector: pd.DataFrame([row for result in results for row in result[detector]]) for detector in EVALUATORS}
+
+def main():
+    args = get_args()
+    folder_path = f'./{args.foldername}_Collected_Reviews'
+    filenames = args.filenames or list_review_files(args.foldername, folder_path)
+    grid = load_grid(args.grid)
+    tables = run_sweep([os.path.join(folder_path, f) for f in filenames], grid, args.resamples, args.seed, args.text_cache, args.workers)
+
+    create_folder('./results')
+    for detector, table in tables.items():
+        output_path = f'./results/{args.foldername}_parameter_sweep_{detector}.csv'
+        table.to_csv(output_path, index=False)
+        print(f"CSV file saved to {output_path}")
+
+if __name__ == "__main__":
+    main()
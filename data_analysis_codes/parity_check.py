@@ -0,0 +1,327 @@
+import os
+import io
+import sys
+import glob
+import json
+import time
+import shutil
+import argparse
+import builtins
+import tempfile
+import importlib
+import contextlib
+import subprocess
+import numpy as np
+import pandas as pd
+
+# Golden-output check for the optimized analyzers. The reference scripts in manual_data_analysis and the current
+# analyzers (once per variant, ex. with the on-disk phrase count) are run on the same products; every metric the
+# reference writes must match within its declared tolerance, and the columns of the collected_data results must be there.
+# Each analyzer runs in its own process and its import and run times are compared with a saved baseline. The isolation
+# forests use a fixed random_state, so their results can be compared.
+
+CODE_DIR = os.path.dirname(os.path.abspath(__file__))
+REFERENCE_DIR = os.path.join(CODE_DIR, 'manual_data_analysis')
+COLLECTED_DIR = os.path.join(os.path.dirname(CODE_DIR), 'collected_data')
+# Analyzer -> its result file, results/<company>/<company>_<suffix>.csv
+ANALYZERS = {
+    'unique_review_analysis': 'unique_nonunique',
+    'isolation_forest': 'Anomalies',
+    'phrase_repetition_analysis': 'phrase_repetition',
+    'rating_trend_analysis': 'rating_trend',
+}
+# Largest accepted absolute difference of a metric; every other column must be equal. The results are rounded to two
+# decimals, so 0.01 only allows a different rounding of the last digit
+TOLERANCES = {
+    'avg_ratings_unique': 0.01,
+    'avg_ratings_non_unique': 0.01,
+    'percentage_non_unique': 0.01,
+    'avg_rating_anomalies': 0.01,
+    'avg_rating_non_anomalies': 0.01,
+    'percentage_anomalies': 0.01,
+    'ratings_with_phrases': 0.01,
+    'ratings_without_phrases': 0.01,
+    'percentage_of_review_w_common_phrases': 0.01,
+    'high_volume_review_percentage': 0.01,
+    'avg_ratings_higher_than_max': 0.01,
+    'avg_ratings_lower_than_max': 0.01,
+}
+# Paths checked against the reference: extra arguments per analyzer, environment, and commands run in the variant's
+# folder first ({folder} is the review folder name)
+VARIANTS = {
+    'default': {},
+    'no_text_cache': {'args': {'phrase_repetition_analysis': ['--text-cache', '']}},
+    'external_ngrams': {'args': {'phrase_repetition_analysis': ['--max-memory-mb', '0.05']}},
+    'sharded': {'args': {'phrase_repetition_analysis': ['--workers', '2'], 'unique_review_analysis': ['--workers', '2']}},
+    'phrase_index': {'args': {'phrase_repetition_analysis': ['--phrase-index']}},
+    'warehouse': {
+        'setup': [['review_warehouse', 'build', '{folder}', '--warehouse', './review_warehouse']],
+        'env': {'REVIEW_WAREHOUSE': './review_warehouse'},
+    },
+}
+# Synthetic products shaped like the collected sources: file name, layout, reviews, days, seed
+PRODUCTS = [
+    ('saladlab_small', 'saladlab', 300, 90, 1),
+    ('saladlab_large', 'saladlab', 20000, 1500, 2),
+    ('crema_no_name', 'crema', 3000, 600, 3),
+    ('coupang_medium', 'coupang', 5000, 800, 4),
+    ('coupang_sparse', 'coupang', 150, 2000, 5),
+]
+FOLDER = 'Parity'
+# A stage fails the gate when it is more than REGRESSION_THRESHOLD (ratio) and MIN_REGRESSION_SECONDS slower than its
+# baseline; STAGE_THRESHOLDS overrides the ratio of single stages, ex. {'default/phrase_repetition_analysis/run': 0.5}
+REGRESSION_THRESHOLD = 0.25
+MIN_REGRESSION_SECONDS = 0.5
+STAGE_THRESHOLDS = {}
+
+def get_args():
+    parser = argparse.ArgumentParser(description='Compare the analyzers with the reference scripts and gate their timings.')
+    parser.add_argument('--folders', type=str, nargs='*', default=[], help='Also check the products of these folders, ex. Coupang (from the current folder)')
+    parser.add_argument('--no-synthetic', action='store_true', help='Only check the products of --folders')
+    parser.add_argument('--variants', type=str, nargs='+', default=sorted(VARIANTS), choices=sorted(VARIANTS), help='The analyzer variants to check')
+    parser.add_argument('--analyzers', type=str, nargs='+', default=list(ANALYZERS), choices=list(ANALYZERS), help='The analyzers to check')
+    parser.add_argument('--repeat', type=int, default=3, help='Runs of every analyzer on each product; the fastest is kept')
+    parser.add_argument('--baseline', type=str, default='./parity_baseline.json', help='Stage timings to compare with')
+    parser.add_argument('--save-baseline', action='store_true', help='Save the timings of this run as the baseline')
+    parser.add_argument('--threshold', type=float, default=REGRESSION_THRESHOLD, help='Allowed slowdown of a stage, ex. 0.25 for 25%%')
+    parser.add_argument('--workdir', type=str, default=None, help='Keep the inputs and outputs in this folder (default: a temporary folder)')
+    parser.add_argument('--run-stage', type=str, default=None, help=argparse.SUPPRESS)
+    return parser.parse_args()
+
+def create_folder(folder_path):
+    if not os.path.exists(folder_path):
+        os.makedirs(folder_path)
+
+def make_product(layout, n_reviews, n_days, seed):
+    from benchmark import make_synthetic_reviews
+    df = make_synthetic_reviews(n_reviews, n_days, seed)
+    if layout == 'saladlab':
+        return df
+    # Crema and Coupang write dates as 2024.07.14
+    df['review_date'] = df['review_date'].str.replace('-', '.')
+    if layout == 'crema':
+        df['product_name'] = np.nan
+        return df
+    rng = np.random.default_rng(seed)
+    return pd.DataFrame({
+        'review_uid': df['review_uid'],
+        'username_2': df['username_2'],
+        'user_uid': rng.integers(10000000, 99999999, n_reviews),
+        'rating': df['rating'],
+        'product_name': df['product_name'],
+        'review_date': df['review_date'],
+        'seller_name': '테스트 판매자',
+        'review_title': 'N/A',
+        'review_content': df['review_content'],
+        'survey_answer': 'N/A',
+    })
+
+def prepare_inputs(input_root, folders, synthetic):
+    # <folder>_Collected_Reviews of the synthetic products and of the given folders, all in input_root
+    groups = []
+    if synthetic:
+        folder_path = os.path.join(input_root, f'{FOLDER}_Collected_Reviews')
+        create_folder(folder_path)
+        for name, layout, n_reviews, n_days, seed in PRODUCTS:
+            make_product(layout, n_reviews, n_days, seed).to_csv(os.path.join(folder_path, f'{name}.csv'), index=False)
+        groups.append(FOLDER)
+    for foldername in folders:
+        shutil.copytree(f'./{foldername}_Collected_Reviews', os.path.join(input_root, f'{foldername}_Collected_Reviews'), dirs_exist_ok=True)
+        groups.append(foldername)
+    return groups
+
+def prepare_run_folder(run_root, input_root, groups):
+    # A fresh folder, so that results of an earlier run in the same --workdir are never compared
+    if os.path.exists(run_root):
+        shutil.rmtree(run_root)
+    create_folder(run_root)
+    for foldername in groups:
+        link = os.path.join(run_root, f'{foldername}_Collected_Reviews')
+        if not os.path.exists(link):
+            os.symlink(os.path.join(input_root, f'{foldername}_Collected_Reviews'), link)
+
+def run_stage(spec):
+    # Runs in its own process, from the folder the results go to: imports the analyzer and calls main() for each
+    # product, keeping the fastest of spec['repeat'] runs
+    sys.path.insert(0, spec['code_dir'])
+    start = time.perf_counter()
+    module = importlib.import_module(spec['module'])
+    timings = {'import': time.perf_counter() - start, 'run': 0.0}
+    for filename in spec['filenames']:
+        best = float('inf')
+        for _ in range(spec['repeat']):
+            if spec['reference']:
+                # The reference scripts ask for the file and the folder
+                answers = [filename, spec['folder']]
+                builtins.input = lambda prompt='': answers.pop(0)
+            else:
+                sys.argv = [spec['module'] + '.py', filename, spec['folder']] + spec['args']
+            start = time.perf_counter()
+            with contextlib.redirect_stdout(io.StringIO()):
+                module.main()
+            best = min(best, time.perf_counter() - start)
+        timings['run'] += best
+    print(json.dumps(timings))
+
+def run_analyzer(run_root, module, foldername, filenames, reference, repeat=1, args=(), env=None):
+    spec = {
+        'code_dir': REFERENCE_DIR if reference else CODE_DIR,
+        'module': module,
+        'folder': foldername,
+        'filenames': filenames,
+        'reference': reference,
+        'repeat': repeat,
+        'args': list(args),
+    }
+    process_env = dict(os.environ, MPLBACKEND='Agg', **(env or {}))
+    result = subprocess.run([sys.executable, os.path.abspath(__file__), '--run-stage', json.dumps(spec)], cwd=run_root,
+                            env=process_env, capture_output=True, text=True)
+    if result.returncode != 0:
+        raise RuntimeError(f"{module} failed in {run_root}:\n{result.stderr[-2000:]}")
+    return json.loads(result.stdout.strip().splitlines()[-1])
+
+def run_setup(run_root, variant, groups):
+    for command in VARIANTS[variant].get('setup', []):
+        for foldername in groups:
+            argv = [part.format(folder=foldername) for part in command[1:]]
+            subprocess.run([sys.executable, os.path.join(CODE_DIR, command[0] + '.py')] + argv, cwd=run_root,
+                           check=True, stdout=subprocess.DEVNULL)
+
+def run_all(run_root, groups, product_files, analyzers, reference, repeat, variant=None):
+    # Import and run time of each analyzer over all products
+    timings = {}
+    settings = {} if reference else VARIANTS[variant]
+    name = 'reference' if reference else variant
+    for module in analyzers:
+        timings[f'{name}/{module}/import'] = 0.0
+        timings[f'{name}/{module}/run'] = 0.0
+        for foldername in groups:
+            stage = run_analyzer(run_root, module, foldername, product_files[foldername], reference, repeat,
+                                 settings.get('args', {}).get(module, []), settings.get('env'))
+            timings[f'{name}/{module}/import'] = max(timings[f'{name}/{module}/import'], stage['import'])
+            timings[f'{name}/{module}/run'] += stage['run']
+    return timings
+
+def collected_columns(suffix):
+    # Columns of the result tables in collected_data, which every run must still produce
+    columns = set()
+    for path in glob.glob(os.path.join(COLLECTED_DIR, '*_results', f'*_{suffix}.csv')):
+        columns.update(pd.read_csv(path, nrows=0).columns)
+    return columns
+
+def as_text(values):
+    # The reference writes product_name as the repr of its groupby key, which under numpy 2 reads (np.float64(nan),)
+    return values.astype(str).str.replace(r'np\.\w+\(([^()]*)\)', r'\1', regex=True)
+
+def values_match(reference, candidate, tolerance):
+    if tolerance is None:
+        return as_text(reference).equals(as_text(candidate))
+    reference = pd.to_numeric(reference, errors='coerce').to_numpy(dtype=np.float64)
+    candidate = pd.to_numeric(candidate, errors='coerce').to_numpy(dtype=np.float64)
+    both_nan = np.isnan(reference) & np.isnan(candidate)
+    # A small epsilon so that a difference of exactly one rounding step passes despite float error
+    return bool(np.all(both_nan | (np.abs(reference - candidate) <= tolerance + 1e-9)))
+
+def compare_results(reference_root, candidate_root, variant, groups, product_files, analyzers):
+    mismatches = []
+    for module in analyzers:
+        suffix = ANALYZERS[module]
+        required = collected_columns(suffix)
+        for foldername in groups:
+            for filename in product_files[foldername]:
+                company_name = filename.split('.')[0]
+                relative = os.path.join('results', company_name, f'{company_name}_{suffix}.csv')
+                where = f"{variant} {foldername}/{filename} {suffix}"
+                reference_path = os.path.join(reference_root, relative)
+                candidate_path = os.path.join(candidate_root, relative)
+                if not os.path.exists(candidate_path):
+                    mismatches.append(f"{where}: {relative} was not written")
+                    continue
+                reference = pd.read_csv(reference_path)
+                candidate = pd.read_csv(candidate_path)
+                missing = sorted((required | set(reference.columns)) - set(candidate.columns))
+                if missing:
+                    mismatches.append(f"{where}: missing columns {missing}")
+                if len(reference) != len(candidate):
+                    mismatches.append(f"{where}: {len(candidate)} rows instead of {len(reference)}")
+                    continue
+                for column in reference.columns:
+                    if column in candidate.columns and not values_match(reference[column], candidate[column], TOLERANCES.get(column)):
+                        mismatches.append(f"{where}: {column} {reference[column].tolist()} != {candidate[column].tolist()}"
+                                          f" (tolerance {TOLERANCES.get(column, 'exact')})")
+    return mismatches
+
+def check_regressions(timings, baseline, threshold):
+    regressions = []
+    for stage, seconds in sorted(timings.items()):
+        if stage.startswith('reference/') or stage not in baseline:
+            continue
+        allowed = baseline[stage] * (1 + STAGE_THRESHOLDS.get(stage, threshold))
+        if seconds > allowed and seconds - baseline[stage] > MIN_REGRESSION_SECONDS:
+            regressions.append(f"{stage}: {seconds:.2f}s, baseline {baseline[stage]:.2f}s (allowed {allowed:.2f}s)")
+    return regressions
+
+def print_timings(timings, baseline):
+    print(f"{'stage':55s} {'seconds':>8s} {'baseline':>9s} {'vs reference':>13s}")
+    for stage, seconds in sorted(timings.items()):
+        _, module, key = stage.split('/')
+        reference = timings.get(f'reference/{module}/{key}')
+        speedup = f"{reference / seconds:.1f}x" if reference and seconds and not stage.startswith('reference/') else ''
+        previous = f"{baseline[stage]:.2f}" if stage in baseline else ''
+        print(f"{stage:55s} {seconds:8.2f} {previous:>9s} {speedup:>13s}")
+
+def check(args, workdir):
+    input_root = os.path.join(workdir, 'inputs')
+    groups = prepare_inputs(input_root, args.folders, not args.no_synthetic)
+    product_files = {foldername: sorted(f for f in os.listdir(os.path.join(input_root, f'{foldername}_Collected_Reviews')) if f.endswith('.csv'))
+                     for foldername in groups}
+    print(f"Checking {sum(len(files) for files in product_files.values())} products of {', '.join(groups)}")
+
+    reference_root = os.path.join(workdir, 'reference')
+    prepare_run_folder(reference_root, input_root, groups)
+    timings = run_all(reference_root, groups, product_files, args.analyzers, True, args.repeat)
+    mismatches = []
+    for variant in args.variants:
+        print(f"Running the {variant} variant")
+        variant_root = os.path.join(workdir, variant)
+        prepare_run_folder(variant_root, input_root, groups)
+        run_setup(variant_root, variant, groups)
+        timings.update(run_all(variant_root, groups, product_files, args.analyzers, False, args.repeat, variant))
+        mismatches += compare_results(reference_root, variant_root, variant, groups, product_files, args.analyzers)
+
+    baseline = {}
+    if os.path.exists(args.baseline):
+        with open(args.baseline, encoding='utf-8') as f:
+            baseline = json.load(f)
+    print_timings(timings, baseline)
+    regressions = check_regressions(timings, baseline, args.threshold)
+    if not baseline:
+        print(f"No baseline at {args.baseline}, timings were not gated")
+    if args.save_baseline:
+        with open(args.baseline, 'w', encoding='utf-8') as f:
+            json.dump({stage: seconds for stage, seconds in timings.items() if not stage.startswith('reference/')}, f, indent=1, sort_keys=True)
+        print(f"Baseline saved to {args.baseline}")
+
+    for mismatch in mismatches:
+        print(f"MISMATCH {mismatch}")
+    for regression in regressions:
+        print(f"REGRESSION {regression}")
+    print(f"{len(mismatches)} mismatches, {len(regressions)} regressions")
+    return not mismatches and not regressions
+
+def main():
+    args = get_args()
+    if args.run_stage:
+        run_stage(json.loads(args.run_stage))
+        return
+    sys.path.insert(0, CODE_DIR)
+    if args.workdir:
+        create_folder(args.workdir)
+        passed = check(args, os.path.abspath(args.workdir))
+    else:
+        with tempfile.TemporaryDirectory() as workdir:
+            passed = check(args, workdir)
+    sys.exit(0 if passed else 1)
+
+if __name__ == "__main__":
+    main()
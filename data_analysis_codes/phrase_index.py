@@ -0,0 +1,267 @@
+import os
+import json
+import time
+import argparse
+import numpy as np
+import pandas as pd
+from review_loader import load_reviews, day_to_timestamp
+from duplicate_index import review_uid_numbers
+from text_cache import normalize_review
+
+# Inverted index from the common phrases of one product to the reviews containing them, written by
+# phrase_repetition_analysis.py --phrase-index to results/<company>/<company>_phrase_index. phrases.npy has one row per
+# phrase, sorted by the hash of its text, with its counts and where its text (in texts.bin) and its sorted review
+# positions (in postings.npy) are; reviews.npy has the review_uid, rating and day of each review position. The files
+# are memory-mapped, so a query reads only the rows it needs instead of the product's reviews.
+
+PHRASE_DTYPE = np.dtype([('hash', '<u8'), ('freq', '<i8'), ('n_reviews', '<i8'), ('avg_rating', '<f8'),
+                         ('text_start', '<i8'), ('text_end', '<i8'), ('posting_start', '<i8'), ('posting_end', '<i8')])
+REVIEW_DTYPE = np.dtype([('review_uid', '<i8'), ('rating', '<f8'), ('day', '<f8')])
+HASH_KEY = 'phrase-index-v01'
+SORT_KEYS = ['freq', 'reviews', 'skew']
+TOP = 20
+MIN_REVIEWS_SKEW = 5
+PRINT_ROWS = 20
+REVIEW_COLUMNS = ['review_row', 'review_uid', 'review_date', 'rating']
+
+def get_args():
+    parser = argparse.ArgumentParser(description='Query the phrase indexes saved by phrase_repetition_analysis.py --phrase-index.')
+    subparsers = parser.add_subparsers(dest='command', required=True)
+    top = subparsers.add_parser('top', help='The most frequent phrases of a product, or those rated furthest from its average')
+    top.add_argument('company_name', type=str, help='The product, as the CSV file name without extension')
+    top.add_argument('--by', type=str, choices=SORT_KEYS, default='freq', help='freq: occurrences, reviews: reviews containing the phrase, skew: distance of their average rating from the product average')
+    top.add_argument('--k', type=int, default=TOP, help='Number of phrases')
+    top.add_argument('--min-reviews', type=int, default=None, help=f'Only phrases in at least this many reviews (default: {MIN_REVIEWS_SKEW} with --by skew, else 1)')
+    reviews = subparsers.add_parser('reviews', help='The reviews of a product that contain a phrase')
+    reviews.add_argument('company_name', type=str, help='The product, as the CSV file name without extension')
+    reviews.add_argument('phrase', type=str, help='The phrase; it is cleaned and tokenized like the reviews')
+    reviews.add_argument('--texts', action='store_true', help="Also read the review texts from the product's CSV (loads the file)")
+    shared = subparsers.add_parser('shared', help='The phrases common in both of two products')
+    shared.add_argument('company_a', type=str, help='The first product')
+    shared.add_argument('company_b', type=str, help='The second product')
+    for subparser in [top, reviews, shared]:
+        subparser.add_argument('--results', type=str, default='./results', help='The folder with one subfolder per product')
+        subparser.add_argument('--output', type=str, default=None, help='Also save the result table to this CSV file')
+    return parser.parse_args()
+
+def create_folder(folder_path):
+    if not os.path.exists(folder_path):
+        os.makedirs(folder_path)
+
+def index_folder(company_name, results='./results'):
+    return os.path.join(results, company_name, f'{company_name}_phrase_index')
+
+def hash_phrases(texts):
+    return pd.util.hash_array(np.asarray(texts, dtype=object), hash_key=HASH_KEY, categorize=False)
+
+def query_text(phrase):
+    # The phrase cleaned and tokenized like the reviews, so it reads like the stored phrases
+    from nltk import word_tokenize
+    return ' '.join(word_tokenize(normalize_review(phrase)))
+
+def phrase_texts(phrases, cache=None):
+    # Phrases as text; with the text cache their tokens are token ids
+    if cache is not None:
+        ids = sorted({token for phrase in phrases for token in phrase})
+        token_of = dict(zip(ids, cache.tokens_for_ids(ids)))
+        return [' '.join(token_of[token] for token in phrase) for phrase in phrases]
+    return [' '.join(phrase) for phrase in phrases]
+
+def review_table(df):
+    reviews = np.empty(len(df), dtype=REVIEW_DTYPE)
+    reviews['review_uid'] = review_uid_numbers(df['review_uid']) if 'review_uid' in df.columns else np.arange(len(df))
+    reviews['rating'] = pd.to_numeric(df['rating'], errors='coerce').astype('float64').to_numpy()
+    reviews['day'] = df['review_day'].astype('float64').to_numpy()
+    return reviews
+
+def write_phrase_index(folder, texts, counts, starts, postings, reviews, meta):
+    """Save phrases with their counts, the review positions of phrase i (postings[starts[i]:starts[i + 1]]) and the reviews."""
+    create_folder(folder)
+    hashes = hash_phrases(texts)
+    order = np.argsort(hashes, kind='stable')
+    encoded = [texts[i].encode('utf-8') for i in order.tolist()]
+    n_reviews = np.diff(starts)
+    # Average rating of the reviews of each phrase, over the rated ones
+    phrase_of = np.repeat(np.arange(len(texts)), n_reviews)
+    ratings = reviews['rating'][postings]
+    rated = ~np.isnan(ratings)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        avg_rating = np.bincount(phrase_of[rated], weights=ratings[rated], minlength=len(texts)) / np.bincount(phrase_of[rated], minlength=len(texts))
+
+    phrases = np.empty(len(texts), dtype=PHRASE_DTYPE)
+    phrases['hash'] = hashes[order]
+    phrases['freq'] = counts[order]
+    phrases['n_reviews'] = n_reviews[order]
+    phrases['avg_rating'] = avg_rating[order]
+    text_lengths = np.array([len(text) for text in encoded], dtype=np.int64)
+    phrases['text_end'] = np.cumsum(text_lengths)
+    phrases['text_start'] = phrases['text_end'] - text_lengths
+    phrases['posting_end'] = np.cumsum(phrases['n_reviews'])
+    phrases['posting_start'] = phrases['posting_end'] - phrases['n_reviews']
+    # The posting lists follow the phrases into hash order
+    moved = np.repeat(starts[:-1][order] - phrases['posting_start'], phrases['n_reviews'])
+    np.save(os.path.join(folder, 'postings.npy'), np.asarray(postings, dtype=np.int32)[np.arange(len(postings)) + moved])
+    np.save(os.path.join(folder, 'phrases.npy'), phrases)
+    np.save(os.path.join(folder, 'reviews.npy'), reviews)
+    with open(os.path.join(folder, 'texts.bin'), 'wb') as f:
+        f.write(b''.join(encoded))
+    with open(os.path.join(folder, 'meta.json'), 'w', encoding='utf-8') as f:
+        json.dump(meta, f, ensure_ascii=False, indent=1)
+
+def save_phrase_index(folder, phrases, counts, starts, postings, df, cache, meta):
+    # The output of shard_analysis.sharded_phrase_postings for the reviews of df
+    reviews = review_table(df)
+    ratings = reviews['rating'][~np.isnan(reviews['rating'])]
+    meta = {**meta, 'reviews': len(df), 'avg_rating': float(ratings.mean()) if len(ratings) else None}
+    write_phrase_index(folder, phrase_texts(phrases, cache), counts, starts, postings, reviews, meta)
+
+class PhraseIndex:
+    """One product's phrase index, memory-mapped from its folder."""
+
+    def __init__(self, folder):
+        if not os.path.exists(os.path.join(folder, 'meta.json')):
+            raise FileNotFoundError(f"No phrase index in {folder}; run phrase_repetition_analysis.py with --phrase-index first")
+        self.folder = folder
+        with open(os.path.join(folder, 'meta.json'), encoding='utf-8') as f:
+            self.meta = json.load(f)
+        self.phrases = np.load(os.path.join(folder, 'phrases.npy'), mmap_mode='r')
+        self.postings = np.load(os.path.join(folder, 'postings.npy'), mmap_mode='r')
+        self.reviews = np.load(os.path.join(folder, 'reviews.npy'), mmap_mode='r')
+        texts_path = os.path.join(folder, 'texts.bin')
+        self.texts = np.memmap(texts_path, dtype=np.uint8, mode='r') if os.path.getsize(texts_path) else np.empty(0, dtype=np.uint8)
+
+    def text(self, row):
+        phrase = self.phrases[row]
+        return self.texts[phrase['text_start']:phrase['text_end']].tobytes().decode('utf-8')
+
+    def texts_of(self, rows):
+        phrases = self.phrases[np.asarray(rows, dtype=np.int64)]
+        data = memoryview(self.texts)
+        return [str(data[start:end], 'utf-8') for start, end in zip(phrases['text_start'].tolist(), phrases['text_end'].tolist())]
+
+    def find(self, phrase):
+        # Row of a phrase as stored (cleaned and tokenized, tokens joined by spaces), None when it is not a common phrase
+        hashes = self.phrases['hash']
+        target = hash_phrases([phrase])[0]
+        row = int(np.searchsorted(hashes, target))
+        while row < len(hashes) and hashes[row] == target:
+            if self.text(row) == phrase:
+                return row
+            row += 1
+        return None
+
+    def rating_skew(self, avg_rating):
+        return avg_rating - (self.meta['avg_rating'] if self.meta['avg_rating'] is not None else np.nan)
+
+    def table(self, rows):
+        phrases = self.phrases[np.asarray(rows, dtype=np.int64)]
+        return pd.DataFrame({
+            'phrase': self.texts_of(rows),
+            'freq': phrases['freq'],
+            'n_reviews': phrases['n_reviews'],
+            'percentage_of_reviews': np.round(phrases['n_reviews'] / max(self.meta['reviews'], 1) * 100, 2),
+            'avg_rating': np.round(phrases['avg_rating'], 2),
+            'rating_skew': np.round(self.rating_skew(phrases['avg_rating']), 2),
+        })
+
+    def top(self, k=TOP, by='freq', min_reviews=None):
+        # The k phrases with the most occurrences, the most reviews or the average rating furthest from the product's
+        min_reviews = min_reviews if min_reviews is not None else (MIN_REVIEWS_SKEW if by == 'skew' else 1)
+        n_reviews = np.asarray(self.phrases['n_reviews'])
+        eligible = np.flatnonzero(n_reviews >= min_reviews)
+        if by == 'freq':
+            score = np.asarray(self.phrases['freq'])[eligible].astype(np.float64)
+        elif by == 'reviews':
+            score = n_reviews[eligible].astype(np.float64)
+        else:
+            score = np.nan_to_num(np.abs(self.rating_skew(np.asarray(self.phrases['avg_rating'])[eligible])), nan=-1.0)
+        k = min(k, len(eligible))
+        if not k:
+            return self.table([])
+        best = np.argpartition(-score, k - 1)[:k]
+        best = best[np.lexsort((eligible[best], -score[best]))]
+        return self.table(eligible[best].tolist())
+
+    def reviews_with(self, phrase):
+        # Every review containing the phrase, in file order
+        row = self.find(phrase)
+        if row is None:
+            return pd.DataFrame(columns=REVIEW_COLUMNS)
+        positions = np.asarray(self.postings[self.phrases['posting_start'][row]:self.phrases['posting_end'][row]], dtype=np.int64)
+        reviews = self.reviews[positions]
+        table = pd.DataFrame({
+            'review_row': positions,
+            'review_uid': reviews['review_uid'],
+            'review_date': day_to_timestamp(np.nan_to_num(reviews['day'])).date,
+            'rating': reviews['rating'],
+        })
+        table.loc[np.isnan(reviews['day']), 'review_date'] = None
+        return table
+
+def shared_phrases(index_a, index_b):
+    """Phrases common in both products, the most frequent over both first."""
+    # Phrases are matched on the 64-bit hash of their text, as texts are in duplicate_index.py
+    _, rows_a, rows_b = np.intersect1d(index_a.phrases['hash'], index_b.phrases['hash'], return_indices=True)
+    a, b = index_a.phrases[rows_a], index_b.phrases[rows_b]
+    table = pd.DataFrame({
+        'phrase': index_a.texts_of(rows_a),
+        'freq_a': a['freq'], 'freq_b': b['freq'],
+        'n_reviews_a': a['n_reviews'], 'n_reviews_b': b['n_reviews'],
+        'avg_rating_a': np.round(a['avg_rating'], 2), 'avg_rating_b': np.round(b['avg_rating'], 2),
+    })
+    order = np.lexsort((table['phrase'].to_numpy(), -(table['freq_a'] + table['freq_b']).to_numpy()))
+    return table.iloc[order].reset_index(drop=True)
+
+def uid_keys(review_uids):
+    # (review_uid, how many reviews before it have the same uid): a key of each review that does not depend on row order
+    uids = pd.Series(review_uids)
+    return pd.MultiIndex.from_arrays([uids.to_numpy(), uids.groupby(uids).cumcount().to_numpy()])
+
+def review_texts(index, positions):
+    # Texts of the reviews at the given index positions, found by review_uid in the product's reviews as they load now,
+    # so a different row order (or an updated file) does not give the texts of other reviews; missing ones are NaN
+    df = load_reviews(index.meta['source_path'])
+    loaded = review_uid_numbers(df['review_uid']) if 'review_uid' in df.columns else np.arange(len(df))
+    rows = uid_keys(loaded).get_indexer(uid_keys(index.reviews['review_uid'])[positions])
+    # A review that is not found (-1) picks the NaN at the end
+    return np.append(df['review_content'].astype(object).to_numpy(), np.nan)[rows]
+
+def main():
+    args = get_args()
+    try:
+        run_query(args)
+    except FileNotFoundError as e:
+        print(e)
+
+def run_query(args):
+    if args.command == 'shared':
+        index = PhraseIndex(index_folder(args.company_a, args.results))
+        other = PhraseIndex(index_folder(args.company_b, args.results))
+        start = time.perf_counter()
+        table = shared_phrases(index, other)
+        what = f"phrases common in both {args.company_a} (a) and {args.company_b} (b)"
+    else:
+        index = PhraseIndex(index_folder(args.company_name, args.results))
+        start = time.perf_counter()
+        if args.command == 'top':
+            table = index.top(args.k, args.by, args.min_reviews)
+            what = f"top phrases of {args.company_name} by {args.by}"
+        else:
+            phrase = query_text(args.phrase)
+            table = index.reviews_with(phrase)
+            what = f"reviews of {args.company_name} containing '{phrase}'"
+    elapsed = time.perf_counter() - start
+    if args.command == 'reviews' and args.texts and len(table):
+        table['review_content'] = review_texts(index, table['review_row'].to_numpy())
+
+    print(f"{len(table)} {what} ({elapsed * 1000:.1f} ms)")
+    if len(table):
+        print(table.head(PRINT_ROWS).to_string(index=False))
+        if len(table) > PRINT_ROWS:
+            print(f"... {len(table) - PRINT_ROWS} more rows{'' if args.output else ', save them all with --output'}")
+    if args.output:
+        table.to_csv(args.output, index=False)
+        print(f"CSV file saved to {args.output}")
+
+if __name__ == "__main__":
+    main()
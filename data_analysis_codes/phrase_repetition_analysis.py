@@ -1,16 +1,15 @@
 import pandas as pd
-import matplotlib.pyplot as plt
 import numpy as np
-import re
 import nltk
 from nltk.util import ngrams
-from nltk import word_tokenize
 from collections import Counter
-import string
-from scipy import stats
 import os
 import ssl
 import argparse
+from review_loader import load_reviews
+from significance import significance_columns, rating_histogram, RATING_VALUES
+from text_cache import normalize_reviews, open_cache, DEFAULT_CACHE_PATH
+# external_ngrams, approximate_ngrams, shard_analysis and phrase_index are imported by the options that use them
 
 # Ensure necessary NLTK resources are downloaded
 try:
@@ -22,43 +21,41 @@ else:
 
 nltk.download('punkt')
 
-def get_filename():
+def get_args():
     parser = argparse.ArgumentParser(description='Process some CSV files.')
     parser.add_argument('filename', type=str, help='The filename of the CSV (with extension)')
     parser.add_argument('foldername', type=str, help='The name of the folder')
-    args = parser.parse_args()
-    return args.filename, args.foldername
+    parser.add_argument('--text-cache', type=str, default=DEFAULT_CACHE_PATH, help='Cache of normalized and tokenized reviews, empty to disable')
+    parser.add_argument('--plots', action='store_true', help='Also save the per-product plot images (dashboard.py builds one dashboard per folder)')
+    parser.add_argument('--max-memory-mb', type=float, default=None, help='Count phrases on disk within this memory budget instead of in memory')
+    parser.add_argument('--spill-dir', type=str, default=None, help='Folder for the n-gram runs of --max-memory-mb (default: system temp folder)')
+    parser.add_argument('--min-freq', type=int, default=3, help='Occurrences for a phrase to count as common')
+    parser.add_argument('--approximate', action='store_true', help='Count phrases approximately in fixed memory (Count-Min Sketch + top-k), for quick scans')
+    parser.add_argument('--sketch-mb', type=float, default=None, help='Memory of the --approximate sketch (default approximate_ngrams.SKETCH_MB); more memory gives tighter bounds')
+    parser.add_argument('--top-k', type=int, default=None, help='Heavy-hitter phrases tracked by --approximate (default approximate_ngrams.TOP_K)')
+    parser.add_argument('--workers', type=int, default=1, help='Processes counting and flagging the phrases of this product by map-reduce over review shards; not used with --max-memory-mb or --approximate')
+    parser.add_argument('--phrase-index', action='store_true', help='Also save each common phrase with the reviews containing it, for phrase_index.py queries; not used with --max-memory-mb or --approximate')
+    return parser.parse_args()
 
 def create_folder(folder_path):
     if not os.path.exists(folder_path):
         os.makedirs(folder_path)
 
 def load_data(filename):
-    return pd.read_csv(filename)
+    return load_reviews(filename)
 
-def preprocess_review(review):
-    if pd.isnull(review):
-        review = ''  # Convert NaN to empty string
-    review = str(review)  # Ensure all inputs are treated as strings
-    review = re.sub(r"\(\d{4}-\d{2}-\d{2} \d{2}:\d{2}:\d{2} 에 등록된 네이버 페이 구매평\)", "", review)
-    review = review.replace("쇼핑몰 추천 리뷰", "")
-    if review.startswith("NEW"):
-        review = review[3:]  # Remove the first three characters assumed to be "NEW"
-    review = review.lower()
-    review = review.translate(str.maketrans('', '', string.punctuation))
-    return review
-
-def find_common_phrases(reviews, min_length=3, min_freq=3):
+def find_common_phrases(tokenized_reviews, min_length=3, min_freq=3, memory_mb=None, spill_dir=None):
+    if memory_mb is not None:
+        from external_ngrams import count_common_ngrams
+        return count_common_ngrams(tokenized_reviews, min_length, min_freq, 5, memory_mb, spill_dir)
     phrases = Counter()
-    for review in reviews:
-        tokens = word_tokenize(review)
+    for tokens in tokenized_reviews:
         for n in range(min_length, 6):  # Analyze up to 5-grams
             for gram in ngrams(tokens, n):
                 phrases[gram] += 1
     return {phrase: freq for phrase, freq in phrases.items() if freq >= min_freq}
 
-def contains_common_phrase(review, common_phrases):
-    tokens = word_tokenize(review)
+def contains_common_phrase(tokens, common_phrases):
     for n in range(3, 6):
         for gram in ngrams(tokens, n):
             if gram in common_phrases:
@@ -66,22 +63,63 @@ def contains_common_phrase(review, common_phrases):
     return False
 
 def main():
-    input_filename, foldername = get_filename()
-    filename = os.path.join(f'./{foldername}_Collected_Reviews', input_filename)
+    args = get_args()
+    input_filename = args.filename
+    filename = os.path.join(f'./{args.foldername}_Collected_Reviews', input_filename)
     company_name = input_filename.split('.')[0]
     folder_path = f'./results/{company_name}'
     
     create_folder(folder_path)
     
     df = load_data(filename)
-    df['review_content'] = df['review_content'].astype(str)
-    df['cleaned_review_content'] = df['review_content'].apply(preprocess_review)
+    cache = open_cache(args.text_cache)
+    normalized = normalize_reviews(df['review_content'], cache, tokenize=True)
+    df['cleaned_review_content'] = normalized['cleaned_review_content']
     
-    common_phrases = find_common_phrases(df['cleaned_review_content'])
-    df['contains_common_phrase'] = df['cleaned_review_content'].apply(lambda x: contains_common_phrase(x, common_phrases))
+    percentage_bounds = {}
+    if args.approximate:
+        from approximate_ngrams import approximate_common_phrases, SKETCH_MB, TOP_K
+        args.sketch_mb = SKETCH_MB if args.sketch_mb is None else args.sketch_mb
+        args.top_k = TOP_K if args.top_k is None else args.top_k
+        common_phrases, flags, certain_flags, sketch = approximate_common_phrases(normalized['tokens'], min_freq=args.min_freq, sketch_mb=args.sketch_mb, top_k=args.top_k)
+        df['contains_common_phrase'] = flags
+        # Phrase counts are over-estimated, so the share is an upper bound; the lower bound only counts phrases that
+        # are common even after subtracting the sketch error. With an incomplete top-k the upper bound is unknown.
+        percentage_bounds = {
+            'percentage_of_review_w_common_phrases_low': ["%0.2f" % (certain_flags.mean() * 100)],
+            'percentage_of_review_w_common_phrases_high': ["%0.2f" % (flags.mean() * 100) if sketch.complete(args.min_freq) else np.nan],
+        }
+        low, high = percentage_bounds['percentage_of_review_w_common_phrases_low'][0], percentage_bounds['percentage_of_review_w_common_phrases_high'][0]
+        share = f"between {low}% and {high}%" if sketch.complete(args.min_freq) else (
+            f"at least {low}% (a phrase seen {sketch.evicted_max} times did not fit in the top {args.top_k}; raise --top-k or --min-freq for an upper bound)")
+        print(f"Approximate phrase counts: {len(common_phrases)} common phrases, count error <= {sketch.sketch.error_bound():.1f} "
+              f"with probability {sketch.sketch.confidence():.3f}, share of reviews {share}")
+    elif args.phrase_index and args.max_memory_mb is None:
+        from shard_analysis import sharded_phrase_postings
+        from phrase_index import save_phrase_index, index_folder
+        # The reviews in any posting list are the ones with a common phrase
+        phrases, counts, starts, postings = sharded_phrase_postings(normalized['tokens'], min_freq=args.min_freq, workers=args.workers)
+        flags = np.zeros(len(df), dtype=bool)
+        flags[postings] = True
+        df['contains_common_phrase'] = flags
+        index_path = index_folder(company_name)
+        save_phrase_index(index_path, phrases, counts, starts, postings, df, cache, {
+            'company_name': company_name,
+            'product_name': str(df['product_name'].iloc[0]),
+            'source_path': filename,
+            'min_length': 3,
+            'min_freq': args.min_freq,
+        })
+        print(f"Phrase index of {len(phrases)} phrases saved to {index_path}")
+    elif args.workers > 1 and args.max_memory_mb is None:
+        from shard_analysis import sharded_phrase_flags
+        df['contains_common_phrase'] = sharded_phrase_flags(normalized['tokens'], min_freq=args.min_freq, workers=args.workers)
+    else:
+        common_phrases = find_common_phrases(normalized['tokens'], min_freq=args.min_freq, memory_mb=args.max_memory_mb, spill_dir=args.spill_dir)
+        df['contains_common_phrase'] = normalized['tokens'].apply(lambda x: contains_common_phrase(x, common_phrases))
     
-    ratings_with_phrases = round(df[df['contains_common_phrase']]['rating'].mean(), 2)
-    ratings_without_phrases = round(df[~df['contains_common_phrase']]['rating'].mean(), 2)
+    ratings_with_phrases = round(df[df['contains_common_phrase']]['rating'].astype('float64').mean(), 2)
+    ratings_without_phrases = round(df[~df['contains_common_phrase']]['rating'].astype('float64').mean(), 2)
     
     print("Average rating for reviews containing common phrases: ", ratings_with_phrases)
     print("Average rating for reviews not containing common phrases: ", ratings_without_phrases)
@@ -90,15 +128,18 @@ def main():
     percentage_of_review_w_common_phrases = "%0.2f" % (percentage_of_review_w_common_phrases * 100)
     print(percentage_of_review_w_common_phrases)
     
-    t_stat, p_value = stats.ttest_ind(df[df['contains_common_phrase']]['rating'], df[~df['contains_common_phrase']]['rating'], equal_var=False)
-    print(f"T-statistic: {t_stat}, P-value: {p_value}")
+    significance = significance_columns('rating_diff_with_phrases', df[df['contains_common_phrase']]['rating'], df[~df['contains_common_phrase']]['rating'])
+    print(f"Permutation p-value: {significance['rating_diff_with_phrases_p_value'][0]}, "
+          f"95% bootstrap CI: [{significance['rating_diff_with_phrases_ci_low'][0]}, {significance['rating_diff_with_phrases_ci_high'][0]}]")
     
     results_df = pd.DataFrame({
         'company_name': [company_name],
         'product_name': [df['product_name'].iloc[0]],
         'ratings_with_phrases': [ratings_with_phrases],
         'ratings_without_phrases': [ratings_without_phrases],
-        'percentage_of_review_w_common_phrases': [percentage_of_review_w_common_phrases]
+        'percentage_of_review_w_common_phrases': [percentage_of_review_w_common_phrases],
+        **percentage_bounds,
+        **significance
     })
     
     output_filename = f"{company_name}_phrase_repetition.csv"
@@ -106,6 +147,19 @@ def main():
     results_df.to_csv(output_path, index=False)
     print(f"CSV file saved to {output_path}")
     
+    ratings_df = pd.DataFrame({
+        'rating': RATING_VALUES,
+        'with_phrases': rating_histogram(df[df['contains_common_phrase']]['rating']),
+        'without_phrases': rating_histogram(df[~df['contains_common_phrase']]['rating'])
+    })
+    ratings_path = os.path.join(folder_path, f"{company_name}_phrase_repetition_ratings.csv")
+    ratings_df.to_csv(ratings_path, index=False)
+    print(f"Rating counts saved to {ratings_path}")
+    
+    if not args.plots:
+        return
+    import matplotlib.pyplot as plt
+    
     avg_ratings = {
         'With Repetitive Phrases': ratings_with_phrases,
         'Without Repetitive Phrases': ratings_without_phrases
@@ -127,8 +181,8 @@ def main():
     plt.close()
     print(f"Average Ratings visualization saved to {avg_ratings_path}")
     
-    ratings_with = df[df['contains_common_phrase']]['rating']
-    ratings_without = df[~df['contains_common_phrase']]['rating']
+    ratings_with = df[df['contains_common_phrase']]['rating'].astype('float64')
+    ratings_without = df[~df['contains_common_phrase']]['rating'].astype('float64')
     
     plt.figure(figsize=(10, 6))
     plt.hist(ratings_with, bins=np.arange(0.5, 5.6, 0.5), alpha=0.5, label='With Repetitive Phrases', color='red')
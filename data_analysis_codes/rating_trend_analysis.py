@@ -1,40 +1,38 @@
 import pandas as pd
 import numpy as np
 import statsmodels.api as sm
-import matplotlib.pyplot as plt
 import os
 import math
 import argparse
+from review_loader import load_reviews, day_to_timestamp
+from significance import significance_columns
 
 def get_filename():
     parser = argparse.ArgumentParser(description='Process some CSV files.')
     parser.add_argument('filename', type=str, help='The filename of the CSV (with extension)')
     parser.add_argument('foldername', type=str, help='The name of the folder')
+    parser.add_argument('--plots', action='store_true', help='Also save the per-product plot images (dashboard.py builds one dashboard per folder)')
     args = parser.parse_args()
-    return args.filename, args.foldername
+    return args.filename, args.foldername, args.plots
 
 def create_folder(folder_path):
     if not os.path.exists(folder_path):
         os.makedirs(folder_path)
 
 def load_and_preprocess_data(filename):
-    df = pd.read_csv(filename)
-    df['review_date'] = pd.to_datetime(df['review_date']).dt.date
+    df = load_reviews(filename)
+    df = df.dropna(subset=['review_day'])
     return df
 
 def get_review_counts(df):
-    review_counts = df.groupby(df['review_date']).size()
-    review_counts_df = pd.DataFrame({'review_date': review_counts.index, 'review_count': review_counts.values})
-    review_counts_df['review_date'] = pd.to_datetime(review_counts_df['review_date'])
+    review_counts = df.groupby(df['review_day']).size()
+    review_counts_df = pd.DataFrame({'review_day': review_counts.index.astype(np.int64), 'review_count': review_counts.values})
     return review_counts_df
 
 def add_missing_dates(review_counts_df):
-    min_date = review_counts_df['review_date'].min()
-    max_date = review_counts_df['review_date'].max()
-    all_dates = pd.date_range(start=min_date, end=max_date)
-    missing_dates = all_dates[~all_dates.isin(review_counts_df['review_date'])]
-    missing_df = pd.DataFrame({'review_date': missing_dates, 'review_count': 0})
-    review_counts_df = pd.concat([review_counts_df, missing_df]).sort_values(by='review_date')
+    all_days = np.arange(review_counts_df['review_day'].min(), review_counts_df['review_day'].max() + 1)
+    review_counts_df = review_counts_df.set_index('review_day').reindex(all_days, fill_value=0).rename_axis('review_day').reset_index()
+    review_counts_df['review_date'] = day_to_timestamp(review_counts_df['review_day'])
     return review_counts_df
 
 def fit_poisson_model(review_counts_df):
@@ -44,6 +42,7 @@ def fit_poisson_model(review_counts_df):
     return poisson_model
 
 def plot_avg_ratings(avg_ratings_higher_than_max, avg_ratings_lower_than_max, company_name, folder_path):
+    import matplotlib.pyplot as plt  # only needed with --plots
     plt.figure(figsize=(10, 6))
     plt.bar(['High Volume Dates', 'Not High Volume Dates'], [avg_ratings_higher_than_max, avg_ratings_lower_than_max], color=['red', 'green'])
     plt.xlabel('Date Category')
@@ -57,6 +56,7 @@ def plot_avg_ratings(avg_ratings_higher_than_max, avg_ratings_lower_than_max, co
     print(f"Average Ratings visualization saved to {avg_ratings_path}")
 
 def plot_review_counts(dates_higher_than_max, dates_lower_than_max, max_reviews_per_day, company_name, folder_path):
+    import matplotlib.pyplot as plt  # only needed with --plots
     fig, ax = plt.subplots(figsize=(12, 6))
     ax.bar(dates_higher_than_max['review_date'], dates_higher_than_max['review_count'], color='blue', label='High Volume Dates', width=5)
     ax.bar(dates_lower_than_max['review_date'], dates_lower_than_max['review_count'], color='red', label='Not High Volume Dates', width=5)
@@ -82,7 +82,7 @@ def save_results(results_df, company_name, folder_path):
     print(f"CSV file saved to {output_path}")
 
 def main():
-    input_filename, foldername = get_filename()
+    input_filename, foldername, plots = get_filename()
     filename = os.path.join(f'./{foldername}_Collected_Reviews', input_filename)
     company_name = input_filename.split('.')[0]
     folder_path = f'./results/{company_name}'
@@ -91,9 +91,7 @@ def main():
     
     df = load_and_preprocess_data(filename)
     
-    earliest_date = df['review_date'].min()
-    latest_date = df['review_date'].max()
-    days_diff = (latest_date - earliest_date).days
+    days_diff = int(df['review_day'].max() - df['review_day'].min())
     print(f"days_diff: {days_diff}")
     
     review_counts_df = get_review_counts(df)
@@ -119,16 +117,21 @@ def main():
     high_volume_review_percentage = total_reviews_higher_than_max / len(df) * 100
     print(f"high_volume_review_percentage: {high_volume_review_percentage}")
     
-    reviews_higher_than_max = df[df['review_date'].isin(dates_higher_than_max['review_date'])]
-    reviews_lower_than_max = df[~df['review_date'].isin(dates_higher_than_max['review_date'])]
+    reviews_higher_than_max = df[df['review_day'].isin(dates_higher_than_max['review_day'])]
+    reviews_lower_than_max = df[~df['review_day'].isin(dates_higher_than_max['review_day'])]
     
     avg_ratings_higher_than_max = reviews_higher_than_max['rating'].mean()
     avg_ratings_lower_than_max = reviews_lower_than_max['rating'].mean()
     print(f"avg_ratings_higher_than_max: {avg_ratings_higher_than_max}")
     print(f"avg_ratings_lower_than_max: {avg_ratings_lower_than_max}")
     
-    plot_avg_ratings(avg_ratings_higher_than_max, avg_ratings_lower_than_max, company_name, folder_path)
-    plot_review_counts(dates_higher_than_max, dates_lower_than_max, max_reviews_per_day, company_name, folder_path)
+    significance = significance_columns('rating_diff_higher_than_max', reviews_higher_than_max['rating'], reviews_lower_than_max['rating'])
+    print(f"rating_diff_higher_than_max_p_value: {significance['rating_diff_higher_than_max_p_value'][0]}, "
+          f"95% CI [{significance['rating_diff_higher_than_max_ci_low'][0]}, {significance['rating_diff_higher_than_max_ci_high'][0]}]")
+    
+    if plots:
+        plot_avg_ratings(avg_ratings_higher_than_max, avg_ratings_lower_than_max, company_name, folder_path)
+        plot_review_counts(dates_higher_than_max, dates_lower_than_max, max_reviews_per_day, company_name, folder_path)
     
     results_df = pd.DataFrame({
         'company_name': [company_name],
@@ -139,7 +142,8 @@ def main():
         'total_reviews_higher_than_max': [total_reviews_higher_than_max],
         'high_volume_review_percentage': [round(high_volume_review_percentage, 2)],
         'avg_ratings_higher_than_max': [round(avg_ratings_higher_than_max, 2)],
-        'avg_ratings_lower_than_max': [round(avg_ratings_lower_than_max, 2)]
+        'avg_ratings_lower_than_max': [round(avg_ratings_lower_than_max, 2)],
+        **significance
     })
     
     save_results(results_df, company_name, folder_path)
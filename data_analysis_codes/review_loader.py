@@ -0,0 +1,173 @@
+import os
+import sys
+import numpy as np
+import pandas as pd
+
+# Columns that repeat the same handful of values for every review of a product
+CATEGORICAL_COLUMNS = ['product_name', 'product_price', 'product_type', 'username_1', 'username_2', 'user_uid', 'seller_name', 'survey_answer']
+TEXT_COLUMNS = ['review_content', 'review_title']
+# The characters str.split() splits on (those with str.isspace()), spelled out so the pattern means the same to Python
+# re and Arrow's RE2
+WHITESPACE = ('\t\n\x0b\x0c\r\x1c\x1d\x1e\x1f \x85\xa0\u1680\u2000\u2001\u2002\u2003\u2004\u2005\u2006\u2007'
+              '\u2008\u2009\u200a\u2028\u2029\u202f\u205f\u3000')
+WORD_PATTERN = f'[^{WHITESPACE}]+'
+# Registration time that Naver Pay appends to reviews imported into Saladlab and Crema stores
+NAVER_PAY_PATTERN = r"\((?P<minute>\d{4}-\d{2}-\d{2} \d{2}:\d{2}):\d{2} 에 등록된 네이버 페이 구매평\)"
+# Folder of a review warehouse (see review_warehouse.py) to read products from instead of their CSV files
+WAREHOUSE_ENV = 'REVIEW_WAREHOUSE'
+# review_date formats of the collectors: Coupang and Crema write 2024.07.14, the Alpha and Cafe24 widgets 2024-07-14.
+# Only the leading date is read, so a time after it (2024-07-14 12:30) does not matter.
+DATE_FORMATS = ['%Y.%m.%d', '%Y-%m-%d', '%Y/%m/%d', '%y.%m.%d', '%y-%m-%d']
+DATE_FIELD_WIDTHS = {'%Y': 4, '%y': 2, '%m': 2, '%d': 2}
+
+def text_dtype():
+    # Arrow-backed strings when pyarrow is installed, plain (interned) Python strings otherwise
+    try:
+        import pyarrow  # noqa: F401
+        return 'string[pyarrow]'
+    except ImportError:
+        return None
+
+def compact_text(series):
+    dtype = text_dtype()
+    if dtype is not None:
+        return series.astype(dtype)
+    return series.map(lambda x: sys.intern(x) if isinstance(x, str) else x)
+
+def count_words(texts):
+    # Same result as texts.str.split().str.len() without building a list per review
+    return compact_text(texts).str.count(WORD_PATTERN)
+
+def compact_ratings(ratings):
+    ratings = pd.to_numeric(ratings, errors='coerce')
+    valid = ratings.dropna()
+    if (valid % 1 == 0).all() and valid.between(-128, 127).all():
+        return ratings.astype('Int8')
+    return ratings.astype('float32')
+
+def parse_fixed_dates(values, date_format):
+    # Days since 1970-01-01 of strings starting with a fixed-width date, read by character position, and which ones parsed
+    fields, position = {}, 0
+    literals = []
+    i = 0
+    while i < len(date_format):
+        if date_format[i] == '%':
+            width = DATE_FIELD_WIDTHS[date_format[i:i + 2]]
+            fields[date_format[i + 1]] = (position, width)
+            position += width
+            i += 2
+        else:
+            literals.append((position, ord(date_format[i])))
+            position += 1
+            i += 1
+    # Each string as a row of code points; shorter strings are padded with zeros and fail the digit check
+    chars = np.asarray(values, dtype=f'U{position}').view(np.uint32).reshape(len(values), position).astype(np.int64)
+    ok = np.ones(len(values), dtype=bool)
+    for column, code in literals:
+        ok &= chars[:, column] == code
+    numbers = {}
+    for name, (start, width) in fields.items():
+        digits = chars[:, start:start + width] - ord('0')
+        ok &= ((digits >= 0) & (digits <= 9)).all(axis=1)
+        numbers[name] = digits @ (10 ** np.arange(width - 1, -1, -1))
+    year = numbers['Y'] if 'Y' in numbers else 2000 + numbers['y']
+    month, day = numbers['m'], numbers['d']
+    ok &= (month >= 1) & (month <= 12)
+    months = np.where(ok, (year - 1970) * 12 + month - 1, 0)
+    month_start = months.astype('datetime64[M]').astype('datetime64[D]').astype(np.int64)
+    month_length = (months + 1).astype('datetime64[M]').astype('datetime64[D]').astype(np.int64) - month_start
+    ok &= (day >= 1) & (day <= month_length)
+    return np.where(ok, month_start + day - 1, 0), ok
+
+def parse_dates(dates, formats=DATE_FORMATS):
+    # Every distinct string is parsed once: first with the format most of them have, then the others on what is left,
+    # and finally pandas' per-string inference for anything no fixed format fits
+    codes, uniques = pd.factorize(dates)
+    uniques = np.asarray(uniques, dtype=object)
+    days = np.zeros(len(uniques), dtype=np.int64)
+    parsed = np.zeros(len(uniques), dtype=bool)
+    counts = np.bincount(codes[codes >= 0], minlength=len(uniques))
+    sample = uniques[:1000]
+    formats = sorted(formats, key=lambda f: -parse_fixed_dates(sample, f)[1].sum())
+    used = {}
+    for date_format in formats:
+        left = np.flatnonzero(~parsed)
+        if not len(left):
+            break
+        format_days, ok = parse_fixed_dates(uniques[left], date_format)
+        days[left[ok]] = format_days[ok]
+        parsed[left[ok]] = True
+        if ok.any():
+            used[date_format] = int(counts[left[ok]].sum())
+    left = np.flatnonzero(~parsed)
+    if len(left):
+        inferred = pd.to_datetime(pd.Series(uniques[left]), errors='coerce', format='mixed')
+        ok = inferred.notna().to_numpy()
+        days[left[ok]] = inferred[ok].to_numpy(dtype='datetime64[ns]').astype('datetime64[D]').astype(np.int64)
+        parsed[left[ok]] = True
+        if ok.any():
+            used['inferred'] = int(counts[left[ok]].sum())
+    failed = ~parsed
+    report = {
+        'formats': used,
+        'missing': int((codes < 0).sum()),
+        'failed': int(counts[failed].sum()),
+        'failed_examples': [str(value) for value in uniques[failed][:5]],
+    }
+    # Missing dates have code -1, which picks the extra unparsed slot at the end
+    return np.append(days, 0)[codes], np.append(parsed, False)[codes], report
+
+def to_day_offsets(dates):
+    # Days since 1970-01-01 as nullable int32, dates that cannot be parsed become <NA> and are counted
+    days, ok, report = parse_dates(dates)
+    if report['failed']:
+        print(f"review_date: {report['failed']} of {len(dates)} dates could not be parsed, ex. {report['failed_examples']}")
+    return pd.Series(pd.arrays.IntegerArray(days.astype(np.int32), ~ok), index=dates.index)
+
+def to_minute_offsets(texts):
+    # Minutes since 1970-01-01 of the Naver Pay registration time in each review text as nullable int32, <NA> without one
+    texts = compact_text(texts)
+    if text_dtype() is not None:
+        # One RE2 pass and one strptime over the Arrow buffers, no Python string per review
+        import pyarrow as pa
+        import pyarrow.compute as pc
+        matches = pc.extract_regex(pa.chunked_array(pa.array(texts.array)), NAVER_PAY_PATTERN)
+        stamps = pc.strptime(pc.if_else(pc.is_valid(matches), pc.struct_field(matches, [0]), None),
+                             format='%Y-%m-%d %H:%M', unit='s', error_is_null=True)
+        seconds = pc.cast(stamps, pa.int64()).to_numpy(zero_copy_only=False)
+        found = ~np.isnan(seconds) if seconds.dtype.kind == 'f' else np.ones(len(seconds), dtype=bool)
+        minutes = np.where(found, np.nan_to_num(seconds) // 60, 0).astype(np.int32)
+        return pd.Series(pd.arrays.IntegerArray(minutes, ~found), index=texts.index)
+    stamps = pd.to_datetime(texts.str.extract(NAVER_PAY_PATTERN)['minute'], format='%Y-%m-%d %H:%M', errors='coerce')
+    found = stamps.notna().to_numpy()
+    minutes = np.where(found, stamps.to_numpy(dtype='datetime64[m]').astype(np.int64), 0).astype(np.int32)
+    return pd.Series(pd.arrays.IntegerArray(minutes, ~found), index=texts.index)
+
+def day_to_timestamp(days):
+    return pd.to_datetime(np.asarray(days, dtype=np.int64), unit='D')
+
+def compact_reviews(df):
+    for col in CATEGORICAL_COLUMNS:
+        if col in df.columns:
+            df[col] = df[col].astype('category')
+    for col in TEXT_COLUMNS:
+        if col in df.columns:
+            df[col] = compact_text(df[col])
+    if 'rating' in df.columns:
+        df['rating'] = compact_ratings(df['rating'])
+    if 'review_date' in df.columns:
+        df['review_day'] = to_day_offsets(df['review_date'])
+        df = df.drop(columns=['review_date'])
+    return df
+
+def load_reviews(filename, compact=True, warehouse=True):
+    # With WAREHOUSE_ENV set, products already in the warehouse are mapped from it instead of parsing the CSV
+    warehouse_path = os.environ.get(WAREHOUSE_ENV)
+    if warehouse and compact and warehouse_path:
+        from review_warehouse import load_from_warehouse
+        df = load_from_warehouse(warehouse_path, filename)
+        if df is not None:
+            return df
+    if not compact:
+        return pd.read_csv(filename)
+    return compact_reviews(pd.read_csv(filename))
@@ -0,0 +1,461 @@
+import os
+import argparse
+import numpy as np
+import pandas as pd
+from review_loader import load_reviews, compact_text
+from reviewer_index import reviewer_keys
+from duplicate_index import review_uid_numbers
+
+# One raw little-endian file per column, all with one entry per review. Rows of a product are contiguous and
+# sorted by day (reviews without a date last), so a product or a date range within it is a plain slice.
+COLUMNS = {
+    'day': np.dtype('<i4'),
+    'rating': np.dtype('i1'),
+    'product': np.dtype('<i4'),
+    'reviewer': np.dtype('<u8'),
+    'review_uid': np.dtype('<i8'),
+    'has_text': np.dtype('?'),
+    'csv_row': np.dtype('<i4'),
+}
+STORED_COLUMNS = ['rating', 'review_content', 'review_day']
+# The other CSV columns (categoricals, review_title and whatever else a review site writes) are one int32 code per
+# row in extra/<i>.codes.bin, -1 when missing, into a dictionary of the column's values kept as UTF-8 strings in
+# extra/<i>.values.bin (value j is values[value_offsets[j]:value_offsets[j + 1]]). extra/columns.txt names column i,
+# and schema.csv lists each product's CSV columns in file order with the dtypes to rebuild them with.
+SCHEMA_COLUMNS = ['product', 'column', 'dtype', 'value_dtype']
+VALUE_DTYPES = {'object': str, 'int64': int, 'float64': float, 'bool': lambda value: value == 'True'}
+CODE_DTYPE = np.dtype('<i4')
+# Review texts are concatenated UTF-8 in text.bin; review i is text[text_offsets[i]:text_offsets[i + 1]]
+OFFSET_DTYPE = np.dtype('<i8')
+PRODUCT_COLUMNS = ['product', 'source', 'filename', 'product_name', 'mtime', 'start', 'stop', 'active']
+MISSING_DAY = np.iinfo(np.int32).min
+MISSING_RATING = np.iinfo(np.int8).min
+COMPACT_FRACTION = 0.25
+
+def get_args():
+    parser = argparse.ArgumentParser(description='Consolidated, memory-mapped store of all collected reviews.')
+    subparsers = parser.add_subparsers(dest='command', required=True)
+    build = subparsers.add_parser('build', help='Add new or changed review files to the warehouse')
+    build.add_argument('foldernames', type=str, nargs='+', help='The names of the folders, ex. Coupang Saladlab Crema')
+    compact = subparsers.add_parser('compact', help='Rewrite the warehouse without the rows of replaced files')
+    info = subparsers.add_parser('info', help='Print the products in the warehouse')
+    for subparser in [build, compact, info]:
+        subparser.add_argument('--warehouse', type=str, default='./review_warehouse', help='Folder of the review warehouse')
+    return parser.parse_args()
+
+def create_folder(folder_path):
+    if not os.path.exists(folder_path):
+        os.makedirs(folder_path)
+
+def source_of(filename):
+    # ./Coupang_Collected_Reviews/x.csv -> Coupang
+    folder = os.path.basename(os.path.dirname(os.path.abspath(filename)))
+    return folder[:-len('_Collected_Reviews')] if folder.endswith('_Collected_Reviews') else folder
+
+def product_columns(df, source, product_id):
+    ratings = df['rating'].astype('float64')
+    valid = ratings.dropna()
+    if not ((valid % 1 == 0).all() and valid.between(MISSING_RATING + 1, 127).all()):
+        raise ValueError('ratings must be whole numbers to be stored as int8')
+    days = df['review_day'].astype('float64').fillna(MISSING_DAY).to_numpy().astype(np.int32)
+    order = np.lexsort((days, days == MISSING_DAY))
+    if 'user_uid' in df.columns or 'username_1' in df.columns:
+        reviewers, known = reviewer_keys(df, source)
+    else:
+        reviewers, known = np.zeros(len(df), dtype=np.uint64), np.zeros(len(df), dtype=bool)
+    has_text = df['review_content'].notna().to_numpy()
+    texts = df['review_content'].astype(object).where(has_text, '').to_numpy(dtype=object)[order]
+    encoded = [text.encode('utf-8') for text in texts]
+    extra = {col: extra_column(df[col]) for col in df.columns if col not in STORED_COLUMNS}
+    return {
+        'day': days[order],
+        'rating': ratings.fillna(MISSING_RATING).to_numpy()[order].astype(np.int8),
+        'product': np.full(len(df), product_id, dtype=np.int32),
+        'reviewer': np.where(known, reviewers, 0)[order],
+        'review_uid': review_uid_numbers(df['review_uid'])[order] if 'review_uid' in df.columns else order.astype(np.int64),
+        'has_text': has_text[order],
+        'csv_row': order.astype(np.int32),
+    }, encoded, extra, order
+
+def extra_column(series):
+    # (dtype, value dtype, codes, distinct values as strings) of a column outside the fixed-width files
+    if isinstance(series.dtype, pd.CategoricalDtype):
+        dtype, codes, values = 'category', series.cat.codes.to_numpy(), series.cat.categories
+    else:
+        dtype = 'string' if isinstance(series.dtype, pd.StringDtype) else 'plain'
+        codes, values = pd.factorize(series)
+    value_dtype = 'object' if dtype == 'string' else str(values.dtype)
+    if value_dtype not in VALUE_DTYPES:
+        raise ValueError(f'column {series.name} of dtype {value_dtype} cannot be stored')
+    strings = [repr(float(value)) if value_dtype == 'float64' else str(value) for value in values]
+    return dtype, value_dtype, codes, strings
+
+def rebuild_column(dtype, value_dtype, codes, values):
+    # The inverse of extra_column for codes into values (already converted to value_dtype); code -1 picks the missing
+    # value appended last
+    if dtype == 'category':
+        # astype('category') sorts the categories
+        order = np.argsort(values, kind='stable')
+        rank = np.empty(len(order) + 1, dtype=np.int64)
+        rank[order], rank[-1] = np.arange(len(order)), -1
+        return pd.Categorical.from_codes(rank[codes], categories=pd.Index(values[order], dtype=value_dtype))
+    if value_dtype == 'object':
+        column = np.append(values.astype(object), np.nan)[codes]
+        return compact_text(pd.Series(column, dtype=object)).array if dtype == 'string' else column
+    if (codes < 0).any():
+        return np.append(values.astype('float64'), np.nan)[codes]
+    return values[codes]
+
+class ReviewWarehouse:
+    def __init__(self, folder):
+        self.folder = folder
+        create_folder(folder)
+        self.products_path = os.path.join(folder, 'products.csv')
+        self.schema_path = os.path.join(folder, 'schema.csv')
+        self.extra_folder = os.path.join(folder, 'extra')
+        self.extra_names_path = os.path.join(self.extra_folder, 'columns.txt')
+        if os.path.exists(self.products_path):
+            self.products = pd.read_csv(self.products_path, keep_default_na=False, dtype={'product_name': str}, float_precision='round_trip')
+        else:
+            self.products = pd.DataFrame({col: pd.Series(dtype=dtype) for col, dtype in zip(
+                PRODUCT_COLUMNS, [np.int64, str, str, str, np.float64, np.int64, np.int64, bool])})
+        # Products added before their other CSV columns were stored have no schema rows and are read from their CSV
+        if os.path.exists(self.schema_path):
+            self.schema = pd.read_csv(self.schema_path, keep_default_na=False, dtype={'column': str})
+            self.schema = self.schema[self.schema['product'].isin(self.products['product'])]
+        else:
+            self.schema = pd.DataFrame({col: pd.Series(dtype=dtype) for col, dtype in zip(SCHEMA_COLUMNS, [np.int64, str, str, str])})
+        self.extra_names = open(self.extra_names_path, encoding='utf-8').read().split('\n') if os.path.exists(self.extra_names_path) else []
+        self.open()
+
+    def path(self, name):
+        return os.path.join(self.folder, f'{name}.bin')
+
+    def extra_path(self, index, name):
+        return os.path.join(self.extra_folder, f'{index}.{name}.bin')
+
+    def open(self):
+        # products.csv is written last, so rows past its last stop (from an interrupted build) are ignored
+        self.rows = int(self.products['stop'].max()) if len(self.products) else 0
+        self.columns = {name: self.map(name, dtype, self.rows) for name, dtype in COLUMNS.items()}
+        self.text_offsets = self.map('text_offsets', OFFSET_DTYPE, self.rows + 1)
+        self.text = self.map('text', np.dtype('u1'), int(self.text_offsets[-1]))
+        self.extra_codes, self.value_offsets, self.values = [], [], []
+        for index in range(len(self.extra_names)):
+            self.extra_codes.append(self.map(self.extra_path(index, 'codes'), CODE_DTYPE, self.rows))
+            # Values past the last whole offset (from an interrupted build) are ignored
+            n_offsets = os.path.getsize(self.extra_path(index, 'value_offsets')) // OFFSET_DTYPE.itemsize
+            self.value_offsets.append(self.map(self.extra_path(index, 'value_offsets'), OFFSET_DTYPE, max(n_offsets, 1)))
+            self.values.append(self.map(self.extra_path(index, 'values'), np.dtype('u1'), int(self.value_offsets[-1][-1])))
+
+    def map(self, name, dtype, length):
+        path = name if name.endswith('.bin') else self.path(name)
+        if length == 0 or not os.path.exists(path):
+            return np.zeros(length, dtype=dtype)
+        return np.memmap(path, dtype=dtype, mode='r', shape=(length,))
+
+    def close(self):
+        self.columns, self.text_offsets, self.text = {}, None, None
+        self.extra_codes, self.value_offsets, self.values = [], [], []
+
+    def truncate(self):
+        # Drop whatever an interrupted build appended, before appending again
+        text_size = int(self.text_offsets[-1])
+        value_sizes = [int(offsets[-1]) for offsets in self.value_offsets]
+        n_values = [len(offsets) for offsets in self.value_offsets]
+        self.close()
+        for name, dtype in COLUMNS.items():
+            self.resize(self.path(name), self.rows * dtype.itemsize)
+        # A new offsets file is zero-filled to its leading 0
+        self.resize(self.path('text_offsets'), (self.rows + 1) * OFFSET_DTYPE.itemsize)
+        self.resize(self.path('text'), text_size)
+        for index, (value_size, n) in enumerate(zip(value_sizes, n_values)):
+            self.resize(self.extra_path(index, 'codes'), self.rows * CODE_DTYPE.itemsize)
+            self.resize(self.extra_path(index, 'value_offsets'), n * OFFSET_DTYPE.itemsize)
+            self.resize(self.extra_path(index, 'values'), value_size)
+        return text_size, value_sizes
+
+    @staticmethod
+    def resize(path, size):
+        with open(path, 'ab') as f:
+            f.truncate(size)
+
+    def load_dictionaries(self):
+        # {value string: code} of every extra column, to code the values of new products
+        dictionaries = []
+        for values, offsets in zip(self.values, self.value_offsets):
+            data = bytes(values)
+            dictionaries.append({data[a:b].decode('utf-8'): code for code, (a, b) in enumerate(zip(offsets[:-1], offsets[1:]))})
+        return dictionaries
+
+    def add_extra_column(self, name):
+        # A column first seen now gets a code file with -1 for every earlier row
+        index = len(self.extra_names)
+        self.extra_names.append(name)
+        create_folder(self.extra_folder)
+        np.full(self.rows, -1, dtype=CODE_DTYPE).tofile(self.extra_path(index, 'codes'))
+        np.zeros(1, dtype=OFFSET_DTYPE).tofile(self.extra_path(index, 'value_offsets'))
+        open(self.extra_path(index, 'values'), 'wb').close()
+        return index
+
+    def needs_update(self, source, filename, mtime):
+        current = self.products[(self.products['source'] == source) & (self.products['filename'] == filename) & self.products['active']]
+        return current.empty or current['mtime'].iloc[0] != mtime
+
+    def add_products(self, entries):
+        # entries: (source, filename, mtime, df); a changed file gets a new product id and its old rows become inactive
+        dictionaries = self.load_dictionaries()
+        text_size, value_sizes = self.truncate()
+        files = {name: open(self.path(name), 'ab') for name in list(COLUMNS) + ['text_offsets', 'text']}
+        extra_files = []
+        schema = [self.schema]
+
+        def open_extra(index):
+            extra_files.append({name: open(self.extra_path(index, name), 'ab') for name in ['codes', 'value_offsets', 'values']})
+
+        for index in range(len(self.extra_names)):
+            open_extra(index)
+        try:
+            for source, filename, mtime, df in entries:
+                product_id = int(self.products['product'].max() + 1) if len(self.products) else 0
+                try:
+                    columns, encoded, extra, order = product_columns(df, source, product_id)
+                except ValueError as e:
+                    print(f"Skipping {filename}: {e}")
+                    continue
+                for name, values in columns.items():
+                    files[name].write(values.astype(COLUMNS[name]).tobytes())
+                lengths = np.fromiter((len(text) for text in encoded), dtype=np.int64, count=len(encoded))
+                files['text_offsets'].write((text_size + np.cumsum(lengths)).astype(OFFSET_DTYPE).tobytes())
+                files['text'].write(b''.join(encoded))
+                text_size += int(lengths.sum())
+
+                for name in extra:
+                    if name not in self.extra_names:
+                        open_extra(self.add_extra_column(name))
+                        dictionaries.append({})
+                        value_sizes.append(0)
+                for index, name in enumerate(self.extra_names):
+                    if name not in extra:
+                        extra_files[index]['codes'].write(np.full(len(df), -1, dtype=CODE_DTYPE).tobytes())
+                        continue
+                    _, _, codes, strings = extra[name]
+                    dictionary, new_values = dictionaries[index], []
+                    for value in strings:
+                        if value not in dictionary:
+                            dictionary[value] = len(dictionary)
+                            new_values.append(value.encode('utf-8'))
+                    lookup = np.fromiter((dictionary[value] for value in strings), dtype=np.int64, count=len(strings))
+                    codes = np.where(codes >= 0, lookup[np.maximum(codes, 0)] if len(lookup) else -1, -1)[order]
+                    extra_files[index]['codes'].write(codes.astype(CODE_DTYPE).tobytes())
+                    lengths = np.fromiter((len(value) for value in new_values), dtype=np.int64, count=len(new_values))
+                    extra_files[index]['value_offsets'].write((value_sizes[index] + np.cumsum(lengths)).astype(OFFSET_DTYPE).tobytes())
+                    extra_files[index]['values'].write(b''.join(new_values))
+                    value_sizes[index] += int(lengths.sum())
+                schema.append(pd.DataFrame({
+                    'product': product_id,
+                    'column': list(df.columns),
+                    'dtype': [extra[name][0] if name in extra else 'stored' for name in df.columns],
+                    'value_dtype': [extra[name][1] if name in extra else '' for name in df.columns],
+                }))
+
+                stale = (self.products['source'] == source) & (self.products['filename'] == filename)
+                self.products.loc[stale, 'active'] = False
+                # A missing product name (Crema pages have none) is stored as '' and read back as missing
+                product_name = str(df['product_name'].iloc[0]) if len(df) and pd.notna(df['product_name'].iloc[0]) else ''
+                self.products.loc[len(self.products)] = [product_id, source, filename, product_name, mtime,
+                                                         self.rows, self.rows + len(df), True]
+                self.rows += len(df)
+        finally:
+            for f in list(files.values()) + [f for group in extra_files for f in group.values()]:
+                f.close()
+        if self.extra_names:
+            with open(self.extra_names_path, 'w', encoding='utf-8') as f:
+                f.write('\n'.join(self.extra_names))
+        self.schema = pd.concat([frame for frame in schema if len(frame)] or schema, ignore_index=True)
+        self.schema.to_csv(self.schema_path, index=False)
+        self.products.to_csv(self.products_path, index=False)
+        self.open()
+
+    def inactive_rows(self):
+        inactive = self.products[~self.products['active']]
+        return int((inactive['stop'] - inactive['start']).sum())
+
+    def compact(self):
+        # Rewrite every file with the rows of active products only, then swap them in
+        active = self.products[self.products['active']].sort_values('start')
+        keep = np.concatenate([np.arange(start, stop) for start, stop in zip(active['start'], active['stop'])] + [np.empty(0, dtype=np.int64)])
+        starts, stops = self.text_offsets[:-1][keep], self.text_offsets[1:][keep]
+        lengths = stops - starts
+        for name, dtype in COLUMNS.items():
+            np.asarray(self.columns[name])[keep].tofile(self.path(name) + '.tmp')
+        # The dictionaries are kept whole, so the codes stay valid
+        for index, codes in enumerate(self.extra_codes):
+            np.asarray(codes)[keep].tofile(self.extra_path(index, 'codes') + '.tmp')
+        np.concatenate([[0], np.cumsum(lengths)]).astype(OFFSET_DTYPE).tofile(self.path('text_offsets') + '.tmp')
+        with open(self.path('text') + '.tmp', 'wb') as f:
+            for start, stop in zip(active['start'], active['stop']):
+                f.write(self.text[self.text_offsets[start]:self.text_offsets[stop]].tobytes())
+
+        sizes = (active['stop'] - active['start']).to_numpy()
+        active = active.assign(start=np.cumsum(sizes) - sizes, stop=np.cumsum(sizes))
+        self.close()
+        for name in list(COLUMNS) + ['text_offsets', 'text']:
+            os.replace(self.path(name) + '.tmp', self.path(name))
+        for index in range(len(self.extra_names)):
+            os.replace(self.extra_path(index, 'codes') + '.tmp', self.extra_path(index, 'codes'))
+        self.products = active.reset_index(drop=True)
+        self.schema = self.schema[self.schema['product'].isin(self.products['product'])]
+        self.schema.to_csv(self.schema_path, index=False)
+        self.products.to_csv(self.products_path, index=False)
+        self.open()
+
+    def find_product(self, source, filename):
+        current = self.products[(self.products['source'] == source) & (self.products['filename'] == filename) & self.products['active']]
+        return None if current.empty else current.iloc[0]
+
+    def row_range(self, product_id, start_day=None, end_day=None):
+        # Slice of a product's rows, optionally only reviews dated start_day <= day < end_day (day offsets)
+        product = self.products[self.products['product'] == product_id].iloc[0]
+        start, stop = int(product['start']), int(product['stop'])
+        if start_day is None and end_day is None:
+            return slice(start, stop)
+        days = self.columns['day'][start:stop]
+        dated = int(np.searchsorted(days == MISSING_DAY, True))
+        first = int(np.searchsorted(days[:dated], start_day, side='left')) if start_day is not None else 0
+        last = int(np.searchsorted(days[:dated], end_day, side='left')) if end_day is not None else dated
+        return slice(start + first, start + last)
+
+    def date_range(self, start_day, end_day):
+        # {product id: row slice} of every active product's reviews dated start_day <= day < end_day
+        active = self.products.loc[self.products['active'], 'product']
+        return {int(product_id): self.row_range(product_id, start_day, end_day) for product_id in active}
+
+    def view(self, rows):
+        # Zero-copy views of the fixed-width columns for a row slice
+        return {name: column[rows] for name, column in self.columns.items()}
+
+    def texts(self, rows):
+        # Review texts of a row slice as Arrow strings over the memory-mapped blob, or decoded Python strings without pyarrow
+        has_text = self.columns['has_text'][rows]
+        offsets = self.text_offsets[rows.start:rows.stop + 1]
+        try:
+            import pyarrow as pa
+        except ImportError:
+            data = self.text
+            values = [bytes(data[a:b]).decode('utf-8') if valid else np.nan
+                      for a, b, valid in zip(offsets[:-1], offsets[1:], has_text)]
+            return pd.Series(values, dtype=object)
+        validity = pa.py_buffer(np.packbits(has_text, bitorder='little'))
+        data = pa.py_buffer(self.text) if len(self.text) else pa.py_buffer(b'')
+        array = pa.Array.from_buffers(pa.large_string(), len(has_text), [validity, pa.py_buffer(offsets), data])
+        return pd.Series(pd.arrays.ArrowStringArray(pa.chunked_array([array])))
+
+    def product_frame(self, product_id, start_day=None, end_day=None):
+        # The same columns, dtypes and row order as review_loader.load_reviews of the product's CSV (only the reviews
+        # dated start_day <= day < end_day when given)
+        schema = self.schema[self.schema['product'] == product_id]
+        product_rows = self.row_range(product_id)
+        rows = self.row_range(product_id, start_day, end_day)
+        columns = self.view(rows)
+        order = np.argsort(np.asarray(columns['csv_row']))
+        rating, day = np.asarray(columns['rating'])[order], np.asarray(columns['day'])[order]
+        stored = {
+            'rating': lambda: pd.arrays.IntegerArray(rating, rating == MISSING_RATING),
+            'review_content': lambda: self.texts(rows).array.take(order),
+            'review_day': lambda: pd.arrays.IntegerArray(day, day == MISSING_DAY),
+        }
+        df = {}
+        for name, dtype, value_dtype in zip(schema['column'], schema['dtype'], schema['value_dtype']):
+            if dtype == 'stored':
+                df[name] = stored[name]()
+                continue
+            index = self.extra_names.index(name)
+            # Only the values the whole product uses are decoded, so a date range keeps the product's categories
+            product_codes = np.asarray(self.extra_codes[index][product_rows])
+            used = np.unique(product_codes[product_codes >= 0])
+            codes = np.asarray(self.extra_codes[index][rows])[order]
+            local = np.where(codes >= 0, np.searchsorted(used, codes), -1)
+            df[name] = rebuild_column(dtype, value_dtype, local, self.extra_values(index, used, value_dtype))
+        return pd.DataFrame(df, columns=list(schema['column']))
+
+    def extra_values(self, index, codes, value_dtype):
+        # Dictionary values of the given (sorted) codes of an extra column, converted to value_dtype; Arrow parses
+        # the numbers without a Python object per value when pyarrow is installed
+        offsets = self.value_offsets[index]
+        try:
+            import pyarrow as pa
+        except ImportError:
+            pa = None
+        if pa is not None and value_dtype in ['object', 'int64', 'float64']:
+            data = pa.py_buffer(self.values[index]) if len(self.values[index]) else pa.py_buffer(b'')
+            array = pa.Array.from_buffers(pa.large_string(), len(offsets) - 1, [None, pa.py_buffer(offsets), data]).take(pa.array(codes))
+            if value_dtype != 'object':
+                array = array.cast(pa.from_numpy_dtype(np.dtype(value_dtype)))
+            return array.to_numpy(zero_copy_only=False).astype(value_dtype)
+        offsets = np.asarray(offsets)
+        starts, stops = offsets[codes].tolist(), offsets[codes + 1].tolist()
+        base = starts[0] if starts else 0
+        data = bytes(self.values[index][base:stops[-1] if stops else 0])
+        convert = VALUE_DTYPES[value_dtype]
+        return np.array([convert(data[a - base:b - base].decode('utf-8')) for a, b in zip(starts, stops)], dtype=value_dtype)
+
+    def scan(self, name):
+        # Whole-catalog column (active and replaced rows alike, see active_rows)
+        return self.columns[name]
+
+    def active_rows(self):
+        active = np.zeros(self.rows, dtype=bool)
+        for start, stop in zip(self.products.loc[self.products['active'], 'start'], self.products.loc[self.products['active'], 'stop']):
+            active[start:stop] = True
+        return active
+
+def load_from_warehouse(warehouse_path, filename):
+    # The warehouse copy of a review file, or None when it is missing or older than the file on disk
+    warehouse = ReviewWarehouse(warehouse_path)
+    product = warehouse.find_product(source_of(filename), os.path.basename(filename))
+    if product is None:
+        return None
+    if os.path.exists(filename) and os.path.getmtime(filename) != product['mtime']:
+        return None
+    # Products added before the other CSV columns were kept are read from their CSV until the file is added again
+    if not (warehouse.schema['product'] == product['product']).any():
+        return None
+    return warehouse.product_frame(product['product'])
+
+def review_files(foldernames, warehouse):
+    # Yields one file at a time, so only one product is in memory while the warehouse is appended to
+    for foldername in foldernames:
+        folder_path = f'./{foldername}_Collected_Reviews'
+        if not os.path.exists(folder_path):
+            print(f"The folder {folder_path} does not exist.")
+            continue
+        for filename in sorted(os.listdir(folder_path)):
+            if not filename.endswith('.csv'):
+                continue
+            file_path = os.path.join(folder_path, filename)
+            mtime = os.path.getmtime(file_path)
+            if not warehouse.needs_update(foldername, filename, mtime):
+                continue
+            print(f"Adding file: {filename}")
+            yield foldername, filename, mtime, load_reviews(file_path, warehouse=False)
+
+def build(warehouse, foldernames):
+    warehouse.add_products(review_files(foldernames, warehouse))
+    if warehouse.inactive_rows() > COMPACT_FRACTION * warehouse.rows:
+        warehouse.compact()
+
+def main():
+    args = get_args()
+    warehouse = ReviewWarehouse(args.warehouse)
+    if args.command == 'build':
+        build(warehouse, args.foldernames)
+    elif args.command == 'compact':
+        warehouse.compact()
+    active = warehouse.products[warehouse.products['active']]
+    print(f"{len(active)} products, {warehouse.rows} rows ({warehouse.inactive_rows()} replaced), {len(warehouse.text) / 1e6:.1f} MB of review text")
+    if args.command == 'info':
+        print(active[['product', 'source', 'filename', 'product_name', 'start', 'stop']].to_string(index=False))
+
+if __name__ == "__main__":
+    main()
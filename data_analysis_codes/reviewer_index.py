@@ -0,0 +1,228 @@
+import os
+import argparse
+import numpy as np
+import pandas as pd
+from review_loader import load_reviews
+
+MISSING_USERNAMES = ['', 'N/A', '-', 'nan']
+# Display names that the site masks (김**) or that are this short are shared by many unrelated reviewers, so they are
+# not used as reviewer keys either
+MASK_PATTERN = '[*＊]'
+MIN_NAME_LENGTH = 3
+
+def get_args():
+    parser = argparse.ArgumentParser(description='Build the cross-product reviewer index and report coordinated reviewers.')
+    parser.add_argument('foldernames', type=str, nargs='+', help='The names of the folders, ex. Coupang Saladlab Crema')
+    parser.add_argument('--index', type=str, default='./reviewer_index.npz', help='Path of the reviewer index file')
+    parser.add_argument('--min-products', type=int, default=5, help='Flag reviewers active on more than this many products within the window')
+    parser.add_argument('--window', type=int, default=3, help='Window length in days')
+    parser.add_argument('--min-rating', type=int, default=None, help='Only count reviews with at least this rating, ex. 5')
+    args = parser.parse_args()
+    return args
+
+def create_folder(folder_path):
+    if not os.path.exists(folder_path):
+        os.makedirs(folder_path)
+
+def empty_index():
+    return {
+        'reviewer': np.empty(0, dtype=np.uint64),
+        'product': np.empty(0, dtype=np.int32),
+        'day': np.empty(0, dtype=np.int32),
+        'rating': np.empty(0, dtype=np.int8),
+        'product_source': np.empty(0, dtype=str),
+        'product_file': np.empty(0, dtype=str),
+        'product_name': np.empty(0, dtype=str),
+        'product_mtime': np.empty(0, dtype=np.float64),
+    }
+
+def load_index(index_path):
+    if not os.path.exists(index_path):
+        return empty_index()
+    with np.load(index_path) as data:
+        return {key: data[key] for key in data.files}
+
+def save_index(index, index_path):
+    np.savez(index_path, **index)
+
+def reviewer_keys(df, source):
+    # Coupang exposes a member id, the other sources only (often masked) display names
+    if 'user_uid' in df.columns:
+        names = df['user_uid'].astype(str)
+        known = ~names.isin(MISSING_USERNAMES)
+    else:
+        parts = [df[col].astype(str) for col in ['username_1', 'username_2']]
+        names = parts[0] + '|' + parts[1]
+        visible = parts[0].where(~parts[0].isin(MISSING_USERNAMES), '') + parts[1].where(~parts[1].isin(MISSING_USERNAMES), '')
+        known = ~visible.str.contains(MASK_PATTERN) & (visible.str.len() >= MIN_NAME_LENGTH)
+    keys = (source + ':' + names).to_numpy(dtype=object)
+    return pd.util.hash_array(keys), known.to_numpy()
+
+def product_postings(df, source, product_id):
+    hashes, known = reviewer_keys(df, source)
+    known &= df['review_day'].notna().to_numpy()
+    ratings = df['rating'].astype('float64').fillna(0).to_numpy()
+    return {
+        'reviewer': hashes[known],
+        'product': np.full(known.sum(), product_id, dtype=np.int32),
+        'day': df['review_day'].to_numpy(dtype=np.float64)[known].astype(np.int32),
+        'rating': ratings[known].astype(np.int8),
+    }
+
+def sort_postings(index):
+    order = np.lexsort((index['product'], index['day'], index['reviewer']))
+    for key in ['reviewer', 'product', 'day', 'rating']:
+        index[key] = index[key][order]
+    return index
+
+def update_index(index, foldernames):
+    # Only files that are new or changed since the last build are (re)read; products of the listed folders whose file
+    # is gone are dropped (products of other folders are kept, their folder may just not be here)
+    known_products = {(s, f): i for i, (s, f) in enumerate(zip(index['product_source'], index['product_file']))}
+    postings = {key: [index[key]] for key in ['reviewer', 'product', 'day', 'rating']}
+    products = {key: list(index[key]) for key in ['product_source', 'product_file', 'product_name', 'product_mtime']}
+    stale = []
+    listed_folders, listed_files = set(), set()
+    added = 0
+
+    for foldername in foldernames:
+        folder_path = f'./{foldername}_Collected_Reviews'
+        if not os.path.exists(folder_path):
+            print(f"The folder {folder_path} does not exist.")
+            continue
+        listed_folders.add(foldername)
+        for filename in sorted(os.listdir(folder_path)):
+            if not filename.endswith('.csv'):
+                continue
+            listed_files.add((foldername, filename))
+            file_path = os.path.join(folder_path, filename)
+            mtime = os.path.getmtime(file_path)
+            product_id = known_products.get((foldername, filename))
+            if product_id is not None and products['product_mtime'][product_id] == mtime:
+                continue
+            if product_id is None:
+                product_id = len(products['product_file'])
+                for key, value in zip(['product_source', 'product_file', 'product_name', 'product_mtime'], [foldername, filename, '', mtime]):
+                    products[key].append(value)
+            else:
+                stale.append(product_id)
+                products['product_mtime'][product_id] = mtime
+
+            print(f"Indexing file: {filename}")
+            df = load_reviews(file_path)
+            products['product_name'][product_id] = str(df['product_name'].iloc[0]) if len(df) else ''
+            for key, value in product_postings(df, foldername, product_id).items():
+                postings[key].append(value)
+            added += 1
+
+    merged = {key: np.concatenate(values) for key, values in postings.items()}
+    if stale:
+        # Drop the old postings of products whose file changed; their fresh postings were appended last
+        fresh_start = len(index['reviewer'])
+        keep = ~np.isin(merged['product'], stale)
+        keep[fresh_start:] = True
+        merged = {key: value[keep] for key, value in merged.items()}
+    deleted = [i for i, (source, filename) in enumerate(zip(products['product_source'], products['product_file']))
+               if source in listed_folders and (source, filename) not in listed_files]
+    if deleted:
+        # Product ids are positions in the product arrays, so the remaining products are renumbered
+        kept_products = np.ones(len(products['product_file']), dtype=bool)
+        kept_products[deleted] = False
+        new_ids = (np.cumsum(kept_products) - 1).astype(np.int32)
+        keep = kept_products[merged['product']]
+        merged = {key: value[keep] for key, value in merged.items()}
+        merged['product'] = new_ids[merged['product']]
+        products = {key: [value for value, kept in zip(values, kept_products) if kept] for key, values in products.items()}
+        print(f"Dropped {len(deleted)} products whose file was deleted")
+    merged['product_source'] = np.array(products['product_source'], dtype=str)
+    merged['product_file'] = np.array(products['product_file'], dtype=str)
+    merged['product_name'] = np.array(products['product_name'], dtype=str)
+    merged['product_mtime'] = np.array(products['product_mtime'], dtype=np.float64)
+    print(f"Indexed {added} new or changed files, {len(merged['reviewer'])} postings in total")
+    return sort_postings(merged)
+
+def select_postings(index, min_rating=None):
+    reviewer, product, day = index['reviewer'], index['product'], index['day']
+    if min_rating is not None:
+        mask = index['rating'] >= min_rating
+        reviewer, product, day = reviewer[mask], product[mask], day[mask]
+    # Postings are sorted by (reviewer, day, product), so repeats of the same triple are adjacent
+    first = np.ones(len(reviewer), dtype=bool)
+    first[1:] = (reviewer[1:] != reviewer[:-1]) | (day[1:] != day[:-1]) | (product[1:] != product[:-1])
+    return reviewer[first], product[first], day[first]
+
+def find_active_reviewers(index, min_products, window_days, min_rating=None):
+    # Reviewers with more than min_products distinct products within some window [day, day + window_days)
+    reviewer, product, day = select_postings(index, min_rating)
+    _, reviewer_rank, postings_per_reviewer = np.unique(reviewer, return_inverse=True, return_counts=True)
+    candidates = postings_per_reviewer[reviewer_rank] > min_products
+    reviewer, product, day, reviewer_rank = reviewer[candidates], product[candidates], day[candidates], reviewer_rank[candidates]
+    if len(reviewer) == 0:
+        return pd.DataFrame({'reviewer': np.empty(0, dtype=np.uint64), 'max_products_in_window': np.empty(0, dtype=np.int64), 'window_start_day': np.empty(0, dtype=np.int64)})
+
+    # One sorted int64 key per posting turns every window into a searchsorted range [i, window_end[i])
+    span = np.int64(day.max()) - np.int64(day.min()) + window_days + 1
+    key = reviewer_rank.astype(np.int64) * span + (day.astype(np.int64) - day.min())
+    window_end = np.searchsorted(key, key + window_days, side='left')
+    postings_in_window = window_end - np.arange(len(key))
+
+    # A repeat review r of a pair whose previous posting is p is double counted by windows starting in
+    # [first i with window_end[i] > r, p], subtract those with a difference array
+    pair_order = np.lexsort((np.arange(len(key)), product, reviewer_rank))
+    same_pair = (reviewer_rank[pair_order][1:] == reviewer_rank[pair_order][:-1]) & (product[pair_order][1:] == product[pair_order][:-1])
+    repeats = pair_order[1:][same_pair]
+    previous = pair_order[:-1][same_pair]
+    repeat_counts = np.zeros(len(key) + 1, dtype=np.int64)
+    starts = np.searchsorted(window_end, repeats, side='right')
+    valid = starts <= previous
+    np.add.at(repeat_counts, starts[valid], 1)
+    np.add.at(repeat_counts, previous[valid] + 1, -1)
+    distinct_in_window = postings_in_window - np.cumsum(repeat_counts)[:-1]
+
+    result = pd.DataFrame({'reviewer': reviewer, 'max_products_in_window': distinct_in_window, 'window_start_day': day.astype(np.int64)})
+    result = result.sort_values('max_products_in_window', ascending=False).drop_duplicates('reviewer')
+    return result[result['max_products_in_window'] > min_products].reset_index(drop=True)
+
+def product_shares(index, active_reviewers):
+    df = pd.DataFrame({'product': index['product'], 'reviewer': index['reviewer']})
+    df['is_active'] = np.isin(df['reviewer'].to_numpy(), active_reviewers['reviewer'].to_numpy())
+    shares = df.groupby('product').agg(reviews_with_reviewer=('reviewer', 'size'), active_reviewer_reviews=('is_active', 'sum'))
+    shares['active_reviewers'] = df[df['is_active']].groupby('product')['reviewer'].nunique()
+    shares = shares.reindex(np.arange(len(index['product_file'])), fill_value=0).fillna(0).astype(np.int64)
+    shares['active_reviewer_review_percentage'] = (shares['active_reviewer_reviews'] / shares['reviews_with_reviewer'].where(shares['reviews_with_reviewer'] > 0) * 100).round(2)
+    shares['source'] = index['product_source']
+    shares['company_name'] = [filename.split('.')[0] for filename in index['product_file']]
+    shares['product_name'] = index['product_name']
+    return shares.reset_index(drop=True)
+
+def save_results(shares, foldernames, min_products, window_days):
+    for _, row in shares[shares['source'].isin(foldernames)].iterrows():
+        company_name = row['company_name']
+        folder_path = f'./results/{company_name}'
+        create_folder(folder_path)
+        results_df = pd.DataFrame({
+            'company_name': [company_name],
+            'product_name': [row['product_name']],
+            'min_products': [min_products],
+            'window_days': [window_days],
+            'active_reviewers': [row['active_reviewers']],
+            'active_reviewer_reviews': [row['active_reviewer_reviews']],
+            'active_reviewer_review_percentage': [row['active_reviewer_review_percentage']]
+        })
+        output_path = os.path.join(folder_path, f"{company_name}_reviewer_activity.csv")
+        results_df.to_csv(output_path, index=False)
+        print(f"CSV file saved to {output_path}")
+
+def main():
+    args = get_args()
+    index = update_index(load_index(args.index), args.foldernames)
+    save_index(index, args.index)
+
+    active_reviewers = find_active_reviewers(index, args.min_products, args.window, args.min_rating)
+    print(f"Reviewers active on more than {args.min_products} products within {args.window} days: {len(active_reviewers)}")
+
+    shares = product_shares(index, active_reviewers)
+    save_results(shares, args.foldernames, args.min_products, args.window)
+
+if __name__ == "__main__":
+    main()
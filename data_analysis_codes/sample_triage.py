@@ -0,0 +1,326 @@
+import os
+import math
+import time
+import argparse
+import numpy as np
+import pandas as pd
+from scipy.stats import norm
+from review_loader import load_reviews, day_to_timestamp, text_dtype, NAVER_PAY_PATTERN
+from external_ngrams import hash_ids, review_ngram_ids
+from text_cache import normalize_texts
+from isolation_forest import compute_daily_reviews, compute_rolling_mean, detect_anomalies
+from rating_trend_analysis import get_review_counts, add_missing_dates, fit_poisson_model
+
+# Quick triage of very large products. The duplicate and repeated-phrase metrics of unique_review_analysis.py and
+# phrase_repetition_analysis.py are estimated from a sample of reviews stratified by month, with confidence intervals;
+# the sample grows until the intervals of the percentages are narrow enough. Whether a sampled review is non-unique or
+# contains a common phrase still depends on the whole product, so its text and 3-5-grams are looked up in one vectorized
+# pass over all reviews (text codes, and counts of only the sampled n-grams). The burst metrics use every review, as
+# they only need the daily counts.
+
+PRECISION = 1.0
+CONFIDENCE = 0.95
+INITIAL_SAMPLE = 2000
+MIN_PER_STRATUM = 2
+MIN_LENGTH = 3
+MAX_LENGTH = 5
+BATCH_TOKENS = 1 << 20
+TEXT_CHUNK = 1 << 17
+# What word_tokenize still splits once string.punctuation is removed: the quote and dash characters below become tokens
+# of their own, and a few English contractions are split (cannot -> can not, gonna -> gon na, ...)
+TOKENIZER_SPLITS = '[«»‒–—―‘’“”„]|cannot|gimme|gonna|gotta|lemme|wanna'
+
+def get_args():
+    parser = argparse.ArgumentParser(description='Estimate the duplicate and phrase metrics of a large product from a sample.')
+    parser.add_argument('filename', type=str, help='The filename of the CSV (with extension)')
+    parser.add_argument('foldername', type=str, help='The name of the folder')
+    parser.add_argument('--precision', type=float, default=PRECISION, help='Largest half-width of the percentage intervals, in percentage points; 0 classifies every review')
+    parser.add_argument('--confidence', type=float, default=CONFIDENCE, help='Confidence level of the intervals')
+    parser.add_argument('--initial-sample', type=int, default=INITIAL_SAMPLE, help='Reviews in the first sample')
+    parser.add_argument('--min-freq', type=int, default=3, help='Occurrences for a phrase to count as common, as in phrase_repetition_analysis.py')
+    parser.add_argument('--seed', type=int, default=0, help='Random state of the sample')
+    return parser.parse_args()
+
+def create_folder(folder_path):
+    if not os.path.exists(folder_path):
+        os.makedirs(folder_path)
+
+def text_chunks(texts):
+    # The string operations of the tokenizer copy the column several times, so they run TEXT_CHUNK reviews at a time
+    for start in range(0, len(texts), TEXT_CHUNK):
+        yield texts.iloc[start:start + TEXT_CHUNK].astype(text_dtype() or 'string')
+
+def duplicate_flags(df):
+    # is_duplicate of unique_review_analysis.py for every review: same text after its preprocess_review, among the
+    # reviews with a text and a rating. Only the few texts that contain what preprocess_review removes are rewritten.
+    valid = (df['review_content'].notna() & df['rating'].notna()).to_numpy()
+    texts = df['review_content'][valid]
+    stamped = texts.str.contains('네이버 페이 구매평|쇼핑몰 추천 리뷰', regex=True).to_numpy(dtype=bool)
+    if stamped.any():
+        texts = texts.mask(stamped, texts[stamped].str.replace(NAVER_PAY_PATTERN, '', regex=True).str.replace('쇼핑몰 추천 리뷰', '', regex=False))
+    codes, _ = pd.factorize(texts)
+    flags = np.zeros(len(df), dtype=bool)
+    flags[valid] = np.bincount(codes)[codes] >= 2
+    return flags, valid
+
+def split_words(texts):
+    # Word codes of the texts, the distinct words they refer to and the number of words per text, split on whitespace
+    if text_dtype() is not None:
+        import pyarrow as pa
+        import pyarrow.compute as pc
+        # Unlike str.split(), Arrow gives empty words for leading and trailing whitespace; they are dropped
+        words = pc.utf8_split_whitespace(pa.array(texts))
+        flat = pc.list_flatten(words)
+        kept = pc.not_equal(pc.utf8_length(flat), 0)
+        parents = pc.list_parent_indices(words).to_numpy(zero_copy_only=False)[kept.to_numpy(zero_copy_only=False)]
+        encoded = pc.dictionary_encode(pc.filter(flat, kept))
+        lengths = np.bincount(parents, minlength=len(texts)).astype(np.int64)
+        return encoded.indices.to_numpy(zero_copy_only=False), encoded.dictionary.to_pandas(), lengths
+    words = texts.str.split()
+    codes, uniques = pd.factorize(words.explode().dropna())
+    return codes, pd.Series(uniques, dtype=object), words.str.len().to_numpy(dtype=np.int64)
+
+def tokenize_words(codes, words, lengths):
+    # The tokens word_tokenize gives for the normalized texts: the whitespace words, with the few distinct words it
+    # splits further (see TOKENIZER_SPLITS) replaced by its tokens of them
+    words = pd.Series(words, dtype=object).reset_index(drop=True)
+    suspect = np.flatnonzero(words.str.contains(TOKENIZER_SPLITS, regex=True).to_numpy(dtype=bool))
+    if not len(suspect):
+        return codes, words, lengths
+    from nltk import word_tokenize
+    pieces = [[word] for word in words]
+    for i in suspect.tolist():
+        pieces[i] = word_tokenize(words[i])
+    counts = np.fromiter(map(len, pieces), dtype=np.int64, count=len(pieces))
+    token_codes, tokens = pd.factorize(pd.Series([token for tokens in pieces for token in tokens], dtype=object))
+    starts = np.cumsum(counts) - counts
+    word_counts = counts[codes]
+    gathered = np.repeat(starts[codes] - (np.cumsum(word_counts) - word_counts), word_counts) + np.arange(word_counts.sum())
+    parents = np.repeat(np.arange(len(lengths)), lengths)
+    lengths = np.bincount(parents, weights=word_counts, minlength=len(lengths)).astype(np.int64)
+    return token_codes[gathered], pd.Series(tokens, dtype=object), lengths
+
+def token_stream(texts):
+    # Token ids of all reviews as one flat array, and the number of tokens of each review
+    vocabulary = pd.Index([], dtype=object)
+    token_ids, lengths = [], []
+    for chunk in text_chunks(texts):
+        codes, words, chunk_lengths = tokenize_words(*split_words(normalize_texts(chunk)))
+        vocabulary = vocabulary.append(pd.Index(words).difference(vocabulary))
+        token_ids.append(vocabulary.get_indexer(words).astype(np.int32)[codes])
+        lengths.append(chunk_lengths)
+    if not token_ids:
+        return np.empty(0, dtype=np.int32), np.empty(0, dtype=np.int64)
+    return np.concatenate(token_ids), np.concatenate(lengths)
+
+def gather_tokens(token_ids, starts, lengths, rows):
+    # Token ids of the given reviews, concatenated
+    picked = lengths[rows]
+    offsets = np.repeat(starts[rows] - (np.cumsum(picked) - picked), picked)
+    return token_ids[offsets + np.arange(picked.sum())], picked
+
+def batch_bounds(ends):
+    # (first, last) review ranges of about BATCH_TOKENS tokens, given the cumulative token counts of the reviews
+    cuts = np.searchsorted(ends, np.arange(BATCH_TOKENS, ends[-1] if len(ends) else 0, BATCH_TOKENS))
+    bounds = np.unique(np.concatenate([[0], cuts, [len(ends)]]))
+    return zip(bounds[:-1], bounds[1:])
+
+def count_ngrams(token_ids, lengths, candidates):
+    # Occurrences in the whole product of the candidate n-gram hashes (a pd.Index), a batch of reviews at a time
+    counts = np.zeros(len(candidates), dtype=np.int64)
+    ends = np.cumsum(lengths)
+    for first, last in batch_bounds(ends):
+        token_start = ends[first - 1] if first else 0
+        positions = candidates.get_indexer(hash_ids(review_ngram_ids(token_ids[token_start:ends[last - 1]], lengths[first:last], MIN_LENGTH, MAX_LENGTH)))
+        counts += np.bincount(positions[positions >= 0], minlength=len(candidates))
+    return counts
+
+class PhraseLookup:
+    """Product-wide counts of the n-grams of the sampled reviews."""
+
+    def __init__(self, texts, min_freq):
+        self.token_ids, self.lengths = token_stream(texts)
+        self.starts = np.cumsum(self.lengths) - self.lengths
+        self.min_freq = min_freq
+        self.hashes = pd.Index(np.empty(0, dtype=np.uint64))
+        self.counts = np.empty(0, dtype=np.int64)
+
+    def batches(self, rows):
+        # N-gram hashes of the reviews, about BATCH_TOKENS tokens at a time, with the position of their review in rows
+        for first, last in batch_bounds(np.cumsum(self.lengths[rows])):
+            token_ids, lengths = gather_tokens(self.token_ids, self.starts, self.lengths, rows[first:last])
+            ids, reviews = review_ngram_ids(token_ids, lengths, MIN_LENGTH, MAX_LENGTH, return_reviews=True)
+            yield hash_ids(ids), reviews + first
+
+    def count(self, rows):
+        # Counts the n-grams of the reviews that are not counted yet, in one pass over the product
+        new = np.empty(0, dtype=np.uint64)
+        for hashes, _ in self.batches(rows):
+            new = np.union1d(new, hashes[self.hashes.get_indexer(hashes) < 0])
+        if len(new):
+            self.counts = np.concatenate([self.counts, count_ngrams(self.token_ids, self.lengths, pd.Index(new))])
+            self.hashes = self.hashes.append(pd.Index(new))
+
+    def flags(self, rows, ahead):
+        # Whether each of the reviews contains an n-gram occurring at least min_freq times in the product. Every pass
+        # over the product is expensive, so when one is needed the n-grams of ahead, the reviews a larger sample would
+        # take next, are counted with it.
+        if any((self.hashes.get_indexer(hashes) < 0).any() for hashes, _ in self.batches(rows)):
+            self.count(np.union1d(rows, ahead))
+        flags = np.zeros(len(rows), dtype=bool)
+        for hashes, reviews in self.batches(rows):
+            flags[reviews[self.counts[self.hashes.get_indexer(hashes)] >= self.min_freq]] = True
+        return flags
+
+def month_strata(days):
+    # Calendar month of each review; reviews without a date form one more stratum
+    dated = ~np.isnan(days)
+    months = np.full(len(days), -1, dtype=np.int64)
+    timestamps = day_to_timestamp(days[dated].astype(np.int64))
+    months[dated] = timestamps.year * 12 + timestamps.month
+    return months
+
+class StratifiedSample:
+    """Reviews of each stratum in a fixed random order; a sample takes the first reviews of every stratum, so a larger
+    sample contains the smaller ones."""
+
+    def __init__(self, strata, seed=0):
+        order = np.random.default_rng(seed).permutation(len(strata))
+        self.order = order[np.argsort(strata[order], kind='stable')]
+        _, self.starts, self.sizes = np.unique(strata[self.order], return_index=True, return_counts=True)
+        self.taken = np.zeros(len(self.sizes), dtype=np.int64)
+
+    def allocate(self, sample_size):
+        # Proportional allocation with at least MIN_PER_STRATUM reviews per stratum, never less than already taken
+        wanted = np.round(sample_size * self.sizes / self.sizes.sum()).astype(np.int64)
+        return np.minimum(self.sizes, np.maximum(np.maximum(wanted, MIN_PER_STRATUM), self.taken))
+
+    def peek(self, sample_size):
+        # Rows a sample of this size would contain
+        taken = self.allocate(sample_size)
+        return np.concatenate([self.order[start:start + n] for start, n in zip(self.starts, taken)])
+
+    def grow(self, sample_size):
+        # New rows and their strata
+        taken = self.allocate(sample_size)
+        rows = [self.order[start + old:start + new] for start, old, new in zip(self.starts, self.taken, taken)]
+        strata = np.repeat(np.arange(len(self.sizes)), taken - self.taken)
+        self.taken = taken
+        return np.concatenate(rows), strata
+
+def stratified_total(values, strata, taken, sizes):
+    # Estimated product total of a per-review value and its variance, from the sampled reviews of each stratum
+    sums = np.bincount(strata, weights=values, minlength=len(sizes))
+    squares = np.bincount(strata, weights=values ** 2, minlength=len(sizes))
+    means = sums / taken
+    variances = np.where(taken > 1, np.maximum(squares - taken * means ** 2, 0) / np.maximum(taken - 1, 1), 0.0)
+    return (sizes * means).sum(), (sizes ** 2 * (1 - taken / sizes) * variances / taken).sum()
+
+def estimate_percentage(flags, strata, taken, sizes, z):
+    total, variance = stratified_total(flags.astype(np.float64), strata, taken, sizes)
+    half_width = z * math.sqrt(variance) / sizes.sum() * 100
+    percentage = total / sizes.sum() * 100
+    return percentage, max(percentage - half_width, 0.0), min(percentage + half_width, 100.0)
+
+def estimate_mean(ratings, domain, strata, taken, sizes, z):
+    # Average rating over the reviews of a domain (ex. non-unique ones), linearized for its variance
+    in_domain = domain.astype(np.float64)
+    count, _ = stratified_total(in_domain, strata, taken, sizes)
+    if count == 0:
+        return np.nan, np.nan, np.nan
+    rating_sum, _ = stratified_total(np.where(domain, ratings, 0.0), strata, taken, sizes)
+    mean = rating_sum / count
+    _, variance = stratified_total(np.where(domain, ratings - mean, 0.0) / count, strata, taken, sizes)
+    half_width = z * math.sqrt(variance)
+    return mean, mean - half_width, mean + half_width
+
+def estimate(flags, ratings, strata, sample, z):
+    rated = ~np.isnan(ratings)
+    non_unique, valid, with_phrases = flags
+    taken, sizes = sample.taken, sample.sizes
+    return {
+        'percentage_non_unique': estimate_percentage(non_unique, strata, taken, sizes, z),
+        'avg_ratings_unique': estimate_mean(ratings, valid & ~non_unique, strata, taken, sizes, z),
+        'avg_ratings_non_unique': estimate_mean(ratings, non_unique, strata, taken, sizes, z),
+        'percentage_of_review_w_common_phrases': estimate_percentage(with_phrases, strata, taken, sizes, z),
+        'ratings_with_phrases': estimate_mean(ratings, with_phrases & rated, strata, taken, sizes, z),
+        'ratings_without_phrases': estimate_mean(ratings, ~with_phrases & rated, strata, taken, sizes, z),
+    }
+
+def triage(df, precision=PRECISION, confidence=CONFIDENCE, initial_sample=INITIAL_SAMPLE, min_freq=3, seed=0):
+    """Estimates and (low, high) intervals of the sampled metrics, and the number of sampled reviews."""
+    z = norm.ppf(0.5 + confidence / 2)
+    non_unique, valid = duplicate_flags(df)
+    ratings = df['rating'].astype('float64').to_numpy()
+    lookup = PhraseLookup(df['review_content'], min_freq)
+    sample = StratifiedSample(month_strata(df['review_day'].astype('float64').to_numpy()), seed)
+
+    rows = np.empty(0, dtype=np.int64)
+    strata = np.empty(0, dtype=np.int64)
+    with_phrases = np.empty(0, dtype=bool)
+    # A simple random sample of this size gives intervals no wider than precision even for a 50% share; stratifying only
+    # narrows them, so the sample never needs to grow past it and one pass over the product counts all its n-grams
+    largest = len(df) if precision <= 0 else min(len(df), math.ceil(1.1 * (z * 50 / precision) ** 2))
+    ahead = sample.peek(largest)
+    sample_size = min(initial_sample, largest)
+    while True:
+        new_rows, new_strata = sample.grow(sample_size)
+        rows, strata = np.concatenate([rows, new_rows]), np.concatenate([strata, new_strata])
+        with_phrases = np.concatenate([with_phrases, lookup.flags(new_rows, ahead)])
+        estimates = estimate((non_unique[rows], valid[rows], with_phrases), ratings[rows], strata, sample, z)
+        widest = max((high - low) / 2 for name, (_, low, high) in estimates.items() if name.startswith('percentage'))
+        print(f"Sample of {len(rows)} reviews: " + ', '.join(f"{name} {value:.2f} [{low:.2f}, {high:.2f}]" for name, (value, low, high) in estimates.items()))
+        if widest <= precision or len(rows) >= largest:
+            return estimates, len(rows)
+        # The interval narrows about as 1 / sqrt(sample size)
+        sample_size = int(min(largest, len(rows) * max(1.5, 1.1 * (widest / precision) ** 2)))
+
+def burst_metrics(df):
+    # percentage_anomalies of isolation_forest.py and high_volume_review_percentage of rating_trend_analysis.py, from
+    # the daily counts of all reviews
+    df = df.dropna(subset=['review_day'])
+    if df.empty:
+        return np.nan, np.nan
+    daily_reviews = detect_anomalies(compute_rolling_mean(compute_daily_reviews(df)))
+    percentage_anomalies = daily_reviews['anomaly'].sum() / len(daily_reviews) * 100
+    review_counts_df = add_missing_dates(get_review_counts(df))
+    max_reviews_per_day = math.ceil(fit_poisson_model(review_counts_df).mu.max())
+    high_volume = review_counts_df.loc[review_counts_df['review_count'] > max_reviews_per_day, 'review_count'].sum() / len(df) * 100
+    return percentage_anomalies, high_volume
+
+def main():
+    args = get_args()
+    filename = os.path.join(f'./{args.foldername}_Collected_Reviews', args.filename)
+    company_name = args.filename.split('.')[0]
+    folder_path = f'./results/{company_name}'
+    create_folder(folder_path)
+
+    df = load_reviews(filename)
+    if df.empty:
+        print("No reviews found")
+        return
+    start = time.perf_counter()
+    estimates, sampled = triage(df, args.precision, args.confidence, args.initial_sample, args.min_freq, args.seed)
+    percentage_anomalies, high_volume_review_percentage = burst_metrics(df)
+    print(f"Estimated from {sampled} of {len(df)} reviews in {time.perf_counter() - start:.1f}s")
+
+    columns = {}
+    for name, (value, low, high) in estimates.items():
+        columns[name] = [round(value, 2)]
+        columns[f'{name}_ci_low'] = [round(low, 2)]
+        columns[f'{name}_ci_high'] = [round(high, 2)]
+    results_df = pd.DataFrame({
+        'company_name': [company_name],
+        'product_name': [df['product_name'].iloc[0] if len(df) else np.nan],
+        'total_reviews': [len(df)],
+        'sampled_reviews': [sampled],
+        **columns,
+        'percentage_anomalies': [round(percentage_anomalies, 2)],
+        'high_volume_review_percentage': [round(high_volume_review_percentage, 2)],
+    })
+    output_path = os.path.join(folder_path, f"{company_name}_triage.csv")
+    results_df.to_csv(output_path, index=False)
+    print(f"CSV file saved to {output_path}")
+
+if __name__ == "__main__":
+    main()
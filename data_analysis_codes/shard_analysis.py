@@ -0,0 +1,213 @@
+import os
+import multiprocessing
+from itertools import chain
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+import pandas as pd
+from external_ngrams import hash_ids, collapse, review_ngram_ids, MAX_N
+
+# Map-reduce over the reviews of one product, for a product too big for one core. The reviews are cut into contiguous
+# shards. Map: each shard's n-grams (or text hashes) are counted into a partial table sorted by hash. Reduce: the
+# partial tables are cut into hash ranges and each range is merged into the common phrases (or duplicated texts) by
+# one task. Flag: each shard's reviews are looked up in the merged table. The shards and ranges are spread over worker
+# processes; the results are the same as those of find_common_phrases, contains_common_phrase and DataFrame.duplicated.
+
+SHARD_TOKENS = 2000000
+REDUCE_ROWS = 4000000
+# Two independent 64-bit hashes stand in for a text: the first is the sort key, the second is compared like the token
+# ids of an n-gram
+TEXT_HASH_KEYS = ['shard-text-key-1', 'shard-text-key-2']
+
+_shared = {}
+
+def _share(arrays):
+    _shared.clear()
+    _shared.update(arrays)
+
+def run_tasks(func, tasks, workers, shared):
+    # Every worker gets the shared arrays once when it starts (inherited through fork where the platform has it, so
+    # they are not copied), and the tasks only carry review ranges
+    if workers == 1 or len(tasks) <= 1:
+        _share(shared)
+        try:
+            return [func(task) for task in tasks]
+        finally:
+            _shared.clear()
+    context = multiprocessing.get_context('fork') if 'fork' in multiprocessing.get_all_start_methods() else None
+    with ProcessPoolExecutor(max_workers=min(workers, len(tasks)), mp_context=context, initializer=_share, initargs=(shared,)) as executor:
+        return list(executor.map(func, tasks))
+
+def shard_bounds(sizes, shards, shard_size):
+    # Ranges of consecutive items of about equal total size, at least `shards` of them when there are enough items and
+    # none bigger than shard_size unless a single item is
+    total = int(sizes.sum())
+    count = min(len(sizes), max(shards, -(-total // shard_size)))
+    if not count:
+        return []
+    ends = np.searchsorted(np.cumsum(sizes), np.arange(1, count) * (total / count)) + 1
+    bounds = np.unique(np.r_[0, np.minimum(ends, len(sizes)), len(sizes)])
+    return list(zip(bounds[:-1].tolist(), bounds[1:].tolist()))
+
+def count_by_hash(hashes, keys, counts):
+    # Same result as collapse, but sorted on the hash alone: keys only need comparing within runs of equal hashes, and
+    # the full (hash, keys) sort is left for the rare table where two different keys share a hash. np.take copies the
+    # key rows much faster than fancy indexing.
+    order = np.argsort(hashes)
+    hashes, keys, counts = hashes[order], np.take(keys, order, axis=0), counts[order]
+    new = np.ones(len(hashes), dtype=bool)
+    new[1:] = hashes[1:] != hashes[:-1]
+    repeated = np.flatnonzero(~new)
+    if (keys[repeated] != keys[repeated - 1]).any():
+        return collapse(hashes, keys, counts)
+    starts = np.flatnonzero(new)
+    return hashes[starts], keys[starts], np.add.reduceat(counts, starts) if len(starts) else counts[:0]
+
+def find_keys(table_hashes, table_keys, hashes, keys):
+    # Row of each (hash, key) in the table sorted by hash, -1 when it is not there; a hash shared by several keys is
+    # tried against each. The lookups are done in hash order, so they walk through the table instead of jumping around in it.
+    order = np.argsort(hashes)
+    hashes, keys = hashes[order], np.take(keys, order, axis=0)
+    position = np.searchsorted(table_hashes, hashes)
+    found = np.full(len(hashes), -1, dtype=np.int64)
+    rows = np.arange(len(hashes))
+    while len(rows):
+        rows = rows[position[rows] < len(table_hashes)]
+        rows = rows[table_hashes[position[rows]] == hashes[rows]]
+        match = (np.take(table_keys, position[rows], axis=0) == keys[rows]).all(axis=1)
+        found[rows[match]] = position[rows[match]]
+        rows = rows[~match]
+        position[rows] += 1
+    found[order] = found.copy()
+    return found
+
+def _reduce_range(task):
+    tables, min_count = task
+    hashes, keys, counts = count_by_hash(*(np.concatenate(column) for column in zip(*tables)))
+    keep = counts >= min_count
+    return hashes[keep], keys[keep], counts[keep]
+
+def merge_tables(tables, min_count, workers):
+    # Rows reaching min_count over all partial tables. Each table is sorted by hash, so cutting the 64-bit hash space
+    # into ranges gives every reduce task the same range of every table, and the merged ranges come out in hash order.
+    rows = sum(len(table[0]) for table in tables)
+    ranges = max(workers, -(-rows // REDUCE_ROWS))
+    edges = np.array([2 ** 64 * r // ranges for r in range(1, ranges)], dtype=np.uint64)
+    cuts = [np.r_[0, np.searchsorted(table[0], edges), len(table[0])] for table in tables]
+    tasks = [([tuple(column[cut[r]:cut[r + 1]] for column in table) for table, cut in zip(tables, cuts)], min_count) for r in range(ranges)]
+    merged = run_tasks(_reduce_range, tasks, workers, {})
+    return tuple(np.concatenate(column) for column in zip(*merged))
+
+def map_reduce(shared, shards, count_shard, flag_shard, min_count, workers):
+    # Partial tables of the shards, merged into the rows reaching min_count, then one flag per item of the shards.
+    # count_shard returns a shard's table and what its flag task needs from the map step besides the shared arrays.
+    if not shards:
+        return None, np.zeros(0, dtype=bool)
+    counted = run_tasks(count_shard, shards, workers, shared)
+    hashes, keys, counts = merge_tables([table for table, _ in counted], min_count, workers)
+    flags = run_tasks(flag_shard, [(bounds, carried) for bounds, (_, carried) in zip(shards, counted)], workers,
+                      {**shared, 'hashes': hashes, 'keys': keys})
+    return (hashes, keys, counts), np.concatenate(flags)
+
+def encode_tokens(tokenized_reviews):
+    # Token ids of all reviews back to back, the review lengths and the token of each id
+    lengths = np.fromiter(map(len, tokenized_reviews), dtype=np.int64, count=len(tokenized_reviews))
+    flat = np.fromiter(chain.from_iterable(tokenized_reviews), dtype=object, count=int(lengths.sum()))
+    codes, vocabulary = pd.factorize(flat)
+    return codes.astype(np.int32), lengths, np.asarray(vocabulary, dtype=object)
+
+def shard_ngrams(bounds, return_reviews=False):
+    start, stop = bounds
+    offsets = _shared['offsets']
+    return review_ngram_ids(_shared['token_ids'][offsets[start]:offsets[stop]], _shared['lengths'][start:stop],
+                            _shared['min_n'], _shared['max_n'], return_reviews)
+
+def _count_ngrams(bounds):
+    # The n-grams are made again by the flag task rather than sent back, they are many times the size of the table
+    ids = shard_ngrams(bounds)
+    return count_by_hash(hash_ids(ids), ids, np.ones(len(ids), dtype=np.int64)), None
+
+def _flag_ngrams(task):
+    bounds, _ = task
+    ids, review = shard_ngrams(bounds, return_reviews=True)
+    flags = np.zeros(bounds[1] - bounds[0], dtype=bool)
+    flags[review[find_keys(_shared['hashes'], _shared['keys'], hash_ids(ids), ids) >= 0]] = True
+    return flags
+
+def _phrase_postings(task):
+    # (phrase row, review) of every common phrase in the shard's reviews, each pair once, sorted by phrase then review
+    bounds, _ = task
+    ids, review = shard_ngrams(bounds, return_reviews=True)
+    rows = find_keys(_shared['hashes'], _shared['keys'], hash_ids(ids), ids)
+    found = rows >= 0
+    span = bounds[1] - bounds[0]
+    pairs = np.unique(rows[found] * span + review[found])
+    return pairs // span, pairs % span + bounds[0]
+
+def phrases_of_rows(keys, vocabulary):
+    # The phrase tuple of every table row, in row order
+    phrases = [None] * len(keys)
+    lengths = (keys >= 0).sum(axis=1)
+    for n in np.unique(lengths).tolist():
+        rows = np.flatnonzero(lengths == n)
+        for row, phrase in zip(rows.tolist(), map(tuple, vocabulary[keys[rows, :n]].tolist())):
+            phrases[row] = phrase
+    return phrases
+
+def phrases_of_table(keys, counts, vocabulary):
+    # {phrase tuple: count} as returned by find_common_phrases
+    return dict(zip(phrases_of_rows(keys, vocabulary), counts.tolist()))
+
+def encode_shards(tokenized_reviews, min_length, max_n, workers):
+    token_ids, lengths, vocabulary = encode_tokens(tokenized_reviews)
+    shared = {'token_ids': token_ids, 'lengths': lengths, 'offsets': np.r_[0, np.cumsum(lengths)], 'min_n': min_length, 'max_n': max_n}
+    return shared, shard_bounds(lengths, workers, SHARD_TOKENS), vocabulary
+
+def sharded_phrase_flags(tokenized_reviews, min_length=3, min_freq=3, max_n=MAX_N, workers=None, return_phrases=False):
+    """contains_common_phrase of every review against find_common_phrases(tokenized_reviews), by map-reduce over shards.
+
+    With return_phrases, the common phrases are returned as well: (phrases, flags).
+    """
+    workers = workers or os.cpu_count()
+    shared, shards, vocabulary = encode_shards(tokenized_reviews, min_length, max_n, workers)
+    table, flags = map_reduce(shared, shards, _count_ngrams, _flag_ngrams, min_freq, workers)
+    if return_phrases:
+        return (phrases_of_table(table[1], table[2], vocabulary) if table else {}), flags
+    return flags
+
+def sharded_phrase_postings(tokenized_reviews, min_length=3, min_freq=3, max_n=MAX_N, workers=None):
+    """The common phrases of find_common_phrases(tokenized_reviews) and the reviews containing each, by map-reduce over shards.
+
+    Returns (phrases, counts, starts, reviews): the positions of the reviews containing phrases[i] are
+    reviews[starts[i]:starts[i + 1]], in increasing order.
+    """
+    workers = workers or os.cpu_count()
+    shared, shards, vocabulary = encode_shards(tokenized_reviews, min_length, max_n, workers)
+    if not shards:
+        return [], np.zeros(0, dtype=np.int64), np.zeros(1, dtype=np.int64), np.zeros(0, dtype=np.int64)
+    counted = run_tasks(_count_ngrams, shards, workers, shared)
+    hashes, keys, counts = merge_tables([table for table, _ in counted], min_freq, workers)
+    pairs = run_tasks(_phrase_postings, [(bounds, None) for bounds in shards], workers, {**shared, 'hashes': hashes, 'keys': keys})
+    rows, reviews = (np.concatenate(column) for column in zip(*pairs))
+    # The shards come in review order, so a stable sort by phrase keeps each phrase's reviews in order
+    reviews = reviews[np.argsort(rows, kind='stable')]
+    starts = np.r_[0, np.cumsum(np.bincount(rows, minlength=len(hashes)))]
+    return phrases_of_rows(keys, vocabulary), counts, starts, reviews
+
+def _count_texts(bounds):
+    # The hashes of the shard's texts go on to its flag task, so each text is hashed once
+    texts = _shared['texts'][bounds[0]:bounds[1]]
+    hashes, keys = (pd.util.hash_array(texts, hash_key=key, categorize=False) for key in TEXT_HASH_KEYS)
+    keys = keys[:, None]
+    return count_by_hash(hashes, keys, np.ones(len(hashes), dtype=np.int64)), (hashes, keys)
+
+def _flag_texts(task):
+    _, (hashes, keys) = task
+    return find_keys(_shared['hashes'], _shared['keys'], hashes, keys) >= 0
+
+def sharded_duplicated(texts, workers=None):
+    """texts.duplicated(keep=False) by map-reduce over shards of the texts."""
+    workers = workers or os.cpu_count()
+    values = texts.astype(object).to_numpy(dtype=object)
+    shards = shard_bounds(np.ones(len(values), dtype=np.int64), workers, SHARD_TOKENS)
+    _, flags = map_reduce({'texts': values}, shards, _count_texts, _flag_texts, 2, workers)
+    return pd.Series(flags, index=texts.index)
@@ -0,0 +1,110 @@
+import os
+import numpy as np
+import pandas as pd
+from concurrent.futures import ProcessPoolExecutor
+
+# Ratings are small integers, so every resample is drawn as a histogram over these values instead of row by row
+RATING_VALUES = np.arange(0, 6)
+N_RESAMPLES = 10000
+CONFIDENCE = 0.95
+PRODUCTS_PER_CHUNK = 25
+
+def rating_histogram(ratings):
+    ratings = pd.Series(ratings).astype('float64').dropna().round().clip(RATING_VALUES[0], RATING_VALUES[-1])
+    return np.bincount(ratings.to_numpy(dtype=np.int64) - RATING_VALUES[0], minlength=len(RATING_VALUES))
+
+def histogram_means(counts, sizes):
+    with np.errstate(invalid='ignore', divide='ignore'):
+        return counts @ RATING_VALUES / sizes
+
+def draw_without_replacement(pooled, sample_sizes, n_resamples, rng):
+    # Multivariate hypergeometric draw for many products at once, one rating value at a time
+    remaining_total = np.broadcast_to(pooled.sum(axis=1)[:, None], (len(pooled), n_resamples)).copy()
+    remaining_sample = np.broadcast_to(sample_sizes[:, None], (len(pooled), n_resamples)).copy()
+    counts = np.zeros((len(pooled), n_resamples, pooled.shape[1]), dtype=np.int64)
+    for k in range(pooled.shape[1] - 1):
+        good = np.broadcast_to(pooled[:, k][:, None], remaining_total.shape)
+        drawn = rng.hypergeometric(good, remaining_total - good, remaining_sample) if good.any() else np.zeros_like(good)
+        counts[:, :, k] = drawn
+        remaining_total = remaining_total - good
+        remaining_sample = remaining_sample - drawn
+    counts[:, :, -1] = remaining_sample
+    return counts
+
+def permutation_p_values(hist_a, hist_b, n_resamples, rng):
+    # Two-sided p-value for the difference in mean rating, group labels shuffled n_resamples times
+    n_a, n_b = hist_a.sum(axis=1), hist_b.sum(axis=1)
+    valid = (n_a > 0) & (n_b > 0)
+    p_values = np.full(len(hist_a), np.nan)
+    if not valid.any():
+        return p_values
+    hist_a, hist_b, n_a, n_b = hist_a[valid], hist_b[valid], n_a[valid], n_b[valid]
+    pooled = hist_a + hist_b
+    observed = histogram_means(hist_a, n_a) - histogram_means(hist_b, n_b)
+
+    drawn_a = draw_without_replacement(pooled, n_a, n_resamples, rng)
+    pooled_sum = (pooled @ RATING_VALUES)[:, None]
+    sum_a = drawn_a @ RATING_VALUES
+    permuted = sum_a / n_a[:, None] - (pooled_sum - sum_a) / n_b[:, None]
+    extreme = (np.abs(permuted) >= np.abs(observed)[:, None] - 1e-12).sum(axis=1)
+    p_values[valid] = (extreme + 1) / (n_resamples + 1)
+    return p_values
+
+def bootstrap_intervals(hist_a, hist_b, n_resamples, rng, confidence=CONFIDENCE):
+    # Percentile interval for mean(a) - mean(b), each group resampled with replacement from its own histogram
+    n_a, n_b = hist_a.sum(axis=1), hist_b.sum(axis=1)
+    valid = (n_a > 0) & (n_b > 0)
+    intervals = np.full((len(hist_a), 2), np.nan)
+    if not valid.any():
+        return intervals
+    hist_a, hist_b, n_a, n_b = hist_a[valid], hist_b[valid], n_a[valid], n_b[valid]
+    sample_a = rng.multinomial(n_a[:, None], (hist_a / n_a[:, None])[:, None, :], size=(len(hist_a), n_resamples))
+    sample_b = rng.multinomial(n_b[:, None], (hist_b / n_b[:, None])[:, None, :], size=(len(hist_b), n_resamples))
+    differences = (sample_a @ RATING_VALUES) / n_a[:, None] - (sample_b @ RATING_VALUES) / n_b[:, None]
+    tail = (1 - confidence) / 2 * 100
+    intervals[valid] = np.percentile(differences, [tail, 100 - tail], axis=1).T
+    return intervals
+
+def compare_histograms(hist_a, hist_b, n_resamples=N_RESAMPLES, seed=0):
+    # hist_a, hist_b: (products, rating values) count arrays; returns p_value, ci_low, ci_high per product
+    hist_a = np.atleast_2d(np.asarray(hist_a, dtype=np.int64))
+    hist_b = np.atleast_2d(np.asarray(hist_b, dtype=np.int64))
+    rng = np.random.default_rng(seed)
+    p_values = permutation_p_values(hist_a, hist_b, n_resamples, rng)
+    intervals = bootstrap_intervals(hist_a, hist_b, n_resamples, rng)
+    return np.column_stack([p_values, intervals])
+
+def compare_ratings(ratings_a, ratings_b, n_resamples=N_RESAMPLES, seed=0):
+    p_value, ci_low, ci_high = compare_histograms(rating_histogram(ratings_a), rating_histogram(ratings_b), n_resamples, seed)[0]
+    return p_value, ci_low, ci_high
+
+def significance_columns(metric, ratings_a, ratings_b, n_resamples=N_RESAMPLES, seed=0):
+    # Columns appended to a result table for mean(ratings_a) - mean(ratings_b)
+    p_value, ci_low, ci_high = compare_ratings(ratings_a, ratings_b, n_resamples, seed)
+    return {
+        f'{metric}_p_value': [round(p_value, 4)],
+        f'{metric}_ci_low': [round(ci_low, 2)],
+        f'{metric}_ci_high': [round(ci_high, 2)],
+    }
+
+def _compare_chunk(args):
+    hist_a, hist_b, n_resamples, seed = args
+    return compare_histograms(hist_a, hist_b, n_resamples, seed)
+
+def compare_many(hist_a, hist_b, n_resamples=N_RESAMPLES, seed=0, workers=None):
+    # Many products (or metrics) at once: chunks of products are spread over worker processes,
+    # each chunk with its own child seed so results do not depend on the number of workers
+    hist_a = np.asarray(hist_a, dtype=np.int64)
+    hist_b = np.asarray(hist_b, dtype=np.int64)
+    chunks = range(0, len(hist_a), PRODUCTS_PER_CHUNK)
+    seeds = np.random.SeedSequence(seed).spawn(len(chunks))
+    tasks = [(hist_a[i:i + PRODUCTS_PER_CHUNK], hist_b[i:i + PRODUCTS_PER_CHUNK], n_resamples, s) for i, s in zip(chunks, seeds)]
+    workers = workers or os.cpu_count()
+    if workers == 1 or len(tasks) == 1:
+        results = [_compare_chunk(task) for task in tasks]
+    else:
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            results = list(executor.map(_compare_chunk, tasks))
+    if not results:
+        return np.empty((0, 3))
+    return np.concatenate(results)
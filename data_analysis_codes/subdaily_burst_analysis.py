@@ -0,0 +1,118 @@
+import pandas as pd
+import numpy as np
+from sklearn.ensemble import IsolationForest
+from scipy.stats import poisson
+import os
+import math
+import argparse
+from review_loader import load_reviews, to_minute_offsets
+from significance import significance_columns
+from rating_trend_analysis import fit_poisson_model
+
+# Review bursts within a day. Saladlab and Crema reviews imported from Naver Pay carry their registration time in the
+# text ("(YYYY-MM-DD HH:MM:SS 에 등록된 네이버 페이 구매평)"); the reviews are counted per hour and per minute and the Poisson
+# threshold and the isolation forest are run on those series. Products without registration times are skipped.
+
+# Bucket size in minutes for each resolution
+RESOLUTIONS = {'hour': 60, 'minute': 1}
+
+def get_filename():
+    parser = argparse.ArgumentParser(description='Process some CSV files.')
+    parser.add_argument('filename', type=str, help='The filename of the CSV (with extension)')
+    parser.add_argument('foldername', type=str, help='The name of the folder')
+    args = parser.parse_args()
+    return args.filename, args.foldername
+
+def create_folder(folder_path):
+    if not os.path.exists(folder_path):
+        os.makedirs(folder_path)
+
+def load_data(filename):
+    df = load_reviews(filename)
+    df['review_minute'] = to_minute_offsets(df['review_content'])
+    return df.dropna(subset=['review_minute'])
+
+def bucket_counts(minutes, bucket_minutes):
+    # Reviews per bucket from the first to the last bucket, empty buckets included, as one int32 array
+    buckets = minutes // bucket_minutes
+    first_bucket = buckets.min()
+    return buckets - first_bucket, first_bucket, np.bincount(buckets - first_bucket).astype(np.int32)
+
+def poisson_threshold(counts):
+    # Poisson trend as in rating_trend_analysis, but with mostly empty hours and minutes the ceiling of the expected
+    # count alone is 1, so the threshold is raised to the count exceeded by chance in about one bucket of the history
+    poisson_model = fit_poisson_model(pd.DataFrame({'review_count': counts}))
+    max_mu = poisson_model.mu.max()
+    return max(math.ceil(max_mu), int(poisson.isf(1 / len(counts), max_mu)))
+
+def detect_anomalies(counts, window=3, contamination=0.05):
+    # Isolation forest over the buckets that have reviews, as isolation_forest does for days
+    active = np.flatnonzero(counts)
+    review_count = counts[active].astype(np.float64)
+    rolling_mean = pd.Series(review_count).rolling(window=window).mean().fillna(0).to_numpy()
+    X = np.column_stack([review_count, rolling_mean])
+    anomaly = np.zeros(len(counts), dtype=bool)
+    if len(active) > 1:
+        model = IsolationForest(contamination=contamination, random_state=0)
+        anomaly[active] = model.fit(X).predict(X) == -1
+    return anomaly, len(active)
+
+def analyze_resolution(df, resolution):
+    bucket_minutes = RESOLUTIONS[resolution]
+    review_bucket, first_bucket, counts = bucket_counts(df['review_minute'].to_numpy(dtype=np.int64), bucket_minutes)
+    ratings = df['rating'].astype('float64')
+
+    max_reviews_per_bucket = poisson_threshold(counts)
+    higher = counts > max_reviews_per_bucket
+    in_higher = higher[review_bucket]
+    anomaly, active_buckets = detect_anomalies(counts)
+    in_anomaly = anomaly[review_bucket]
+    peak = int(np.argmax(counts))
+    print(f"{resolution}: {len(counts)} buckets, {active_buckets} with reviews, max_reviews_per_bucket: {max_reviews_per_bucket}, "
+          f"{higher.sum()} buckets above it")
+
+    return {
+        'resolution': [resolution],
+        'reviews_with_timestamp': [len(df)],
+        'active_buckets': [active_buckets],
+        'peak_bucket_start': [pd.Timestamp((first_bucket + peak) * bucket_minutes, unit='m')],
+        'peak_bucket_reviews': [int(counts[peak])],
+        'max_reviews_per_bucket': [max_reviews_per_bucket],
+        'num_buckets_higher_than_max': [int(higher.sum())],
+        'total_reviews_higher_than_max': [int(in_higher.sum())],
+        'high_volume_review_percentage': [round(in_higher.sum() / len(df) * 100, 2)],
+        'avg_ratings_higher_than_max': [round(ratings[in_higher].mean(), 2)],
+        'avg_ratings_lower_than_max': [round(ratings[~in_higher].mean(), 2)],
+        **significance_columns('rating_diff_higher_than_max', ratings[in_higher], ratings[~in_higher]),
+        'percentage_anomalies': [round(anomaly.sum() / max(active_buckets, 1) * 100, 2)],
+        'avg_rating_anomalies': [round(ratings[in_anomaly].mean(), 2)],
+        'avg_rating_non_anomalies': [round(ratings[~in_anomaly].mean(), 2)],
+        **significance_columns('rating_diff_anomalies', ratings[in_anomaly], ratings[~in_anomaly]),
+    }
+
+def save_results(results_df, company_name, folder_path):
+    output_filename = f"{company_name}_subdaily_bursts.csv"
+    output_path = os.path.join(folder_path, output_filename)
+    results_df.to_csv(output_path, index=False)
+    print(f"CSV file saved to {output_path}")
+
+def main():
+    input_filename, foldername = get_filename()
+    filename = os.path.join(f'./{foldername}_Collected_Reviews', input_filename)
+    company_name = input_filename.split('.')[0]
+    folder_path = f'./results/{company_name}'
+
+    df = load_data(filename)
+    if df.empty:
+        print(f"No Naver Pay registration times in {input_filename}")
+        return
+    create_folder(folder_path)
+
+    rows = [pd.DataFrame(analyze_resolution(df, resolution)) for resolution in RESOLUTIONS]
+    results_df = pd.concat(rows, ignore_index=True)
+    results_df.insert(0, 'product_name', df['product_name'].iloc[0])
+    results_df.insert(0, 'company_name', company_name)
+    save_results(results_df, company_name, folder_path)
+
+if __name__ == "__main__":
+    main()
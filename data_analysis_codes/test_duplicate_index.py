@@ -0,0 +1,38 @@
+import os
+import pandas as pd
+from duplicate_index import DuplicateIndex, build
+
+def write_product(folder_path, filename, texts, mtime):
+    file_path = os.path.join(folder_path, filename)
+    pd.DataFrame({
+        'product_name': filename.split('.')[0],
+        'review_uid': range(len(texts)),
+        'rating': 5,
+        'review_date': '2024.07.14',
+        'review_content': texts,
+    }).to_csv(file_path, index=False)
+    os.utime(file_path, (mtime, mtime))
+
+def test_replaced_file_is_merged_once(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    folder_path = tmp_path / 'Coupang_Collected_Reviews'
+    folder_path.mkdir()
+    for i in range(3):
+        write_product(folder_path, f'{i}.csv', [f'review {i} {j}' for j in range(50)], 1000)
+    build(DuplicateIndex('./duplicate_index'), ['Coupang'])
+
+    # The replaced file's old postings are in main, so the next build merges them away
+    write_product(folder_path, '0.csv', [f'new review {j}' for j in range(50)], 2000)
+    build(DuplicateIndex('./duplicate_index'), ['Coupang'])
+    index = DuplicateIndex('./duplicate_index')
+    assert index.products['active'].all() and len(index.products) == 3
+    assert len(index.main) == 150 and set(index.main['product']) == set(index.products['product'])
+    main_stat = os.stat(index.main_path)
+
+    # A small new file afterwards only goes to the delta
+    write_product(folder_path, '3.csv', ['review 3 0', 'review 3 1'], 3000)
+    build(DuplicateIndex('./duplicate_index'), ['Coupang'])
+    stat = os.stat(index.main_path)
+    assert (stat.st_ino, stat.st_mtime_ns) == (main_stat.st_ino, main_stat.st_mtime_ns)
+    index = DuplicateIndex('./duplicate_index')
+    assert len(index.delta) == 2 and len(index.all_postings()) == 152
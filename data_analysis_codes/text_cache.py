@@ -0,0 +1,269 @@
+import re
+import json
+import string
+import sqlite3
+import time
+import numpy as np
+import pandas as pd
+from review_loader import count_words, NAVER_PAY_PATTERN
+
+# Bump when normalize_review or the tokenizer changes, so old entries are no longer matched (16 characters, used as hash key)
+NORMALIZER_VERSION = 'review-norm-v001'
+DEFAULT_CACHE_PATH = './text_cache.sqlite'
+DEFAULT_MAX_BYTES = 2 * 1024 ** 3
+# Eviction only needs rough recency, so an entry's last_used is rewritten at most once a week; daily re-runs over the
+# same reviews then write nothing
+RECENCY_SECONDS = 7 * 24 * 3600
+PUNCTUATION_TABLE = str.maketrans('', '', string.punctuation)
+PUNCTUATION_PATTERN = f'[{re.escape(string.punctuation)}]'
+
+def normalize_review(review):
+    if pd.isnull(review):
+        review = ''  # Convert NaN to empty string
+    review = str(review)  # Ensure all inputs are treated as strings
+    review = re.sub(r"\(\d{4}-\d{2}-\d{2} \d{2}:\d{2}:\d{2} 에 등록된 네이버 페이 구매평\)", "", review)
+    review = review.replace("쇼핑몰 추천 리뷰", "")
+    if review.startswith("NEW"):
+        review = review[3:]  # Remove the first three characters assumed to be "NEW"
+    review = review.lower()
+    review = review.translate(PUNCTUATION_TABLE)
+    return review
+
+def normalize_texts(texts):
+    # normalize_review for a whole column at once
+    texts = texts.fillna('').str.replace(NAVER_PAY_PATTERN, '', regex=True).str.replace('쇼핑몰 추천 리뷰', '', regex=False)
+    texts = texts.where(~texts.str.startswith('NEW'), texts.str.slice(3))
+    return texts.str.lower().str.replace(PUNCTUATION_PATTERN, '', regex=True)
+
+def hash_reviews(texts):
+    # 64-bit content address of the raw review text, stored as a signed SQLite integer key
+    keys = texts.astype(object).fillna('\x00nan').to_numpy(dtype=object)
+    # Review texts are mostly distinct, so factorizing them before hashing (categorize) costs more than it saves; the
+    # hashes are the same either way
+    return pd.util.hash_array(keys, hash_key=NORMALIZER_VERSION, categorize=False).view(np.int64)
+
+class TextCache:
+    """Normalized text, token ids and word count per raw review text, shared by all analyzer processes."""
+
+    def __init__(self, path=DEFAULT_CACHE_PATH, max_bytes=DEFAULT_MAX_BYTES):
+        self.max_bytes = max_bytes
+        self.conn = sqlite3.connect(path, timeout=60)
+        self.conn.execute('PRAGMA journal_mode=WAL')
+        self.conn.execute('PRAGMA synchronous=NORMAL')
+        self.conn.execute('PRAGMA temp_store=MEMORY')
+        self.conn.executescript("""
+            CREATE TABLE IF NOT EXISTS entries (
+                key INTEGER PRIMARY KEY,
+                normalized TEXT,
+                word_count INTEGER,
+                tokens BLOB,
+                size INTEGER,
+                last_used REAL
+            );
+            CREATE INDEX IF NOT EXISTS entries_last_used ON entries (last_used);
+            CREATE TABLE IF NOT EXISTS vocab (
+                id INTEGER PRIMARY KEY,
+                token TEXT UNIQUE
+            );
+            -- Running byte totals of entries and vocab, kept by the triggers so evict does not sum whole tables
+            CREATE TABLE IF NOT EXISTS meta (name TEXT PRIMARY KEY, value INTEGER);
+            CREATE TRIGGER IF NOT EXISTS entries_insert AFTER INSERT ON entries BEGIN
+                UPDATE meta SET value = value + NEW.size WHERE name = 'entry_bytes';
+            END;
+            CREATE TRIGGER IF NOT EXISTS entries_update AFTER UPDATE OF size ON entries BEGIN
+                UPDATE meta SET value = value + NEW.size - OLD.size WHERE name = 'entry_bytes';
+            END;
+            CREATE TRIGGER IF NOT EXISTS entries_delete AFTER DELETE ON entries BEGIN
+                UPDATE meta SET value = value - OLD.size WHERE name = 'entry_bytes';
+            END;
+            CREATE TRIGGER IF NOT EXISTS vocab_insert AFTER INSERT ON vocab BEGIN
+                UPDATE meta SET value = value + LENGTH(CAST(NEW.token AS BLOB)) + 16 WHERE name = 'vocab_bytes';
+            END;
+            CREATE TRIGGER IF NOT EXISTS vocab_delete AFTER DELETE ON vocab BEGIN
+                UPDATE meta SET value = value - LENGTH(CAST(OLD.token AS BLOB)) - 16 WHERE name = 'vocab_bytes';
+            END;
+            INSERT OR IGNORE INTO meta SELECT 'entry_bytes', COALESCE(SUM(size), 0) FROM entries;
+            INSERT OR IGNORE INTO meta SELECT 'vocab_bytes', COALESCE(SUM(LENGTH(CAST(token AS BLOB)) + 16), 0) FROM vocab;
+            CREATE TEMP TABLE lookup_keys (key INTEGER PRIMARY KEY);
+            CREATE TEMP TABLE used_keys (key INTEGER PRIMARY KEY);
+        """)
+        # Keys of the entries looked up since the last flush whose last_used is older than RECENCY_SECONDS, written in one batch
+        self.used = []
+        # id -> token stays true for good, since a dropped token id is never handed out again; token -> id is read
+        # again after another process drops tokens (see evict)
+        self.token_ids = {}
+        self.id_tokens = {}
+        self.vocab_version = self.version()
+
+    def version(self):
+        # Bumped each time tokens no entry uses are dropped from vocab
+        return self.conn.execute('PRAGMA user_version').fetchone()[0]
+
+    def fill_keys(self, table, keys):
+        # Temp tables live in this connection's own memory, so filling them takes no lock on the cache; the keys go in
+        # as one JSON array rather than a statement per key
+        self.conn.execute(f'DELETE FROM temp.{table}')
+        self.conn.execute(f'INSERT OR IGNORE INTO temp.{table} SELECT value FROM json_each(?)', (json.dumps(keys),))
+
+    def lookup(self, keys, need_tokens=False):
+        # Returns {key: (normalized, word_count, token blob or None)}, all hits read by one join with the keys (sorted
+        # keys fill the temp table fastest)
+        token_filter = ' WHERE e.tokens IS NOT NULL' if need_tokens else ''
+        with self.conn:
+            self.fill_keys('lookup_keys', [int(key) for key in keys])
+            rows = self.conn.execute(
+                f"SELECT e.key, e.normalized, e.word_count, e.tokens, e.last_used FROM temp.lookup_keys AS k "
+                f"CROSS JOIN entries AS e ON e.key = k.key{token_filter}").fetchall()
+        stale = time.time() - RECENCY_SECONDS
+        self.used.extend(row[0] for row in rows if row[4] < stale)
+        return {row[0]: row[1:4] for row in rows}
+
+    def flush(self):
+        # Write the recency of the entries looked up since the last flush, in one statement
+        if not self.used:
+            return
+        with self.conn:
+            self.fill_keys('used_keys', self.used)
+            self.conn.execute('UPDATE entries SET last_used = ? WHERE key IN (SELECT key FROM temp.used_keys)', (time.time(),))
+        self.used = []
+
+    def store(self, entries):
+        now = time.time()
+        with self.conn:
+            self.conn.execute('BEGIN IMMEDIATE')
+            # Token ids handed out before tokens were dropped may be gone, so those entries are stored without tokens
+            stale = self.version() != self.vocab_version
+            rows = []
+            for key, (normalized, word_count, blob) in entries.items():
+                blob = None if stale else blob
+                size = len(normalized.encode('utf-8')) + (0 if blob is None else len(blob)) + 32
+                rows.append((int(key), normalized, int(word_count), blob, size, now))
+            # An upsert rather than INSERT OR REPLACE, whose deletes would not fire the size triggers
+            self.conn.executemany("""
+                INSERT INTO entries VALUES (?, ?, ?, ?, ?, ?) ON CONFLICT (key) DO UPDATE SET
+                normalized = excluded.normalized, word_count = excluded.word_count, tokens = excluded.tokens,
+                size = excluded.size, last_used = excluded.last_used""", rows)
+        self.evict()
+
+    def sizes(self):
+        sizes = dict(self.conn.execute("SELECT name, value FROM meta"))
+        return sizes['entry_bytes'], sizes['vocab_bytes']
+
+    def evict(self):
+        # Drop least recently used entries once the entries and the vocab grow past max_bytes, down to 90% of it, then
+        # the tokens no entry uses any more
+        entries_size, vocab_size = self.sizes()
+        if entries_size + vocab_size <= self.max_bytes:
+            return
+        with self.conn:
+            self.conn.execute('BEGIN IMMEDIATE')
+            self.conn.execute("""
+                DELETE FROM entries WHERE key IN (
+                    SELECT key FROM (SELECT key, SUM(size) OVER (ORDER BY last_used DESC, key) AS kept FROM entries)
+                    WHERE kept > ?)""", (max(int(self.max_bytes * 0.9) - vocab_size, 0),))
+            self.drop_unused_tokens()
+
+    def drop_unused_tokens(self):
+        # The highest id is kept, so SQLite never hands out a dropped id again and id -> token caches stay right
+        max_id = self.conn.execute('SELECT COALESCE(MAX(id), 0) FROM vocab').fetchone()[0]
+        used = np.zeros(max_id + 1, dtype=bool)
+        used[max_id] = True
+        cursor = self.conn.execute('SELECT tokens FROM entries WHERE tokens IS NOT NULL')
+        while blobs := cursor.fetchmany(10000):
+            used[np.frombuffer(b''.join(blob for blob, in blobs), dtype=np.int32)] = True
+        ids = [row[0] for row in self.conn.execute('SELECT id FROM vocab')]
+        unused = [(token_id,) for token_id in ids if not used[token_id]]
+        if unused:
+            self.conn.executemany('DELETE FROM vocab WHERE id = ?', unused)
+            self.conn.execute(f'PRAGMA user_version = {self.version() + 1}')
+
+    def ids_for_tokens(self, tokens):
+        with self.conn:
+            # The write lock is held until the new ids are read back, so no eviction can drop them in between
+            self.conn.execute('BEGIN IMMEDIATE')
+            version = self.version()
+            if version != self.vocab_version:
+                self.token_ids = {}
+                self.vocab_version = version
+            missing = [t for t in set(tokens) if t not in self.token_ids]
+            if missing:
+                self.conn.executemany('INSERT OR IGNORE INTO vocab (token) VALUES (?)', [(t,) for t in missing])
+            for start in range(0, len(missing), 900):
+                chunk = missing[start:start + 900]
+                for token_id, token in self.conn.execute(
+                        f"SELECT id, token FROM vocab WHERE token IN ({','.join('?' * len(chunk))})", chunk):
+                    self.token_ids[token] = token_id
+                    self.id_tokens[token_id] = token
+        return self.token_ids
+
+    def tokens_for_ids(self, ids):
+        missing = [int(i) for i in set(ids) if i not in self.id_tokens]
+        for start in range(0, len(missing), 900):
+            chunk = missing[start:start + 900]
+            for token_id, token in self.conn.execute(
+                    f"SELECT id, token FROM vocab WHERE id IN ({','.join('?' * len(chunk))})", chunk):
+                self.token_ids[token] = token_id
+                self.id_tokens[token_id] = token
+        return [self.id_tokens[int(i)] for i in ids]
+
+    def close(self):
+        self.flush()
+        self.conn.close()
+
+def process_reviews(raw_texts, cache, tokenize):
+    normalized = [normalize_review(text) for text in raw_texts]
+    word_counts = count_words(pd.Series(normalized, dtype=object)).tolist()
+    token_lists = [None] * len(normalized)
+    if tokenize:
+        from nltk import word_tokenize
+        token_lists = [word_tokenize(text) for text in normalized]
+        if cache is not None:
+            token_ids = cache.ids_for_tokens([t for tokens in token_lists for t in tokens])
+            token_lists = [np.array([token_ids[t] for t in tokens], dtype=np.int32).tobytes() for tokens in token_lists]
+    return normalized, word_counts, token_lists
+
+def decode_token_blobs(blobs):
+    # One frombuffer/tolist over all blobs, then cheap list slices per review
+    lengths = np.array([len(blob) // 4 for blob in blobs], dtype=np.int64)
+    bounds = np.concatenate([[0], np.cumsum(lengths)]).tolist()
+    ids = np.frombuffer(b''.join(blobs), dtype=np.int32).tolist()
+    return [ids[start:stop] for start, stop in zip(bounds[:-1], bounds[1:])]
+
+def normalize_reviews(texts, cache=None, tokenize=False):
+    """Return cleaned_review_content, word_count and (with tokenize) tokens for each review, reusing cached entries.
+
+    With a cache, tokens are lists of token ids (see TextCache.tokens_for_ids); without one they are token strings.
+    """
+    keys = hash_reviews(texts)
+    unique_keys, first_index, inverse = np.unique(keys, return_index=True, return_inverse=True)
+    found = cache.lookup(unique_keys, need_tokens=tokenize) if cache is not None else {}
+    missing = [i for i, key in enumerate(unique_keys.tolist()) if key not in found]
+    print(f"Text cache: {len(unique_keys) - len(missing)} hits, {len(missing)} misses")
+
+    if missing:
+        raw_texts = texts.iloc[first_index[missing]].tolist()
+        normalized, word_counts, token_lists = process_reviews(raw_texts, cache, tokenize)
+        new_entries = {int(unique_keys[i]): entry for i, entry in zip(missing, zip(normalized, word_counts, token_lists))}
+        if cache is not None:
+            cache.store(new_entries)
+        found.update(new_entries)
+
+    entries = [found[key] for key in unique_keys.tolist()]
+    result = pd.DataFrame({
+        'cleaned_review_content': np.array([entry[0] for entry in entries], dtype=object)[inverse],
+        'word_count': np.array([entry[1] for entry in entries], dtype=np.int64)[inverse],
+    }, index=texts.index)
+    if tokenize:
+        token_lists = [entry[2] for entry in entries]
+        if cache is not None:
+            token_lists = decode_token_blobs(token_lists)
+        tokens = np.empty(len(token_lists), dtype=object)
+        for i, token_list in enumerate(token_lists):
+            tokens[i] = token_list
+        result['tokens'] = tokens[inverse]
+    if cache is not None:
+        cache.flush()
+    return result
+
+def open_cache(path):
+    return TextCache(path) if path else None
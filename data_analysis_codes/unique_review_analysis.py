@@ -1,16 +1,20 @@
 import pandas as pd
-import matplotlib.pyplot as plt
 import numpy as np
 import re
 import os
 import argparse
+from review_loader import load_reviews
+from significance import significance_columns, rating_histogram, RATING_VALUES
+from shard_analysis import sharded_duplicated
 
 def get_filename():
     parser = argparse.ArgumentParser(description='Process some CSV files.')
     parser.add_argument('filename', type=str, help='The filename of the CSV (with extension)')
     parser.add_argument('foldername', type=str, help='The name of the folder')
+    parser.add_argument('--plots', action='store_true', help='Also save the per-product plot images (dashboard.py builds one dashboard per folder)')
+    parser.add_argument('--workers', type=int, default=1, help='Processes finding the duplicates of this product by map-reduce over review shards')
     args = parser.parse_args()
-    return args.filename, args.foldername
+    return args.filename, args.foldername, args.plots, args.workers
 
 def create_folder(folder_path):
     if not os.path.exists(folder_path):
@@ -22,7 +26,7 @@ def preprocess_review(review):
     return review
 
 def load_data(filename):
-    return pd.read_csv(filename)
+    return load_reviews(filename)
 
 def clean_data(df):
     total_reviews = df.shape[0]
@@ -37,8 +41,11 @@ def clean_data(df):
     
     return df, total_reviews
 
-def analyze_data(df):
-    df['is_duplicate'] = df.duplicated('review_content', keep=False)
+def analyze_data(df, workers=1):
+    if workers > 1:
+        df['is_duplicate'] = sharded_duplicated(df['review_content'], workers)
+    else:
+        df['is_duplicate'] = df.duplicated('review_content', keep=False)
     avg_ratings_unique = df[~df['is_duplicate']]['rating'].mean()
     avg_ratings_non_unique = df[df['is_duplicate']]['rating'].mean()
     non_unique_reviews = df['is_duplicate'].sum()
@@ -49,6 +56,7 @@ def calculate_percentage(non_unique_reviews, total_reviews):
     return (non_unique_reviews / total_reviews) * 100
 
 def plot_bar_chart(avg_ratings, bar_chart_path):
+    import matplotlib.pyplot as plt  # only needed with --plots
     plt.figure(figsize=(10, 6))
     plt.bar(avg_ratings.keys(), avg_ratings.values(), color=['blue', 'orange'])
     plt.xlabel('Review Category')
@@ -59,9 +67,10 @@ def plot_bar_chart(avg_ratings, bar_chart_path):
     plt.close()
 
 def plot_histogram(df, histogram_path):
+    import matplotlib.pyplot as plt  # only needed with --plots
     plt.figure(figsize=(10, 6))
-    plt.hist(df[~df['is_duplicate']]['rating'], bins=np.arange(1, 6, 0.5), alpha=0.5, label='Unique Reviews', color='blue')
-    plt.hist(df[df['is_duplicate']]['rating'], bins=np.arange(1, 6, 0.5), alpha=0.5, label='Non-Unique Reviews', color='orange')
+    plt.hist(df[~df['is_duplicate']]['rating'].astype('float64'), bins=np.arange(1, 6, 0.5), alpha=0.5, label='Unique Reviews', color='blue')
+    plt.hist(df[df['is_duplicate']]['rating'].astype('float64'), bins=np.arange(1, 6, 0.5), alpha=0.5, label='Non-Unique Reviews', color='orange')
     plt.title('Histogram of Ratings for Unique vs Non-Unique Reviews')
     plt.xlabel('Rating')
     plt.ylabel('Count')
@@ -69,11 +78,18 @@ def plot_histogram(df, histogram_path):
     plt.savefig(histogram_path)
     plt.close()
 
+def save_rating_histograms(df, output_path):
+    pd.DataFrame({
+        'rating': RATING_VALUES,
+        'unique_reviews': rating_histogram(df[~df['is_duplicate']]['rating']),
+        'non_unique_reviews': rating_histogram(df[df['is_duplicate']]['rating'])
+    }).to_csv(output_path, index=False)
+
 def save_results(results_df, output_path):
     results_df.to_csv(output_path, index=False)
 
 def main():
-    input_filename, foldername = get_filename()
+    input_filename, foldername, plots, workers = get_filename()
     filename = os.path.join(f'./{foldername}_Collected_Reviews', input_filename)
     folder_path = f'./results/{input_filename.split(".")[0]}'
     
@@ -83,32 +99,39 @@ def main():
     company_name = input_filename.split('.')[0]
 
     df, total_reviews = clean_data(df)
-    avg_ratings_unique, avg_ratings_non_unique, non_unique_reviews = analyze_data(df)
+    avg_ratings_unique, avg_ratings_non_unique, non_unique_reviews = analyze_data(df, workers)
     percentage_non_unique = calculate_percentage(non_unique_reviews, total_reviews)
 
     print(f"Average rating for unique reviews: {avg_ratings_unique:.2f}")
     print(f"Average rating for non-unique (duplicate) reviews: {avg_ratings_non_unique:.2f}")
     print(f"Percentage of non-unique reviews: {percentage_non_unique:.2f}%")
 
+    significance = significance_columns('rating_diff_non_unique', df[df['is_duplicate']]['rating'], df[~df['is_duplicate']]['rating'])
+    print(f"Permutation p-value: {significance['rating_diff_non_unique_p_value'][0]}")
+
     avg_ratings = {
         'unique_reviews': avg_ratings_unique,
         'non_unique_reviews': avg_ratings_non_unique
     }
 
-    bar_chart_filename = f"{company_name}_Average_Ratings_Unique_vs_Non-Unique_Reviews.png"
-    bar_chart_path = os.path.join(folder_path, bar_chart_filename)
-    plot_bar_chart(avg_ratings, bar_chart_path)
+    if plots:
+        bar_chart_filename = f"{company_name}_Average_Ratings_Unique_vs_Non-Unique_Reviews.png"
+        bar_chart_path = os.path.join(folder_path, bar_chart_filename)
+        plot_bar_chart(avg_ratings, bar_chart_path)
+        print(f"Bar chart saved to {bar_chart_path}")
 
-    histogram_filename = f"{company_name}_Histogram_of_Ratings_Unique_vs_Non-Unique_Reviews.png"
-    histogram_path = os.path.join(folder_path, histogram_filename)
-    plot_histogram(df, histogram_path)
+        histogram_filename = f"{company_name}_Histogram_of_Ratings_Unique_vs_Non-Unique_Reviews.png"
+        histogram_path = os.path.join(folder_path, histogram_filename)
+        plot_histogram(df, histogram_path)
+        print(f"Histogram saved to {histogram_path}")
 
     results_df = pd.DataFrame({
         'company_name': [company_name],
         'product_name': [df['product_name'].iloc[0]],
         'avg_ratings_unique': [round(avg_ratings_unique, 2)],
         'avg_ratings_non_unique': [round(avg_ratings_non_unique, 2)],
-        'percentage_non_unique': [round(percentage_non_unique, 2)]
+        'percentage_non_unique': [round(percentage_non_unique, 2)],
+        **significance
     })
 
     output_filename = f"{company_name}_unique_nonunique.csv"
@@ -116,8 +139,10 @@ def main():
     save_results(results_df, output_path)
 
     print(f"CSV file saved to {output_path}")
-    print(f"Bar chart saved to {bar_chart_path}")
-    print(f"Histogram saved to {histogram_path}")
+
+    ratings_path = os.path.join(folder_path, f"{company_name}_unique_nonunique_ratings.csv")
+    save_rating_histograms(df, ratings_path)
+    print(f"Rating counts saved to {ratings_path}")
 
 if __name__ == "__main__":
     main()
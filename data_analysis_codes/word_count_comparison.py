@@ -1,99 +1,109 @@
 import pandas as pd
-import plotly.graph_objects as go
+import numpy as np
 import os
-import string
-import re
 import argparse
+from review_loader import load_reviews
+from text_cache import normalize_reviews, open_cache, DEFAULT_CACHE_PATH
+
+BINS = [1, 5, 15, 25, 40, 65, 100, 200, float('inf')]
+LABELS = ['1-5 words', '6-15 words', '16-25 words', '26-40 words', '41-65 words', '66-100 words', '101-200 words', '201+ words']
 
 def get_filename():
     parser = argparse.ArgumentParser(description='Process some CSV files.')
     parser.add_argument('filename', type=str, help='The filename of the CSV (with extension)')
     parser.add_argument('foldername', type=str, help='The name of the folder')
+    parser.add_argument('--text-cache', type=str, default=DEFAULT_CACHE_PATH, help='Cache of normalized reviews, empty to disable')
+    parser.add_argument('--plots', action='store_true', help='Also save the per-product plot images (dashboard.py builds one dashboard per folder)')
     args = parser.parse_args()
-    return args.filename, args.foldername
+    return args.filename, args.foldername, args.text_cache, args.plots
 
 def create_folder(folder_path):
     if not os.path.exists(folder_path):
         os.makedirs(folder_path)
 
-def preprocess_review(review):
-    if pd.isnull(review) or review == 'N/A':
-        review = ''  # Convert NaN or 'N/A' to empty string
-    review = str(review)  # Ensure all inputs are treated as strings
-    review = re.sub(r"\(\d{4}-\d{2}-\d{2} \d{2}:\d{2}:\d{2} 에 등록된 네이버 페이 구매평\)", "", review)
-    review = review.replace("쇼핑몰 추천 리뷰", "")
-    if review.startswith("NEW"):
-        review = review[3:]  # Remove the first three characters assumed to be "NEW"
-    review = review.lower()
-    review = review.translate(str.maketrans('', '', string.punctuation))
-    return review
-
-def load_and_preprocess_data(filename):
-    df = pd.read_csv(filename)
-    df['review_content'] = df['review_content'].astype(str)
-    df['cleaned_review_content'] = df['review_content'].apply(preprocess_review)
+def load_and_preprocess_data(filename, cache=None):
+    df = load_reviews(filename)
+    normalized = normalize_reviews(df['review_content'].mask(df['review_content'] == 'N/A'), cache)
+    df['cleaned_review_content'] = normalized['cleaned_review_content']
+    df['word_count'] = normalized['word_count']
     return df
 
 def remove_empty_reviews(df):
-    # print(f"Total reviews before removing empty: {len(df)}")
-    
-    # Remove reviews with 0 word count
-    filtered_df = df[df['cleaned_review_content'] != 'nan'].copy()
+    # Remove reviews with no text (NaN and 'N/A' are normalized to '')
+    filtered_df = df[df['cleaned_review_content'] != ''].copy()
+    filtered_df['review_content_length'] = filtered_df['word_count']
+    return filtered_df
 
-    filtered_df['review_content_length'] = filtered_df['cleaned_review_content'].str.split().str.len()
-    # print(f"Total reviews after removing empty: {len(filtered_df)}")
+def word_count_histogram(review_content_length):
+    # Bin counts over [1, 5), [5, 15), ..., [200, inf); plain counts so products can be summed into a baseline
+    lengths = review_content_length.to_numpy(dtype=np.float64, na_value=np.nan)
+    bin_index = np.searchsorted(BINS, lengths[lengths >= BINS[0]], side='right') - 1
+    return np.bincount(bin_index, minlength=len(LABELS))
 
-    return filtered_df
+def load_baseline(baseline_path):
+    if os.path.exists(baseline_path):
+        return pd.read_csv(baseline_path, index_col='company_name')
+    return pd.DataFrame(columns=LABELS, dtype=np.int64).rename_axis('company_name')
+
+def update_baseline(baseline_path, company_name, histogram):
+    # One row of bin counts per product; re-running a product replaces its row
+    baseline = load_baseline(baseline_path)
+    baseline.loc[company_name] = histogram
+    baseline.astype(np.int64).to_csv(baseline_path)
+    return baseline
 
-def plot_word_count_distribution(df, company_name, folder_path):
-    if 'review_date' in df.columns and df['review_date'].notna().any():
-        df['review_date'] = pd.to_datetime(df['review_date'])
-        
-        bins = [1, 5, 15, 25, 40, 65, 100, 200, float('inf')]
-        labels = ['1-5 words', '6-15 words', '16-25 words', '26-40 words', '41-65 words', '66-100 words', '101-200 words', '201+ words']
-        df['word_count_range'] = pd.cut(df['review_content_length'], bins=bins, labels=labels, right=False)
-        
-        word_count_distribution = df['word_count_range'].value_counts(normalize=True) * 100
-        word_count_distribution = word_count_distribution.reindex(labels)
-        
-        fig = go.Figure()
-        fig.add_trace(go.Scatter(x=labels, y=word_count_distribution, fill='tozeroy', name='This Product'))
-        
-        fig.update_layout(
-            title={
-                'text': f'{company_name} Word Count Comparison',
-                'x': 0.5,
-                'xanchor': 'center'
-            },
-            xaxis_title='Word Count Ranges',
-            yaxis_title='Percentage of Reviews',
-            hovermode='x',
-            font=dict(family="Nanum Gothic, sans-serif")
-        )
-        
-        interactive_plot_filename = f"{company_name}_Word_Count_Comparison.html"
-        interactive_plot_path = os.path.join(folder_path, interactive_plot_filename)
-        fig.write_html(interactive_plot_path)
-        print(f"Interactive plot saved to {interactive_plot_path}")
-        
-        static_plot_filename = f"{company_name}_Word_Count_Comparison.png"
-        static_plot_path = os.path.join(folder_path, static_plot_filename)
-        fig.write_image(static_plot_path)
-        print(f"Static plot saved to {static_plot_path}")
-    else:
-        print("Date column is missing or contains no valid dates.")
+def category_histogram(baseline, company_name):
+    return baseline.drop(index=company_name, errors='ignore').to_numpy(dtype=np.int64).sum(axis=0)
+
+def to_percentages(histogram):
+    total = histogram.sum()
+    return histogram / total * 100 if total else np.full(len(histogram), np.nan)
+
+def plot_word_count_distribution(histogram, baseline_histogram, company_name, foldername, folder_path):
+    import plotly.graph_objects as go  # only needed with --plots
+    fig = go.Figure()
+    fig.add_trace(go.Scatter(x=LABELS, y=to_percentages(histogram), fill='tozeroy', name='This Product'))
+    if baseline_histogram.sum():
+        fig.add_trace(go.Scatter(x=LABELS, y=to_percentages(baseline_histogram), fill='tozeroy', name=f'Other {foldername} Products'))
+    
+    fig.update_layout(
+        title={
+            'text': f'{company_name} Word Count Comparison',
+            'x': 0.5,
+            'xanchor': 'center'
+        },
+        xaxis_title='Word Count Ranges',
+        yaxis_title='Percentage of Reviews',
+        hovermode='x',
+        font=dict(family="Nanum Gothic, sans-serif")
+    )
+    
+    interactive_plot_filename = f"{company_name}_Word_Count_Comparison.html"
+    interactive_plot_path = os.path.join(folder_path, interactive_plot_filename)
+    fig.write_html(interactive_plot_path)
+    print(f"Interactive plot saved to {interactive_plot_path}")
+    
+    static_plot_filename = f"{company_name}_Word_Count_Comparison.png"
+    static_plot_path = os.path.join(folder_path, static_plot_filename)
+    fig.write_image(static_plot_path)
+    print(f"Static plot saved to {static_plot_path}")
 
 def main():
-    input_filename, foldername = get_filename()
+    input_filename, foldername, text_cache_path, plots = get_filename()
     filename = os.path.join(f'./{foldername}_Collected_Reviews', input_filename)
     company_name = input_filename.split('.')[0]
     folder_path = f'./results/{company_name}'
     
     create_folder(folder_path)
-    df = load_and_preprocess_data(filename)
+    df = load_and_preprocess_data(filename, open_cache(text_cache_path))
     df = remove_empty_reviews(df)
+    histogram = word_count_histogram(df['review_content_length'])
+    
+    baseline = update_baseline(f'./results/{foldername}_word_count_baseline.csv', company_name, histogram)
+    baseline_histogram = category_histogram(baseline, company_name)
     
-    plot_word_count_distribution(df, company_name, folder_path)
+    if plots:
+        plot_word_count_distribution(histogram, baseline_histogram, company_name, foldername, folder_path)
 
 if __name__ == "__main__":
     main()
@@ -0,0 +1,260 @@
+from collections import deque
+from queue import Queue
+from typing import Dict, Iterable, List, Optional, Tuple
+import argparse
+import csv
+import os
+import threading
+import time
+import requests as rq
+from requests.adapters import HTTPAdapter
+from coupang_user_crawler import HostRateLimiter
+from response_cache import ResponseCache, CachedSession, MODES
+from review_page_parsers import Review
+from source_adapters import ADAPTERS, read_targets
+
+# Streams the review pages of many products through three stages: fetch threads download pages, parse threads read
+# the reviews out of them and one sink thread appends them to each product's CSV in page order. The stages are joined
+# by bounded queues, so a slow stage blocks the one before it instead of letting pages pile up, and at most
+# --pages-ahead pages of each of --active-targets products are between planning and the CSV. Memory use therefore
+# does not grow with the number of pages of a product.
+
+QUEUE_SIZE = 16
+PAGES_AHEAD = 4
+ACTIVE_TARGETS = 8
+DONE = None
+
+
+class ReviewWriter:
+    """CSV of one product's reviews, written a page at a time and moved into place when closed."""
+
+    def __init__(self, output_path: str):
+        self.output_path = output_path
+        self.file = None
+        self.writer = None
+        self.reviews = 0
+
+    def write(self, reviews: Iterable[Review]):
+        for review in reviews:
+            if self.writer is None:
+                os.makedirs(os.path.dirname(self.output_path), exist_ok=True)
+                # Same layout as DataFrame.to_csv of the reviews
+                self.file = open(self.output_path + '.tmp', 'w', newline='', encoding='utf-8')
+                self.writer = csv.DictWriter(self.file, fieldnames=list(review), lineterminator='\n')
+                self.writer.writeheader()
+            self.writer.writerow(review)
+            self.reviews += 1
+
+    def close(self) -> int:
+        if self.file is not None:
+            self.file.close()
+            os.replace(self.output_path + '.tmp', self.output_path)
+        return self.reviews
+
+
+class TargetStream:
+    """Pages of one target between planning and the CSV. Pages that arrive early wait until those before them are written."""
+
+    def __init__(self, target: Dict, root: str, pages_ahead: int):
+        self.target = target
+        self.adapter = ADAPTERS[target['source']]
+        self.planned = self.adapter.pages(target['url'], 1, target['pages'])
+        self.pages_ahead = pages_ahead
+        self.in_flight = 0
+        # First page past the last one: known from the page count, or from the first empty page
+        self.end_page = target['pages'] + 1 if target['pages'] else None
+        self.next_page = 1
+        self.waiting = {}
+        self.failed = 0
+        self.failed_in_row = 0
+        self.finished = False
+        self.writer = ReviewWriter(os.path.join(root, f"{target['folder']}_Collected_Reviews", f"{target['name']}.csv"))
+
+    def next_job(self) -> Optional[Tuple[int, str]]:
+        if self.finished or self.in_flight >= self.pages_ahead:
+            return None
+        page, url = next(self.planned, (None, None))
+        if page is None or (self.end_page is not None and page >= self.end_page):
+            self.planned = iter(())
+            return None
+        self.in_flight += 1
+        return page, url
+
+    def add(self, page: int, reviews: Optional[List[Review]]) -> bool:
+        # reviews is None for a page that failed; returns whether the target is finished
+        self.in_flight -= 1
+        if self.finished:
+            return False
+        if reviews is not None and not reviews:
+            self.end_page = page if self.end_page is None else min(self.end_page, page)
+        self.waiting[page] = reviews
+        while self.next_page in self.waiting and (self.end_page is None or self.next_page < self.end_page):
+            reviews = self.waiting.pop(self.next_page)
+            if reviews is None:
+                self.failed += 1
+                self.failed_in_row += 1
+                # Without a page count, a run of failed pages ends the target as an empty page would
+                if self.end_page is None and self.failed_in_row >= self.pages_ahead:
+                    self.end_page = self.next_page + 1
+            else:
+                self.failed_in_row = 0
+                self.writer.write(reviews)
+            self.next_page += 1
+        if self.end_page is not None and self.next_page >= self.end_page:
+            self.finished = True
+            self.waiting.clear()
+        return self.finished
+
+    def close(self):
+        target = self.target
+        failed = f" ({self.failed} pages failed)" if self.failed else ''
+        if self.writer.close():
+            print(f"{target['name']}: {self.writer.reviews} reviews saved to {self.writer.output_path}{failed}")
+        else:
+            print(f"{target['name']}: no reviews{failed}")
+
+
+class CollectionPipeline:
+    """Fetch, parse and sink stages joined by bounded queues; run() returns the totals of the crawl."""
+
+    def __init__(self, targets: List[Dict], session: Optional[rq.Session] = None, fetchers: int = 8, parsers: int = 2,
+                 queue_size: int = QUEUE_SIZE, pages_ahead: int = PAGES_AHEAD, active_targets: int = ACTIVE_TARGETS,
+                 limiter: Optional[HostRateLimiter] = None, max_attempts: int = 3, root: str = '.', progress_every: float = 10.0):
+        self.targets = targets
+        self.limiter = limiter or HostRateLimiter(0.0, 0.0)
+        self.session = session if session is not None else rq.Session()
+        adapter = HTTPAdapter(pool_connections=fetchers, pool_maxsize=fetchers)
+        self.session.mount('http://', adapter)
+        self.session.mount('https://', adapter)
+        self.fetchers = fetchers
+        self.parsers = parsers
+        self.pages_ahead = pages_ahead
+        self.active_targets = active_targets
+        self.max_attempts = max_attempts
+        self.root = root
+        self.progress_every = progress_every
+        self.fetch_queue = Queue(maxsize=queue_size)
+        self.parse_queue = Queue(maxsize=queue_size)
+        self.sink_queue = Queue(maxsize=queue_size)
+        # Guards the TargetStream counters shared by the planner and the sink; the planner waits on it for free pages
+        self.changed = threading.Condition()
+        self.stats = {'pages': 0, 'reviews': 0, 'failed_pages': 0, 'targets': 0}
+
+    def plan(self):
+        # Hands out pages of the active targets, at most pages_ahead of each; put blocks while the fetchers are behind
+        pending = deque(self.targets)
+        active = []
+        while True:
+            with self.changed:
+                active = [stream for stream in active if not stream.finished]
+                while pending and len(active) < self.active_targets:
+                    active.append(TargetStream(pending.popleft(), self.root, self.pages_ahead))
+                if not active:
+                    break
+                jobs = [(stream, *job) for stream in active for job in iter(stream.next_job, None)]
+                if not jobs:
+                    self.changed.wait()
+                    continue
+            for job in jobs:
+                self.fetch_queue.put(job)
+
+    def fetch(self):
+        while (job := self.fetch_queue.get()) is not DONE:
+            stream, page, url = job
+            html = None
+            for attempt in range(self.max_attempts):
+                try:
+                    if not isinstance(self.session, CachedSession):
+                        self.limiter.wait(url)
+                    html = stream.adapter.fetch(self.session, stream.target['url'], page).text
+                    break
+                except Exception as e:
+                    if attempt + 1 == self.max_attempts:
+                        print(f"{stream.target['name']} page {page} failed after {self.max_attempts} attempts: {e}")
+                    else:
+                        time.sleep(self.limiter.delay * 2 ** attempt)
+            self.parse_queue.put((stream, page, html))
+
+    def parse(self):
+        while (job := self.parse_queue.get()) is not DONE:
+            stream, page, html = job
+            reviews = None
+            if html is not None:
+                try:
+                    reviews = stream.adapter.parse(html)
+                except Exception as e:
+                    print(f"{stream.target['name']} page {page} could not be parsed: {e}")
+            self.sink_queue.put((stream, page, reviews))
+
+    def sink(self):
+        start = last_progress = time.monotonic()
+        while (job := self.sink_queue.get()) is not DONE:
+            stream, page, reviews = job
+            with self.changed:
+                finished = stream.add(page, reviews)
+                self.changed.notify_all()
+            self.stats['pages'] += 1
+            self.stats['reviews'] += len(reviews or [])
+            self.stats['failed_pages'] += reviews is None
+            if finished:
+                stream.close()
+                self.stats['targets'] += 1
+            now = time.monotonic()
+            if self.progress_every and now - last_progress >= self.progress_every:
+                print(f"[{now - start:.0f}s] {self.stats['pages']} pages ({self.stats['pages'] / (now - start):.1f}/s), "
+                      f"queued: {self.fetch_queue.qsize()} to fetch, {self.parse_queue.qsize()} to parse, {self.sink_queue.qsize()} to write")
+                last_progress = now
+
+    def run(self) -> Dict:
+        start = time.monotonic()
+        stages = [(self.fetch, self.fetchers, self.fetch_queue), (self.parse, self.parsers, self.parse_queue), (self.sink, 1, self.sink_queue)]
+        threads = [[threading.Thread(target=stage, daemon=True) for _ in range(count)] for stage, count, _ in stages]
+        for stage_threads in threads:
+            for thread in stage_threads:
+                thread.start()
+        self.plan()
+        # Each stage is told to stop once the stage before it has handed over its last page
+        for stage_threads, (_, count, queue) in zip(threads, stages):
+            for _ in range(count):
+                queue.put(DONE)
+            for thread in stage_threads:
+                thread.join()
+        seconds = time.monotonic() - start
+        return {**self.stats, 'seconds': round(seconds, 1), 'pages_per_second': round(self.stats['pages'] / seconds, 2) if seconds else None}
+
+
+def get_args():
+    parser = argparse.ArgumentParser(description='Stream the review pages of many products from fetch to parse to CSV with bounded memory.')
+    parser.add_argument('targets', type=str, help='CSV of targets: url, name and optionally source (coupang, crema, alpha, cafe24), folder, pages')
+    parser.add_argument('--root', type=str, default='.', help='Folder in which <folder>_Collected_Reviews/<name>.csv are written')
+    parser.add_argument('--fetchers', type=int, default=8, help='Threads downloading pages')
+    parser.add_argument('--parsers', type=int, default=2, help='Threads parsing pages')
+    parser.add_argument('--queue-size', type=int, default=QUEUE_SIZE, help='Pages each queue between two stages holds before the stage feeding it waits')
+    parser.add_argument('--pages-ahead', type=int, default=PAGES_AHEAD, help='Pages of one product fetched ahead of the one being written')
+    parser.add_argument('--active-targets', type=int, default=ACTIVE_TARGETS, help='Products crawled at the same time')
+    parser.add_argument('--delay', type=float, default=1.0, help='Minimum seconds between requests to the same host')
+    parser.add_argument('--jitter', type=float, default=1.0, help='Random extra seconds added to the delay')
+    parser.add_argument('--max-attempts', type=int, default=3, help='Attempts per page before it is skipped as failed')
+    parser.add_argument('--progress-every', type=float, default=10.0, help='Seconds between progress lines, 0 to disable')
+    parser.add_argument('--cache', type=str, default=None, help='Folder of a response cache to record to or replay from')
+    parser.add_argument('--cache-mode', type=str, default='record', choices=MODES, help='replay serves every page from the cache without network')
+    parser.add_argument('--cache-ttl-days', type=float, default=None, help='Cached pages older than this are fetched again when recording')
+    return parser.parse_args()
+
+
+def main():
+    args = get_args()
+    limiter = HostRateLimiter(args.delay, args.jitter)
+    session = None
+    if args.cache:
+        # With a response cache, only requests that really go to the network wait for the rate limiter
+        cache_ttl = args.cache_ttl_days * 24 * 3600 if args.cache_ttl_days is not None else None
+        session = CachedSession(ResponseCache(args.cache, ttl=cache_ttl, mode=args.cache_mode), before_fetch=limiter.wait)
+    pipeline = CollectionPipeline(read_targets(args.targets), session, fetchers=args.fetchers, parsers=args.parsers,
+                                  queue_size=args.queue_size, pages_ahead=args.pages_ahead, active_targets=args.active_targets,
+                                  limiter=limiter, max_attempts=args.max_attempts, root=args.root, progress_every=args.progress_every)
+    print(pipeline.run())
+
+
+if __name__ == "__main__":
+    main()
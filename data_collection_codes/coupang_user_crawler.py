@@ -0,0 +1,316 @@
+from bs4 import BeautifulSoup as bs
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from typing import Optional, Union, Dict, List, Iterable
+from urllib.parse import urlparse
+import argparse
+import math
+import random
+import re
+import sqlite3
+import threading
+import time
+import pandas as pd
+import requests as rq
+from requests.adapters import HTTPAdapter
+from response_cache import ResponseCache, CachedSession, MODES
+
+
+class HostRateLimiter:
+    """Allow at most one request per `delay` seconds (plus jitter) to each host, shared by all threads."""
+
+    def __init__(self, delay: float = 1.0, jitter: float = 1.0):
+        self.delay = delay
+        self.jitter = jitter
+        self.next_allowed = {}
+        self.lock = threading.Lock()
+
+    def reserve(self, url: str) -> float:
+        # The next free send slot of the url's host (time.monotonic()), taken for the caller. The lock only covers this
+        # bookkeeping, so threads waiting for their slots, and their requests, overlap.
+        host = urlparse(url).netloc
+        with self.lock:
+            now = time.monotonic()
+            start = max(now, self.next_allowed.get(host, now))
+            self.next_allowed[host] = start + self.delay + random.uniform(0, self.jitter)
+        return start
+
+    def wait(self, url: str):
+        delay = self.reserve(url) - time.monotonic()
+        if delay > 0:
+            time.sleep(delay)
+
+
+class UserHistoryStore:
+    """All collected user profiles and reviews in one SQLite file instead of one CSV per user."""
+
+    def __init__(self, path: str):
+        self.conn = sqlite3.connect(path)
+        self.conn.executescript("""
+            CREATE TABLE IF NOT EXISTS user_profiles (
+                user_uid TEXT PRIMARY KEY,
+                username_2 TEXT,
+                review_count INTEGER,
+                fetched_at REAL
+            );
+            CREATE TABLE IF NOT EXISTS user_reviews (
+                review_uid TEXT,
+                user_uid TEXT,
+                rating INTEGER,
+                product_name TEXT,
+                review_date TEXT,
+                seller_name TEXT,
+                review_title TEXT,
+                review_content TEXT,
+                survey_answer TEXT,
+                PRIMARY KEY (user_uid, review_uid)
+            );
+        """)
+
+    def fresh_users(self, user_uids: Iterable[str], ttl: float) -> set:
+        cutoff = time.time() - ttl
+        rows = self.conn.execute('SELECT user_uid FROM user_profiles WHERE fetched_at >= ?', (cutoff,)).fetchall()
+        return {row[0] for row in rows} & set(user_uids)
+
+    def save_user(self, user_info: Dict[str, Union[str, int]], reviews: List[Dict[str, Union[str, int]]]):
+        # The profile row is written last, so a crash mid-user leaves it stale and it is fetched again. A review without
+        # a review_uid ('N/A') is stored with a NULL one, which SQLite keeps apart even in the primary key; the fetch
+        # has all of the user's reviews, so those of the previous fetch are deleted instead of piling up.
+        reviews = [{**review, 'review_uid': None if review['review_uid'] == 'N/A' else review['review_uid']} for review in reviews]
+        with self.conn:
+            self.conn.execute('DELETE FROM user_reviews WHERE user_uid = ? AND review_uid IS NULL', (user_info['user_uid'],))
+            self.conn.executemany(
+                'INSERT OR REPLACE INTO user_reviews VALUES (:review_uid, :user_uid, :rating, :product_name, :review_date, '
+                ':seller_name, :review_title, :review_content, :survey_answer)', reviews)
+            self.conn.execute(
+                'INSERT OR REPLACE INTO user_profiles VALUES (?, ?, ?, ?)',
+                (user_info['user_uid'], user_info['username_2'], int(user_info['review_count']), time.time()))
+
+    def user_reviews(self, user_uids: Optional[Iterable[str]] = None) -> pd.DataFrame:
+        df = pd.read_sql_query('SELECT * FROM user_reviews', self.conn)
+        df['review_uid'] = df['review_uid'].fillna('N/A')
+        if user_uids is not None:
+            df = df[df['user_uid'].isin([str(u) for u in user_uids])]
+        return df
+
+    def close(self):
+        self.conn.close()
+
+
+class CoupangUserCrawler:
+    headers = {
+        "authority": "weblog.coupang.com",
+        "scheme": "https",
+        "origin": "https://www.coupang.com",
+        "sec-ch-ua-mobile": "?0",
+        "sec-ch-ua-platform": "macOS",
+        "user-agent": "Mozilla/5.0 (Macintosh; Intel Mac OS X 10_15_7) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/112.0.0.0 Whale/3.20.182.14 Safari/537.36",
+        "cookie": "PCID=31489593180081104183684; _fbp=fb.1.1644931520418.1544640325; gd1=Y; X-CP-PT-locale=ko_KR; MARKETID=31489593180081104183684; sid=03ae1c0ed61946c19e760cf1a3d9317d808aca8b; overrideAbTestGroup=%5B%5D; x-coupang-origin-region=KOREA; x-coupang-accept-language=ko_KR;"
+    }
+    page_size = 15
+
+    def __init__(self, store: UserHistoryStore, base_url: str = 'https://www.coupang.com', workers: int = 8,
+                 delay: float = 1.0, jitter: float = 1.0, ttl: float = 7 * 24 * 3600, cache: Optional[ResponseCache] = None,
+                 max_attempts: int = 3):
+        self.store = store
+        self.base_url = base_url.rstrip('/')
+        self.workers = workers
+        self.ttl = ttl
+        self.max_attempts = max_attempts
+        self.limiter = HostRateLimiter(delay, jitter)
+        # With a response cache, only requests that really go to the network wait for the rate limiter
+        self.session = CachedSession(cache, before_fetch=self.limiter.wait) if cache is not None else rq.Session()
+        adapter = HTTPAdapter(pool_connections=workers, pool_maxsize=workers)
+        self.session.mount('http://', adapter)
+        self.session.mount('https://', adapter)
+
+    def get(self, url: str, product_url: str) -> str:
+        # Failed requests are tried again after delay * 2 ** attempt seconds, waiting for a new send slot each time
+        for attempt in range(self.max_attempts):
+            try:
+                if not isinstance(self.session, CachedSession):
+                    self.limiter.wait(url)
+                response = self.session.get(url, headers={**self.headers, 'referer': product_url}, timeout=30)
+                response.raise_for_status()
+                return response.text
+            except rq.RequestException:
+                if attempt + 1 == self.max_attempts:
+                    raise
+                time.sleep(self.limiter.delay * 2 ** attempt)
+
+    def get_user_info(self, user_uid: str, product_url: str) -> Dict[str, Union[str, int]]:
+        html = self.get(f'{self.base_url}/vp/product/reviews/profile/{user_uid}', product_url)
+        return self.parse_user_info(user_uid, html)
+
+    @staticmethod
+    def parse_user_info(user_uid: str, html: str) -> Dict[str, Union[str, int]]:
+        soup = bs(html, 'html.parser')
+
+        username_2 = soup.select_one('div.sdp-review__profile__article__info__name')
+        if username_2 == None:
+            username_2 = 'N/A'
+        else:
+            username_2 = username_2.text.strip()
+
+        review_count = soup.select_one('div.js_reviewProfileModalHiddenTotalCount')
+        if review_count == None:
+            review_count = 0
+        else:
+            review_count = review_count.attrs['data-total-count']
+
+        return {
+            'user_uid': user_uid,
+            'username_2': username_2,
+            'review_count': review_count
+        }
+
+    def fetch_reviews(self, user_uid: str, product_url: str, pages: int) -> List[Dict[str, Union[str, int]]]:
+        results = []
+        for page in range(0, pages + 1):
+            html = self.get(f'{self.base_url}/vp/product/reviews/profile/{user_uid}/reviews?page={page}&size={self.page_size}', product_url)
+            results.extend(self.parse_reviews(user_uid, html))
+        return results
+
+    @staticmethod
+    def parse_reviews(user_uid: str, html: str) -> List[Dict[str, Union[str, int]]]:
+        soup = bs(html, 'html.parser')
+        articles = soup.select('div.sdp-review__profile__article__list__reviews')
+        user_review_data = []
+
+        for article in articles:
+            # Review UID
+            review_uid = article.select_one('div.sdp-review__profile__article__list__reviews__help')
+            if review_uid == None:
+                review_uid = 'N/A'
+            else:
+                review_uid = review_uid.attrs['data-review-id']
+
+            # Rating
+            rating = article.select_one('div.sdp-review__profile__article__list__reviews__star__orange')
+            if rating == None:
+                rating = 0
+            else:
+                rating = int(rating.attrs['data-rating'])
+
+            # Product Name
+            prod_name = article.select_one('div.sdp-review__profile__article__list__reviews__product__name')
+            if prod_name == None or prod_name.text == '':
+                prod_name = 'N/A'
+            else:
+                prod_name = prod_name.text.strip()
+
+            # Date
+            date = article.select_one('div.sdp-review__profile__article__list__reviews__star__date').text.strip()
+
+            # Seller
+            seller = article.select_one('div.sdp-review__profile__article__list__reviews__seller_name')
+            if seller == None or seller.text == '':
+                seller = 'N/A'
+            else:
+                seller = seller.text.strip()[5:]
+
+            # Review Title/Headline
+            headline = article.select_one('div.sdp-review__profile__article__list__reviews__title')
+            if headline == None or headline.text == '':
+                headline = 'N/A'
+            else:
+                headline = headline.text.strip()
+
+            # Review Content
+            review_content = article.select_one('div.sdp-review__profile__article__list__reviews__content')
+            if review_content == None:
+                review_content = 'N/A'
+            else:
+                review_content = re.sub('[\n\t]', '', review_content.text.strip())
+
+            # Survey Feedback
+            answer = article.select_one('span.sdp-review__profile__article__list__reviews__survey__row__answer')
+            if answer == None or answer.text == '':
+                answer = 'N/A'
+            else:
+                answer = answer.text.strip()
+
+            user_review_data.append({
+                'review_uid': review_uid,
+                'user_uid': user_uid,
+                'rating': rating,
+                'product_name': prod_name,
+                'review_date': date,
+                'seller_name': seller,
+                'review_title': headline,
+                'review_content': review_content,
+                'survey_answer': answer
+            })
+
+        return user_review_data
+
+    def get_reviews_of_user(self, user_uid: str, product_url: str):
+        user_info = self.get_user_info(user_uid, product_url)
+        pages = math.ceil(int(user_info['review_count']) / self.page_size)
+        return user_info, self.fetch_reviews(user_uid, product_url, pages)
+
+    def collect_reviews_of_users_from_product(self, product_url: str, user_uid_list: Iterable) -> Dict[str, int]:
+        user_uids = list(dict.fromkeys(str(u) for u in user_uid_list))
+        fresh = self.store.fresh_users(user_uids, self.ttl)
+        pending = [u for u in user_uids if u not in fresh]
+        print(f"{len(user_uids)} users, {len(fresh)} already collected, {len(pending)} to fetch")
+
+        stats = {'skipped': len(fresh), 'collected': 0, 'failed': 0}
+        with ThreadPoolExecutor(max_workers=self.workers) as executor:
+            futures = {executor.submit(self.get_reviews_of_user, u, product_url): u for u in pending}
+            for future in as_completed(futures):
+                user_uid = futures[future]
+                try:
+                    user_info, reviews = future.result()
+                except Exception as e:
+                    stats['failed'] += 1
+                    print(f"User ID: {user_uid} failed: {e}")
+                    continue
+                self.store.save_user(user_info, reviews)
+                stats['collected'] += 1
+                print(f"User ID: {user_uid} saved ({len(reviews)} reviews)")
+        return stats
+
+
+def parse_page(url: str, html: str):
+    # Parser for any cached Coupang profile page, for response_cache.py bench/check
+    match = re.search(r'/profile/([^/?]+)(/reviews)?', url)
+    if match.group(2):
+        return CoupangUserCrawler.parse_reviews(match.group(1), html)
+    return CoupangUserCrawler.parse_user_info(match.group(1), html)
+
+
+def get_args():
+    parser = argparse.ArgumentParser(description='Collect the review histories of the reviewers of a Coupang product.')
+    parser.add_argument('reviews_csv', type=str, help='Collected product reviews with a user_uid column')
+    parser.add_argument('product_url', type=str, help='The product URL, sent as referer')
+    parser.add_argument('--store', type=str, default='Coupang_Collected_User_Reviews.sqlite', help='The consolidated user history store')
+    parser.add_argument('--base-url', type=str, default='https://www.coupang.com', help='Override to crawl a local mock server')
+    parser.add_argument('--workers', type=int, default=8, help='Users fetched concurrently')
+    parser.add_argument('--delay', type=float, default=1.0, help='Minimum seconds between requests to the same host')
+    parser.add_argument('--jitter', type=float, default=1.0, help='Random extra seconds added to the delay')
+    parser.add_argument('--ttl-days', type=float, default=7, help='Users collected within this many days are skipped')
+    parser.add_argument('--max-attempts', type=int, default=3, help='Attempts per page before the user is counted as failed')
+    parser.add_argument('--cache', type=str, default=None, help='Folder of a response cache to record to or replay from')
+    parser.add_argument('--cache-mode', type=str, default='record', choices=MODES, help='replay serves every page from the cache without network')
+    parser.add_argument('--cache-ttl-days', type=float, default=None, help='Cached pages older than this are fetched again when recording')
+    return parser.parse_args()
+
+
+def main():
+    args = get_args()
+    product_reviews = pd.read_csv(args.reviews_csv)
+    user_uid_list = product_reviews['user_uid'].unique().tolist()
+
+    store = UserHistoryStore(args.store)
+    cache = None
+    if args.cache:
+        cache_ttl = args.cache_ttl_days * 24 * 3600 if args.cache_ttl_days is not None else None
+        cache = ResponseCache(args.cache, ttl=cache_ttl, mode=args.cache_mode)
+    crawler = CoupangUserCrawler(store, base_url=args.base_url, workers=args.workers, delay=args.delay,
+                                 jitter=args.jitter, ttl=args.ttl_days * 24 * 3600, cache=cache, max_attempts=args.max_attempts)
+    print(crawler.collect_reviews_of_users_from_product(args.product_url, user_uid_list))
+    store.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,357 @@
+from collections import OrderedDict, deque
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple
+from urllib.parse import urlsplit
+import argparse
+import json
+import os
+import random
+import sqlite3
+import time
+import requests as rq
+from requests.adapters import HTTPAdapter
+from response_cache import ResponseCache, CachedSession, MODES
+from source_adapters import ADAPTERS, read_targets
+from collection_pipeline import ReviewWriter
+
+# Crawls the review pages of many products at once. Every (target, page) job is kept in a SQLite frontier together with
+# the reviews of the pages parsed so far, written in one transaction, so a crashed crawl resumes where it stopped and
+# no page is stored twice. Jobs are handed out host by host: a host gets a new request only while it has fewer than
+# its concurrency limit in flight and its delay since the last request has passed, and the products of a host take turns.
+
+
+class CrawlFrontier:
+    """Targets, their (target, page) jobs and the reviews of the finished pages, in one SQLite file."""
+
+    def __init__(self, path: str):
+        self.conn = sqlite3.connect(path)
+        self.conn.execute('PRAGMA journal_mode=WAL')
+        self.conn.executescript("""
+            CREATE TABLE IF NOT EXISTS targets (
+                target_id INTEGER PRIMARY KEY,
+                url TEXT UNIQUE,
+                source TEXT,
+                name TEXT,
+                folder TEXT,
+                pages INTEGER,
+                exported INTEGER DEFAULT 0
+            );
+            CREATE TABLE IF NOT EXISTS jobs (
+                target_id INTEGER,
+                page INTEGER,
+                status TEXT,
+                attempts INTEGER,
+                reviews INTEGER,
+                PRIMARY KEY (target_id, page)
+            );
+            CREATE TABLE IF NOT EXISTS reviews (
+                target_id INTEGER,
+                page INTEGER,
+                position INTEGER,
+                review TEXT,
+                PRIMARY KEY (target_id, page, position)
+            );
+        """)
+
+    def add_targets(self, targets: Iterable[Dict]) -> int:
+        # Targets already in the frontier keep their state; a known page count queues every page at once
+        added = 0
+        with self.conn:
+            for target in targets:
+                cursor = self.conn.execute('INSERT OR IGNORE INTO targets (url, source, name, folder, pages) VALUES (?, ?, ?, ?, ?)',
+                                           (target['url'], target['source'], target['name'], target['folder'], target['pages']))
+                if cursor.rowcount:
+                    added += 1
+                    pages = range(1, target['pages'] + 1) if target['pages'] else [1]
+                    self.conn.executemany("INSERT INTO jobs VALUES (?, ?, 'pending', 0, NULL)", [(cursor.lastrowid, page) for page in pages])
+        return added
+
+    def targets(self) -> Dict[int, Dict]:
+        rows = self.conn.execute('SELECT target_id, url, source, name, folder, pages FROM targets').fetchall()
+        return {row[0]: dict(zip(['target_id', 'url', 'source', 'name', 'folder', 'pages'], row)) for row in rows}
+
+    def pending_jobs(self) -> List[Tuple[int, int, int]]:
+        return self.conn.execute("SELECT target_id, page, attempts FROM jobs WHERE status = 'pending' ORDER BY target_id, page").fetchall()
+
+    def finish_page(self, target_id: int, page: int, reviews: List[Dict], next_page: Optional[int] = None, last_page: bool = False):
+        with self.conn:
+            self.conn.executemany('INSERT OR REPLACE INTO reviews VALUES (?, ?, ?, ?)',
+                                  [(target_id, page, i, json.dumps(review, ensure_ascii=False)) for i, review in enumerate(reviews)])
+            self.conn.execute("UPDATE jobs SET status = 'done', reviews = ? WHERE target_id = ? AND page = ?", (len(reviews), target_id, page))
+            if next_page is not None:
+                self.conn.execute("INSERT OR IGNORE INTO jobs VALUES (?, ?, 'pending', 0, NULL)", (target_id, next_page))
+            if last_page:
+                self.conn.execute("UPDATE jobs SET status = 'cancelled' WHERE target_id = ? AND page > ? AND status = 'pending'", (target_id, page))
+
+    def fail_page(self, target_id: int, page: int, attempts: int, final: bool):
+        with self.conn:
+            self.conn.execute('UPDATE jobs SET status = ?, attempts = ? WHERE target_id = ? AND page = ?',
+                              ('failed' if final else 'pending', attempts, target_id, page))
+
+    def retry_failed(self) -> int:
+        with self.conn:
+            self.conn.execute("UPDATE targets SET exported = 0 WHERE target_id IN (SELECT target_id FROM jobs WHERE status = 'failed')")
+            return self.conn.execute("UPDATE jobs SET status = 'pending', attempts = 0 WHERE status = 'failed'").rowcount
+
+    def finished_targets(self) -> List[int]:
+        # Targets with no pending page whose reviews have not been written out yet
+        rows = self.conn.execute("""SELECT target_id FROM targets WHERE exported = 0 AND NOT EXISTS
+                                    (SELECT 1 FROM jobs WHERE jobs.target_id = targets.target_id AND status = 'pending')""").fetchall()
+        return [row[0] for row in rows]
+
+    def target_reviews(self, target_id: int) -> Iterator[Dict]:
+        # Read row by row, so a product with many pages is never in memory at once
+        for row in self.conn.execute('SELECT review FROM reviews WHERE target_id = ? ORDER BY page, position', (target_id,)):
+            yield json.loads(row[0])
+
+    def failed_pages(self, target_id: int) -> int:
+        return self.conn.execute("SELECT COUNT(*) FROM jobs WHERE target_id = ? AND status = 'failed'", (target_id,)).fetchone()[0]
+
+    def mark_exported(self, target_id: int):
+        with self.conn:
+            self.conn.execute('UPDATE targets SET exported = 1 WHERE target_id = ?', (target_id,))
+
+    def job_counts(self) -> Dict[str, int]:
+        return dict(self.conn.execute('SELECT status, COUNT(*) FROM jobs GROUP BY status').fetchall())
+
+    def close(self):
+        self.conn.close()
+
+
+class HostSlots:
+    """Politeness state of one host: requests in flight, when the next one may start, and the queued pages of each target."""
+
+    def __init__(self, concurrency: int, delay: float, jitter: float):
+        self.concurrency = concurrency
+        self.delay = delay
+        self.jitter = jitter
+        self.in_flight = 0
+        self.next_allowed = 0.0
+        # target_id -> deque of [page, attempts, not_before]
+        self.queues = OrderedDict()
+        self.pages = 0
+        self.reviews = 0
+        self.failures = 0
+        self.first_start = None
+        self.last_finish = None
+
+    def ready_at(self) -> Optional[float]:
+        # When the next request may start, None when the host is full or has nothing queued
+        if self.in_flight >= self.concurrency:
+            return None
+        heads = [queue[0][2] for queue in self.queues.values() if queue]
+        return max(self.next_allowed, min(heads)) if heads else None
+
+    def take(self, now: float) -> Optional[Tuple[int, int, int]]:
+        # The first target with a page due goes to the back of the line, so the targets of a host take turns
+        for target_id, queue in self.queues.items():
+            if queue and queue[0][2] <= now:
+                self.queues.move_to_end(target_id)
+                page, attempts, _ = queue.popleft()
+                return target_id, page, attempts
+        return None
+
+    def start(self, now: float):
+        self.in_flight += 1
+        self.next_allowed = now + self.delay + random.uniform(0, self.jitter)
+        if self.first_start is None:
+            self.first_start = now
+
+    def stats(self) -> Dict:
+        seconds = (self.last_finish - self.first_start) if self.first_start is not None and self.last_finish is not None else 0.0
+        return {'pages': self.pages, 'reviews': self.reviews, 'failures': self.failures, 'seconds': round(seconds, 1),
+                'pages_per_second': round(self.pages / seconds, 2) if seconds else None}
+
+
+class CrawlScheduler:
+    """Runs the pending jobs of a CrawlFrontier on a thread pool within per-host concurrency and delay limits."""
+
+    def __init__(self, frontier: CrawlFrontier, session: Optional[rq.Session] = None, workers: int = 16, concurrency: int = 2,
+                 delay: float = 1.0, jitter: float = 1.0, host_limits: Optional[Dict[str, Tuple[int, float]]] = None,
+                 max_attempts: int = 3, root: str = '.', progress_every: float = 10.0):
+        self.frontier = frontier
+        self.session = session if session is not None else rq.Session()
+        adapter = HTTPAdapter(pool_connections=workers, pool_maxsize=workers)
+        self.session.mount('http://', adapter)
+        self.session.mount('https://', adapter)
+        self.workers = workers
+        self.concurrency = concurrency
+        self.delay = delay
+        self.jitter = jitter
+        self.host_limits = host_limits or {}
+        self.max_attempts = max_attempts
+        self.root = root
+        self.progress_every = progress_every
+        self.targets = {}
+        self.hosts = OrderedDict()
+        self.target_in_flight = {}
+
+    def host(self, target: Dict) -> HostSlots:
+        name = urlsplit(target['url']).netloc
+        if name not in self.hosts:
+            concurrency, delay = self.host_limits.get(name, (self.concurrency, self.delay))
+            self.hosts[name] = HostSlots(concurrency, delay, self.jitter)
+        return self.hosts[name]
+
+    def load(self):
+        self.targets = self.frontier.targets()
+        for target_id, page, attempts in self.frontier.pending_jobs():
+            self.host(self.targets[target_id]).queues.setdefault(target_id, deque()).append([page, attempts, 0.0])
+
+    def fetch(self, target: Dict, page: int) -> Tuple[List[Dict], bool]:
+        # Runs on a worker thread: download and parse one page; the frontier is only written from the scheduling thread
+        adapter = ADAPTERS[target['source']]
+        response = adapter.fetch(self.session, target['url'], page)
+        return adapter.parse(response.text), 'X-Response-Cache' in response.headers
+
+    def export(self, target_id: int):
+        target = self.targets[target_id]
+        failed = self.frontier.failed_pages(target_id)
+        writer = ReviewWriter(os.path.join(self.root, f"{target['folder']}_Collected_Reviews", f"{target['name']}.csv"))
+        writer.write(self.frontier.target_reviews(target_id))
+        if writer.close():
+            print(f"{target['name']}: {writer.reviews} reviews saved to {writer.output_path}" + (f" ({failed} pages failed)" if failed else ''))
+        else:
+            print(f"{target['name']}: no reviews" + (f" ({failed} pages failed)" if failed else ''))
+        self.frontier.mark_exported(target_id)
+
+    def export_if_finished(self, target_id: int):
+        host = self.host(self.targets[target_id])
+        if not host.queues.get(target_id) and not self.target_in_flight.get(target_id):
+            self.export(target_id)
+
+    def finish(self, target_id: int, page: int, attempts: int, previous_allowed: float, future, now: float):
+        target = self.targets[target_id]
+        host = self.host(target)
+        host.in_flight -= 1
+        host.last_finish = now
+        self.target_in_flight[target_id] -= 1
+        queue = host.queues.setdefault(target_id, deque())
+        try:
+            reviews, cache_hit = future.result()
+        except Exception as e:
+            host.failures += 1
+            attempts += 1
+            final = attempts >= self.max_attempts
+            self.frontier.fail_page(target_id, page, attempts, final)
+            if final:
+                print(f"{target['name']} page {page} failed after {attempts} attempts: {e}")
+            else:
+                queue.appendleft([page, attempts, now + host.delay * 2 ** attempts])
+        else:
+            if cache_hit:
+                # The page came from the response cache, so the host was not contacted
+                host.next_allowed = min(host.next_allowed, previous_allowed)
+            host.pages += 1
+            host.reviews += len(reviews)
+            # An empty page is past the last one; without a known page count the next page is queued after each full one
+            next_page = page + 1 if reviews and not target['pages'] else None
+            self.frontier.finish_page(target_id, page, reviews, next_page, last_page=not reviews)
+            if next_page is not None:
+                queue.append([next_page, 0, now])
+            elif not reviews:
+                host.queues[target_id] = deque(job for job in queue if job[0] < page)
+        self.export_if_finished(target_id)
+
+    def progress(self, elapsed: float):
+        hosts = ', '.join(f"{name} {host.pages} pages ({host.stats()['pages_per_second'] or 0}/s, {host.in_flight} in flight)"
+                          for name, host in self.hosts.items())
+        print(f"[{elapsed:.0f}s] {hosts}")
+
+    def run(self) -> Dict[str, Dict]:
+        self.load()
+        for target_id in self.frontier.finished_targets():
+            if not any(target_id in host.queues for host in self.hosts.values()):
+                self.export(target_id)
+        in_flight = {}
+        start = last_progress = time.monotonic()
+        with ThreadPoolExecutor(max_workers=self.workers) as executor:
+            while True:
+                now = time.monotonic()
+                # Start every request that is allowed now, one host after the other
+                for host in list(self.hosts.values()):
+                    while len(in_flight) < self.workers:
+                        ready = host.ready_at()
+                        if ready is None or ready > now:
+                            break
+                        target_id, page, attempts = host.take(now)
+                        previous_allowed = host.next_allowed
+                        host.start(now)
+                        self.target_in_flight[target_id] = self.target_in_flight.get(target_id, 0) + 1
+                        future = executor.submit(self.fetch, self.targets[target_id], page)
+                        in_flight[future] = (target_id, page, attempts, previous_allowed)
+                # Rotate so that no host is always served first when the workers are all busy
+                if self.hosts:
+                    self.hosts.move_to_end(next(iter(self.hosts)))
+
+                waits = [ready for ready in (host.ready_at() for host in self.hosts.values()) if ready is not None]
+                if not in_flight and not waits:
+                    break
+                timeout = max(0.0, min(waits) - now) if waits and len(in_flight) < self.workers else None
+                if in_flight:
+                    done, _ = wait(in_flight, timeout=timeout, return_when=FIRST_COMPLETED)
+                else:
+                    time.sleep(timeout)
+                    done = []
+                now = time.monotonic()
+                for future in done:
+                    self.finish(*in_flight.pop(future), future, now)
+                if self.progress_every and now - last_progress >= self.progress_every:
+                    self.progress(now - start)
+                    last_progress = now
+        return {name: host.stats() for name, host in self.hosts.items()}
+
+
+def parse_host_limits(specs: Iterable[str]) -> Dict[str, Tuple[int, float]]:
+    # host=concurrency:delay, ex. www.coupang.com=1:3
+    limits = {}
+    for spec in specs:
+        host, limit = spec.split('=')
+        concurrency, delay = limit.split(':')
+        limits[host] = (int(concurrency), float(delay))
+    return limits
+
+
+def get_args():
+    parser = argparse.ArgumentParser(description='Crawl the review pages of many products across review sites, resumable after a crash.')
+    parser.add_argument('targets', type=str, nargs='?', help='CSV of targets: url, name and optionally source (coupang, crema, alpha, cafe24), folder, pages')
+    parser.add_argument('--frontier', type=str, default='crawl_frontier.sqlite', help='Crawl state; run again with the same file to resume')
+    parser.add_argument('--root', type=str, default='.', help='Folder in which <folder>_Collected_Reviews/<name>.csv are written')
+    parser.add_argument('--workers', type=int, default=16, help='Pages fetched concurrently over all hosts')
+    parser.add_argument('--concurrency', type=int, default=2, help='Requests in flight per host')
+    parser.add_argument('--delay', type=float, default=1.0, help='Minimum seconds between requests to the same host')
+    parser.add_argument('--jitter', type=float, default=1.0, help='Random extra seconds added to the delay')
+    parser.add_argument('--host-limit', type=str, nargs='*', default=[], help='Per-host concurrency and delay, ex. www.coupang.com=1:3')
+    parser.add_argument('--max-attempts', type=int, default=3, help='Attempts per page before it is recorded as failed')
+    parser.add_argument('--retry-failed', action='store_true', help='Queue the pages that failed in earlier runs again')
+    parser.add_argument('--progress-every', type=float, default=10.0, help='Seconds between progress lines, 0 to disable')
+    parser.add_argument('--cache', type=str, default=None, help='Folder of a response cache to record to or replay from')
+    parser.add_argument('--cache-mode', type=str, default='record', choices=MODES, help='replay serves every page from the cache without network')
+    parser.add_argument('--cache-ttl-days', type=float, default=None, help='Cached pages older than this are fetched again when recording')
+    return parser.parse_args()
+
+
+def main():
+    args = get_args()
+    frontier = CrawlFrontier(args.frontier)
+    if args.targets:
+        print(f"{frontier.add_targets(read_targets(args.targets))} new targets")
+    if args.retry_failed:
+        print(f"{frontier.retry_failed()} failed pages queued again")
+    print(f"Jobs: {frontier.job_counts()}")
+
+    session = None
+    if args.cache:
+        cache_ttl = args.cache_ttl_days * 24 * 3600 if args.cache_ttl_days is not None else None
+        session = CachedSession(ResponseCache(args.cache, ttl=cache_ttl, mode=args.cache_mode))
+    scheduler = CrawlScheduler(frontier, session, workers=args.workers, concurrency=args.concurrency, delay=args.delay,
+                               jitter=args.jitter, host_limits=parse_host_limits(args.host_limit), max_attempts=args.max_attempts,
+                               root=args.root, progress_every=args.progress_every)
+    for host, stats in scheduler.run().items():
+        print(f"{host}: {stats}")
+    print(f"Jobs: {frontier.job_counts()}")
+    frontier.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,225 @@
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from typing import Optional
+from urllib.parse import urlparse, parse_qs
+import argparse
+import csv
+import random
+import threading
+import time
+
+# Local stand-in for the review sites, so the collectors can be run and timed without touching the live pages.
+# Every page is generated deterministically from the URL.
+
+
+def coupang_profile_page(user_uid: str, review_count: int) -> str:
+    return f"""<html><body>
+<div class="sdp-review__profile__article__info__name">user{user_uid}</div>
+<div class="js_reviewProfileModalHiddenTotalCount" data-total-count="{review_count}"></div>
+</body></html>"""
+
+
+def coupang_profile_reviews_page(user_uid: str, page: int, size: int, review_count: int) -> str:
+    rng = random.Random(f'{user_uid}:{page}')
+    first = page * size
+    articles = []
+    for i in range(first, min(first + size, review_count)):
+        articles.append(f"""<div class="sdp-review__profile__article__list__reviews">
+<div class="sdp-review__profile__article__list__reviews__help" data-review-id="{user_uid}{i:05d}"></div>
+<div class="sdp-review__profile__article__list__reviews__star__orange" data-rating="{rng.randint(1, 5)}"></div>
+<div class="sdp-review__profile__article__list__reviews__product__name">상품 {rng.randint(1, 500)}</div>
+<div class="sdp-review__profile__article__list__reviews__star__date">2024.{rng.randint(1, 12):02d}.{rng.randint(1, 28):02d}</div>
+<div class="sdp-review__profile__article__list__reviews__seller_name">판매자: 셀러{rng.randint(1, 50)}</div>
+<div class="sdp-review__profile__article__list__reviews__title">리뷰 {i}</div>
+<div class="sdp-review__profile__article__list__reviews__content">배송 빠르고 좋아요 {i}</div>
+</div>""")
+    return '<html><body>' + '\n'.join(articles) + '</body></html>'
+
+
+def product_review_count(product: str) -> int:
+    return random.Random(product).randint(0, 300)
+
+
+def page_reviews(product: str, page: int, size: int, review_count: Optional[int] = None):
+    # (review number, rating, random generator) of every review on a 1-based page of a product
+    first = (page - 1) * size
+    review_count = product_review_count(product) if review_count is None else review_count
+    for i in range(max(first, 0), min(first + size, review_count)):
+        rng = random.Random(f'{product}:{i}')
+        yield i, rng.randint(1, 5), rng
+
+
+def coupang_product_reviews_page(product_id: str, page: int, size: int, review_count: Optional[int] = None) -> str:
+    articles = []
+    for i, rating, rng in page_reviews(product_id, page, size, review_count):
+        articles.append(f"""<article class="sdp-review__article__list">
+<button class="sdp-review__article__list__help__report-btn" data-review-id="{product_id}{i:05d}"></button>
+<span class="sdp-review__article__list__info__user__name" data-member-id="{rng.randint(1, 10 ** 6)}">사용자{i}</span>
+<div class="sdp-review__article__list__info__product-info__star-orange" data-rating="{rating}"></div>
+<div class="sdp-review__article__list__info__product-info__name">상품 {product_id}</div>
+<div class="sdp-review__article__list__info__product-info__reg-date">2024.{rng.randint(1, 12):02d}.{rng.randint(1, 28):02d}</div>
+<div class="sdp-review__article__list__info__product-info__seller_name">판매자: 셀러{rng.randint(1, 50)}</div>
+<div class="sdp-review__article__list__headline">리뷰 {i}</div>
+<div class="sdp-review__article__list__review"><div>배송 빠르고 좋아요 {i}</div></div>
+</article>""")
+    return '<html><body>' + '\n'.join(articles) + '</body></html>'
+
+
+def crema_reviews_page(product_code: str, page: int, size: int = 5, review_count: Optional[int] = None) -> str:
+    items = []
+    for i, rating, rng in page_reviews(product_code, page, size, review_count):
+        items.append(f"""<li class="review_list_v2" id="review_{product_code}{i:05d}">
+<div class="review_options_v2">옵션 {rng.randint(1, 3)}</div>
+<div class="review_list_v2__user_name_message"><b>사용자{i}</b></div>
+<span class="visually-hidden">별점: {rating}점</span>
+<div class="review_list_v2__content review_list_v2__content--expanded"><div class="review_list_v2__message js-translate-text">향이 너무 좋네요 {i}</div></div>
+<div class="review_list_v2__date">2024.{rng.randint(1, 12):02d}.{rng.randint(1, 28):02d}</div>
+</li>""")
+    return '<html><body><ul>' + '\n'.join(items) + '</ul></body></html>'
+
+
+def alpha_reviews_page(product_no: str, page: int, size: int = 10, review_count: Optional[int] = None) -> str:
+    items = []
+    for i, rating, rng in page_reviews(product_no, page, size, review_count):
+        items.append(f"""<div class="widget_item review" value="{product_no}{i:05d}">
+<div class="widget_product_name">상품 {product_no}</div>
+<div class="widget_product_price">{rng.randint(10, 90) * 1000}원</div>
+<div class="widget_item_tab_1_1">옵션 {rng.randint(1, 3)}</div>
+<span class="widget_item_username_1">사용자</span><span class="widget_item_username_2">{i}</span>
+<div class="widget_rating_number">{rating}</div>
+<span class="widget_item_review_box">재구매 의사 있어요 {i}</span>
+<div class="widget_item_date">2024-{rng.randint(1, 12):02d}-{rng.randint(1, 28):02d}</div>
+</div>""")
+    # The widget lists every review twice
+    return '<html><body>' + '\n'.join(items + items) + '</body></html>'
+
+
+def cafe24_reviews_page(product_no: str, page: int, size: int = 10, review_count: Optional[int] = None) -> str:
+    items = ['<div class="widget_m">리뷰 작성 정책</div>']
+    for i, rating, rng in page_reviews(product_no, page, size, review_count):
+        stars = ''.join('<path fill="#ffc107"></path>' for _ in range(rating)) + ''.join('<path fill="#e6e9ec"></path>' for _ in range(5 - rating))
+        items.append(f"""<div class="widget_m">
+<div class="widget_table_col_1">{product_no}{i:05d}</div>
+<div class="widget_item_username">사용자{i}</div>
+<svg>{stars}</svg>
+<div class="widget_table_col_2_expand_review_text">가격 대비 만족 합니다 {i}</div>
+<div class="widget_table_col_4">2024-{rng.randint(1, 12):02d}-{rng.randint(1, 28):02d}</div>
+</div>""")
+    return '<html><body>' + '\n'.join(items) + '</body></html>'
+
+
+class MockReviewHandler(BaseHTTPRequestHandler):
+    latency = 0.0
+    fail_rate = 0.0
+    # Reviews of every product page, instead of a random count per product
+    product_reviews = None
+    request_count = 0
+    in_flight = 0
+    max_in_flight = 0
+    count_lock = threading.Lock()
+
+    def do_GET(self):
+        # Counted on the server's own handler class, so each mock host reports its own peak concurrency
+        cls = type(self)
+        with self.count_lock:
+            cls.request_count += 1
+            cls.in_flight += 1
+            cls.max_in_flight = max(cls.max_in_flight, cls.in_flight)
+        try:
+            self.answer()
+        finally:
+            with self.count_lock:
+                cls.in_flight -= 1
+
+    def answer(self):
+        if self.latency:
+            time.sleep(self.latency)
+        if self.fail_rate and random.random() < self.fail_rate:
+            self.send_error(503)
+            return
+
+        url = urlparse(self.path)
+        query = {key: values[0] for key, values in parse_qs(url.query).items()}
+        parts = [p for p in url.path.split('/') if p]
+        body = None
+
+        if parts[:4] == ['vp', 'product', 'reviews', 'profile'] and len(parts) >= 5:
+            user_uid = parts[4]
+            review_count = random.Random(user_uid).randint(0, 60)
+            if len(parts) == 5:
+                body = coupang_profile_page(user_uid, review_count)
+            elif parts[5] == 'reviews':
+                body = coupang_profile_reviews_page(user_uid, int(query.get('page', 0)), int(query.get('size', 15)), review_count)
+        elif parts == ['vp', 'product', 'reviews']:
+            body = coupang_product_reviews_page(query.get('productId', ''), int(query.get('page', 1)), int(query.get('size', 5)), self.product_reviews)
+        elif parts[-2:] == ['products', 'reviews']:
+            body = crema_reviews_page(query.get('product_code', ''), int(query.get('page', 1)), review_count=self.product_reviews)
+        elif 'boardAlphareview' in parts:
+            body = alpha_reviews_page(query.get('product_no', ''), int(query.get('page', 1)), review_count=self.product_reviews)
+        elif 'boardCafe24' in parts:
+            body = cafe24_reviews_page(query.get('product_no', ''), int(query.get('page', 1)), review_count=self.product_reviews)
+
+        if body is None:
+            self.send_error(404)
+            return
+        data = body.encode('utf-8')
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/html; charset=utf-8')
+        self.send_header('Content-Length', str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def start_server(port: int = 0, latency: float = 0.0, fail_rate: float = 0.0, product_reviews: Optional[int] = None) -> ThreadingHTTPServer:
+    """Start the mock server in a background thread; port 0 picks a free port (see server.server_address)."""
+    handler = type('Handler', (MockReviewHandler,), {'latency': latency, 'fail_rate': fail_rate, 'product_reviews': product_reviews})
+    server = ThreadingHTTPServer(('127.0.0.1', port), handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def mock_targets(base_urls, products: int = 5):
+    # Crawl targets for crawl_scheduler.py: products of each review site, one site per mock server (host)
+    paths = {
+        'coupang': '/vp/products/{product}?itemId=1',
+        'crema': '/shop.co.kr/products/reviews?app=0&iframe=1&product_code={product}&page=1',
+        'alpha': '/boardAlphareview/reviews?product_no={product}&page=1',
+        'cafe24': '/boardCafe24/reviews?product_no={product}&page=1',
+    }
+    targets = []
+    for (source, path), base_url in zip(paths.items(), base_urls):
+        for i in range(products):
+            product = f'{source}{i}'
+            targets.append({'url': base_url + path.format(product=product), 'name': product, 'source': source})
+    return targets
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Serve mock review pages for local collector runs.')
+    parser.add_argument('--port', type=int, default=8000, help='Port to listen on')
+    parser.add_argument('--latency', type=float, default=0.0, help='Seconds to wait before answering each request')
+    parser.add_argument('--fail-rate', type=float, default=0.0, help='Share of requests answered with 503')
+    parser.add_argument('--product-reviews', type=int, default=None, help='Reviews of every product (default: a random count up to 300)')
+    parser.add_argument('--write-targets', type=str, default=None,
+                        help='Serve one review site per port (port to port+3) and write crawl_scheduler.py targets for them to this CSV')
+    parser.add_argument('--products', type=int, default=5, help='Products per review site in --write-targets')
+    args = parser.parse_args()
+    ports = range(args.port, args.port + 4) if args.write_targets else [args.port]
+    servers = [start_server(port, args.latency, args.fail_rate, args.product_reviews) for port in ports]
+    for server in servers:
+        print(f"Mock review server on http://127.0.0.1:{server.server_address[1]}")
+    if args.write_targets:
+        targets = mock_targets([f'http://127.0.0.1:{server.server_address[1]}' for server in servers], args.products)
+        with open(args.write_targets, 'w', newline='', encoding='utf-8') as f:
+            writer = csv.DictWriter(f, fieldnames=['url', 'name', 'source'])
+            writer.writeheader()
+            writer.writerows(targets)
+        print(f"{len(targets)} targets written to {args.write_targets}")
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        for server in servers:
+            server.shutdown()
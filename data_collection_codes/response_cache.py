@@ -0,0 +1,240 @@
+from typing import Callable, Iterator, Optional, Tuple
+from urllib.parse import urlencode, urlsplit, urlunsplit, parse_qsl
+import argparse
+import gzip
+import hashlib
+import importlib
+import json
+import os
+import sqlite3
+import threading
+import time
+import requests as rq
+
+# Raw responses of the review sites, so parsers can be re-run and timed without crawling again.
+# Bodies are stored gzip-compressed under the SHA-256 of their content (identical pages are stored once);
+# responses.sqlite maps the request key (method + normalized URL) to the body and the time it was fetched.
+
+MODES = ('record', 'replay', 'off')
+
+
+class CacheMiss(rq.RequestException):
+    """Raised in replay mode for a request that is not in the cache."""
+
+
+def request_key(method: str, url: str, params: Optional[dict] = None) -> str:
+    # Query parameters are sorted, so the same request always gets the same key whatever order they were given in
+    parts = urlsplit(url)
+    query = parse_qsl(parts.query, keep_blank_values=True) + list((params or {}).items())
+    normalized = urlunsplit((parts.scheme, parts.netloc, parts.path, urlencode(sorted((str(k), str(v)) for k, v in query)), ''))
+    return hashlib.sha256(f'{method.upper()} {normalized}'.encode('utf-8')).hexdigest()
+
+
+class ResponseCache:
+    """Content-addressed, compressed store of raw HTTP responses with a TTL, shared by all collector threads."""
+
+    def __init__(self, folder: str, ttl: Optional[float] = None, mode: str = 'record'):
+        if mode not in MODES:
+            raise ValueError(f'mode must be one of {MODES}')
+        self.folder = folder
+        self.ttl = ttl
+        self.mode = mode
+        os.makedirs(os.path.join(folder, 'objects'), exist_ok=True)
+        self.lock = threading.Lock()
+        self.conn = sqlite3.connect(os.path.join(folder, 'responses.sqlite'), check_same_thread=False)
+        self.conn.execute('PRAGMA journal_mode=WAL')
+        self.conn.executescript("""
+            CREATE TABLE IF NOT EXISTS responses (
+                key TEXT PRIMARY KEY,
+                method TEXT,
+                url TEXT,
+                status INTEGER,
+                content_type TEXT,
+                encoding TEXT,
+                body TEXT,
+                fetched_at REAL
+            );
+            CREATE INDEX IF NOT EXISTS responses_url ON responses (url);
+        """)
+
+    def object_path(self, digest: str) -> str:
+        return os.path.join(self.folder, 'objects', digest[:2], digest + '.gz')
+
+    def write_body(self, content: bytes) -> str:
+        digest = hashlib.sha256(content).hexdigest()
+        path = self.object_path(digest)
+        if not os.path.exists(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            with open(path + '.tmp', 'wb') as f:
+                f.write(gzip.compress(content, compresslevel=6))
+            os.replace(path + '.tmp', path)
+        return digest
+
+    def read_body(self, digest: str) -> bytes:
+        with open(self.object_path(digest), 'rb') as f:
+            return gzip.decompress(f.read())
+
+    def lookup(self, key: str) -> Optional[Tuple]:
+        # (url, status, content_type, encoding, body digest) of a stored response that has not expired
+        with self.lock:
+            row = self.conn.execute(
+                'SELECT url, status, content_type, encoding, body, fetched_at FROM responses WHERE key = ?', (key,)).fetchone()
+        if row is None:
+            return None
+        if self.ttl is not None and self.mode != 'replay' and row[5] < time.time() - self.ttl:
+            return None
+        return row[:5]
+
+    def store(self, key: str, method: str, url: str, status: int, content_type: str, encoding: Optional[str], content: bytes):
+        digest = self.write_body(content)
+        with self.lock, self.conn:
+            self.conn.execute('INSERT OR REPLACE INTO responses VALUES (?, ?, ?, ?, ?, ?, ?, ?)',
+                              (key, method.upper(), url, status, content_type, encoding, digest, time.time()))
+
+    def get_or_fetch(self, url: str, fetch: Callable[[], str]) -> str:
+        # For fetchers that are not requests sessions (e.g. selenium's driver.get + page_source): cached text or fetch()
+        if self.mode == 'off':
+            return fetch()
+        key = request_key('GET', url)
+        cached = self.lookup(key)
+        if cached is not None:
+            return self.read_body(cached[4]).decode('utf-8')
+        if self.mode == 'replay':
+            raise CacheMiss(f'not in the response cache: {url}')
+        text = fetch()
+        self.store(key, 'GET', url, 200, 'text/html; charset=utf-8', 'utf-8', text.encode('utf-8'))
+        return text
+
+    def responses(self, match: str = '') -> Iterator[Tuple[str, str]]:
+        # (url, text) of every stored successful response whose URL contains match, oldest first
+        with self.lock:
+            rows = self.conn.execute(
+                'SELECT url, encoding, body FROM responses WHERE status < 400 AND instr(url, ?) > 0 ORDER BY fetched_at',
+                (match,)).fetchall()
+        for url, encoding, digest in rows:
+            yield url, self.read_body(digest).decode(encoding or 'utf-8', errors='replace')
+
+    def prune(self, older_than: Optional[float] = None) -> Tuple[int, int]:
+        # Drop responses fetched more than older_than seconds ago (default: the TTL), then bodies nothing refers to
+        older_than = self.ttl if older_than is None else older_than
+        removed = 0
+        with self.lock, self.conn:
+            if older_than is not None:
+                removed = self.conn.execute('DELETE FROM responses WHERE fetched_at < ?', (time.time() - older_than,)).rowcount
+            referenced = {row[0] for row in self.conn.execute('SELECT DISTINCT body FROM responses')}
+        deleted = 0
+        for root, _, files in os.walk(os.path.join(self.folder, 'objects')):
+            for name in files:
+                if name.endswith('.gz') and name[:-3] not in referenced:
+                    os.remove(os.path.join(root, name))
+                    deleted += 1
+        return removed, deleted
+
+    def stats(self) -> dict:
+        with self.lock:
+            count, bodies, oldest, newest = self.conn.execute(
+                'SELECT COUNT(*), COUNT(DISTINCT body), MIN(fetched_at), MAX(fetched_at) FROM responses').fetchone()
+        size = sum(os.path.getsize(os.path.join(root, name))
+                   for root, _, files in os.walk(os.path.join(self.folder, 'objects')) for name in files)
+        return {'responses': count, 'distinct_bodies': bodies, 'compressed_mb': round(size / 1e6, 2),
+                'oldest': time.ctime(oldest) if oldest else None, 'newest': time.ctime(newest) if newest else None}
+
+    def close(self):
+        self.conn.close()
+
+
+class CachedSession(rq.Session):
+    """requests.Session that answers from a ResponseCache; before_fetch (e.g. a rate limiter) runs only on real fetches."""
+
+    def __init__(self, cache: ResponseCache, before_fetch: Optional[Callable[[str], None]] = None):
+        super().__init__()
+        self.cache = cache
+        self.before_fetch = before_fetch
+
+    def request(self, method, url, params=None, **kwargs):
+        if self.cache.mode == 'off':
+            return self.network_request(method, url, params, **kwargs)
+        key = request_key(method, url, params)
+        cached = self.cache.lookup(key)
+        if cached is not None:
+            return self.cached_response(cached)
+        if self.cache.mode == 'replay':
+            raise CacheMiss(f'not in the response cache: {url}')
+        response = self.network_request(method, url, params, **kwargs)
+        if response.status_code < 400:
+            self.cache.store(key, method, response.url, response.status_code, response.headers.get('Content-Type', ''),
+                             response.encoding, response.content)
+        return response
+
+    def network_request(self, method, url, params=None, **kwargs):
+        if self.before_fetch is not None:
+            self.before_fetch(url)
+        return super().request(method, url, params=params, **kwargs)
+
+    def cached_response(self, cached: Tuple) -> rq.Response:
+        url, status, content_type, encoding, digest = cached
+        response = rq.Response()
+        response.url = url
+        response.status_code = status
+        response.headers['Content-Type'] = content_type
+        response.headers['X-Response-Cache'] = 'hit'
+        response.encoding = encoding
+        response._content = self.cache.read_body(digest)
+        return response
+
+
+def load_parser(spec: str) -> Callable[[str, str], object]:
+    # 'module:function', called with (url, text) of each cached page
+    module_name, function_name = spec.split(':')
+    return getattr(importlib.import_module(module_name), function_name)
+
+
+def benchmark_parser(cache: ResponseCache, parser: Callable[[str, str], object], match: str = '') -> dict:
+    pages = list(cache.responses(match))
+    start = time.perf_counter()
+    items = 0
+    for url, text in pages:
+        result = parser(url, text)
+        items += len(result) if isinstance(result, list) else 1
+    elapsed = time.perf_counter() - start
+    return {'pages': len(pages), 'items': items, 'seconds': round(elapsed, 3),
+            'pages_per_second': round(len(pages) / elapsed, 1) if elapsed else None}
+
+
+def check_parser(cache: ResponseCache, parser: Callable[[str, str], object], expected_path: str, match: str = '') -> dict:
+    # Parser output per cached page is compared with the output saved by the first run (a missing file is created)
+    current = {url: json.loads(json.dumps(parser(url, text), ensure_ascii=False, default=str)) for url, text in cache.responses(match)}
+    if not os.path.exists(expected_path):
+        with open(expected_path, 'w', encoding='utf-8') as f:
+            json.dump(current, f, ensure_ascii=False, indent=1)
+        return {'pages': len(current), 'saved': expected_path}
+    with open(expected_path, encoding='utf-8') as f:
+        expected = json.load(f)
+    changed = [url for url in expected if url in current and current[url] != expected[url]]
+    return {'pages': len(current), 'changed': len(changed), 'missing': len(set(expected) - set(current)), 'changed_urls': changed[:20]}
+
+
+def get_args():
+    parser = argparse.ArgumentParser(description='Inspect the collector response cache and re-run parsers over it.')
+    parser.add_argument('command', choices=['stats', 'prune', 'bench', 'check'], help='What to do')
+    parser.add_argument('--cache', type=str, default='response_cache', help='Folder of the response cache')
+    parser.add_argument('--parser', type=str, help='Parser to run over the cached pages, ex. coupang_user_crawler:parse_page')
+    parser.add_argument('--match', type=str, default='', help='Only pages whose URL contains this string')
+    parser.add_argument('--expected', type=str, default='parser_expected.json', help='Saved parser output for check')
+    parser.add_argument('--older-than-days', type=float, default=None, help='prune: drop responses older than this')
+    return parser.parse_args()
+
+
+if __name__ == "__main__":
+    args = get_args()
+    cache = ResponseCache(args.cache, mode='replay')
+    if args.command == 'stats':
+        print(cache.stats())
+    elif args.command == 'prune':
+        older_than = args.older_than_days * 24 * 3600 if args.older_than_days is not None else None
+        print('removed %d responses, %d bodies' % cache.prune(older_than))
+    elif args.command == 'bench':
+        print(benchmark_parser(cache, load_parser(args.parser), args.match))
+    else:
+        print(check_parser(cache, load_parser(args.parser), args.expected, args.match))
+    cache.close()
@@ -0,0 +1,169 @@
+from bs4 import BeautifulSoup as bs
+from typing import Dict, List, Union
+import re
+
+# Parsers of the product review pages, taken from the collector notebooks so scripts can use them too.
+# Each one returns the reviews of one page, and an empty list for a page past the last one.
+
+Review = Dict[str, Union[str, int]]
+
+
+def extract_text_or_na(element) -> str:
+    try:
+        return element.get_text(strip=True)
+    except AttributeError:
+        return 'N/A'
+
+
+def parse_coupang_reviews(html: str) -> List[Review]:
+    soup = bs(html, 'html.parser')
+    articles = soup.select('article.sdp-review__article__list')
+    review_data = []
+
+    for article in articles:
+        # Review UID
+        review_id = article.select_one('button.sdp-review__article__list__help__report-btn')['data-review-id']
+
+        # Username and user UID
+        user_name = article.select_one('span.sdp-review__article__list__info__user__name')
+        user_uid = user_name['data-member-id']
+        if user_name == None or user_name.text == '':
+            user_name = '-'
+        else:
+            user_name = user_name.text.strip()
+
+        # Rating
+        rating = article.select_one('div.sdp-review__article__list__info__product-info__star-orange')
+        if rating == None:
+            rating = 0
+        else:
+            rating = int(rating.attrs['data-rating'])
+
+        # Product Name
+        prod_name = article.select_one('div.sdp-review__article__list__info__product-info__name')
+        if prod_name == None or prod_name.text == '':
+            prod_name = 'N/A'
+        else:
+            prod_name = prod_name.text.strip()
+
+        # Date
+        date = article.select_one('div.sdp-review__article__list__info__product-info__reg-date').text.strip()
+
+        # Seller
+        seller = article.select_one('div.sdp-review__article__list__info__product-info__seller_name')
+        if seller == None or seller.text == '':
+            seller = 'N/A'
+        else:
+            seller = seller.text.strip()[5:]
+
+        # Review Title/Headline
+        headline = article.select_one('div.sdp-review__article__list__headline')
+        if headline == None or headline.text == '':
+            headline = 'N/A'
+        else:
+            headline = headline.text.strip()
+
+        # Review Content
+        review_content = article.select_one('div.sdp-review__article__list__review > div')
+        if review_content == None:
+            review_content = 'N/A'
+        else:
+            review_content = re.sub('[\n\t]', '', review_content.text.strip())
+
+        # Survey Feedback
+        answer = article.select_one('span.sdp-review__article__list__survey__row__answer')
+        if answer == None or answer.text == '':
+            answer = 'N/A'
+        else:
+            answer = answer.text.strip()
+
+        review_data.append({
+            'review_uid': review_id,
+            'username_2': user_name,
+            'user_uid': user_uid,
+            'rating': rating,
+            'product_name': prod_name,
+            'review_date': date,
+            'seller_name': seller,
+            'review_title': headline,
+            'review_content': review_content,
+            'survey_answer': answer
+        })
+
+    return review_data
+
+
+def parse_alpha_reviews(html: str) -> List[Review]:
+    # Review sites by saladlab, from boardAlphareview
+    soup = bs(html, 'html.parser')
+    data = soup.select('div.widget_item.review')
+
+    # Every review is in the page twice
+    data = data[len(data) // 2:]
+
+    review_data = []
+    for item in data:
+        review_data.append({
+            'review_uid': item['value'],
+            'product_name': extract_text_or_na(item.select_one('div.widget_product_name')),
+            'product_price': extract_text_or_na(item.select_one('div.widget_product_price')),
+            'product_type': extract_text_or_na(item.select_one('div.widget_item_tab_1_1')),
+            'username_1': extract_text_or_na(item.select_one('span.widget_item_username_1')),
+            'username_2': extract_text_or_na(item.select_one('span.widget_item_username_2')),
+            'rating': extract_text_or_na(item.select_one('div.widget_rating_number')),
+            'review_content': extract_text_or_na(item.select_one('span.widget_item_review_box')),
+            'review_date': extract_text_or_na(item.select_one('div.widget_item_date'))
+        })
+
+    return review_data
+
+
+def parse_cafe24_reviews(html: str) -> List[Review]:
+    soup = bs(html, 'html.parser')
+    data = soup.select('div.widget_m')
+
+    # For this api structure, the first widget_m contains review policy and will be disregarded
+    data = data[1:]
+
+    review_data = []
+    for item in data:
+        review_data.append({
+            'review_uid': extract_text_or_na(item.select_one('div.widget_table_col_1')),
+            'product_name': extract_text_or_na(item.select_one('div.widget_product_name')),  # Does not exist in this api
+            'product_price': extract_text_or_na(item.select_one('div.widget_product_price')),  # Does not exist in this api
+            'product_type': extract_text_or_na(item.select_one('div.widget_item_tab_1_1')),  # Does not exist in this api
+            'username_1': extract_text_or_na(item.select_one('span.widget_item_username_1')),  # Does not exist in this api
+            'username_2': extract_text_or_na(item.select_one('div.widget_item_username')),
+            'rating': 5 - len(item.find_all("path", fill='#e6e9ec')),  # Count the yellow stars
+            'review_content': extract_text_or_na(item.select_one('div.widget_table_col_2_expand_review_text')),
+            'review_date': extract_text_or_na(item.select_one('div.widget_table_col_4'))
+        })
+
+    return review_data
+
+
+def parse_crema_reviews(html: str) -> List[Review]:
+    soup = bs(html, 'html.parser')
+    data = soup.select('li.review_list_v2')
+
+    review_data = []
+    for item in data:
+        review_content = 'N/A'
+        if item.select_one('div.review_list_v2__content.review_list_v2__content--expanded'):
+            review_content = extract_text_or_na(item.select_one('div.review_list_v2__content.review_list_v2__content--expanded').select_one('div.review_list_v2__message.js-translate-text'))
+        elif item.select_one('div.review_list_v2__content.review_content__expanded'):
+            review_content = extract_text_or_na(item.select_one('div.review_list_v2__content.review_content__expanded').select_one('div.review_list_v2__message.js-translate-text'))
+
+        review_data.append({
+            'review_uid': item['id'].split("_")[-1],
+            'product_name': extract_text_or_na(item.select_one('div.widget_product_name')),  # Does not exist in this api
+            'product_price': extract_text_or_na(item.select_one('div.widget_product_price')),  # Does not exist in this api
+            'product_type': extract_text_or_na(item.select_one('div.review_options_v2')),  # Options for review - can be the type of user
+            'username_1': 'N/A',  # Does not exist in this api
+            'username_2': extract_text_or_na(item.select_one('div.review_list_v2__user_name_message').select_one('b')),
+            'rating': extract_text_or_na(item.select_one('span.visually-hidden'))[-2],  # 별점: x점
+            'review_content': review_content,
+            'review_date': extract_text_or_na(item.select_one('div.review_list_v2__date'))
+        })
+
+    return review_data
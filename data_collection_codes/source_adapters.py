@@ -0,0 +1,111 @@
+from typing import Dict, Iterator, List, Optional, Tuple
+from urllib.parse import urlsplit, urlunsplit, parse_qsl, urlencode
+import csv
+import requests as rq
+from coupang_user_crawler import CoupangUserCrawler
+from review_page_parsers import Review, parse_coupang_reviews, parse_alpha_reviews, parse_cafe24_reviews, parse_crema_reviews
+
+# One adapter per review site: where its review pages are (planner), how to download one (fetcher) and how to read
+# the reviews out of it (parser). The collectors only go through these methods, so a new site is one more adapter.
+
+COUPANG_PAGE_SIZE = 5
+USER_AGENT = "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/92.0.4515.159 Safari/537.36"
+TIMEOUT = 30
+
+
+class SourceAdapter:
+    """Review pages of one site; each site sets the folder of its reviews and the parser of one page."""
+    folder = None
+    parser = None
+
+    def page_url(self, url: str, page: int) -> str:
+        # The product URL with its page query parameter set, as in the collector notebooks
+        parts = urlsplit(url)
+        query = [(key, value) for key, value in parse_qsl(parts.query, keep_blank_values=True) if key != 'page']
+        return urlunsplit(parts._replace(query=urlencode(query + [('page', str(page))])))
+
+    def pages(self, url: str, first_page: int = 1, last_page: Optional[int] = None) -> Iterator[Tuple[int, str]]:
+        # Page numbers and URLs in order, without end when the page count is not known
+        page = first_page
+        while last_page is None or page <= last_page:
+            yield page, self.page_url(url, page)
+            page += 1
+
+    def headers(self, url: str) -> Dict[str, str]:
+        return {'user-agent': USER_AGENT}
+
+    def fetch(self, session: rq.Session, url: str, page: int) -> rq.Response:
+        response = session.get(self.page_url(url, page), headers=self.headers(url), timeout=TIMEOUT)
+        response.raise_for_status()
+        return response
+
+    def parse(self, html: str) -> List[Review]:
+        return type(self).parser(html)
+
+
+class CoupangAdapter(SourceAdapter):
+    folder = 'Coupang'
+    parser = staticmethod(parse_coupang_reviews)
+
+    def page_url(self, url: str, page: int) -> str:
+        # Review pages of the product, on the host of the product URL
+        parts = urlsplit(url)
+        product_code = url.split('products/')[-1].split('?')[0]
+        return (f'{parts.scheme}://{parts.netloc}/vp/product/reviews?productId={product_code}&page={page}&size={COUPANG_PAGE_SIZE}'
+                f'&sortBy=ORDER_SCORE_ASC&ratings=&q=&viRoleCode=3&ratingSummary=true')
+
+    def headers(self, url: str) -> Dict[str, str]:
+        return {**CoupangUserCrawler.headers, 'referer': url}
+
+
+class CremaAdapter(SourceAdapter):
+    folder = 'Crema'
+    parser = staticmethod(parse_crema_reviews)
+
+
+class AlphaAdapter(SourceAdapter):
+    # Review sites by saladlab, from boardAlphareview
+    folder = 'Saladlab'
+    parser = staticmethod(parse_alpha_reviews)
+
+
+class Cafe24Adapter(SourceAdapter):
+    folder = 'Saladlab'
+    parser = staticmethod(parse_cafe24_reviews)
+
+
+ADAPTERS = {
+    'coupang': CoupangAdapter(),
+    'crema': CremaAdapter(),
+    'alpha': AlphaAdapter(),
+    'cafe24': Cafe24Adapter(),
+}
+
+
+def detect_source(url: str) -> str:
+    # Same URL checks as the collector notebooks
+    if '/boardAlphareview' in url:
+        return 'alpha'
+    if '/boardCafe24' in url:
+        return 'cafe24'
+    if 'cre.ma/' in url:
+        return 'crema'
+    if '/vp/products/' in url:
+        return 'coupang'
+    raise ValueError(f'cannot tell the review site of {url}, give it a source column')
+
+
+def read_targets(path: str) -> List[Dict]:
+    # CSV with url and name columns; source, folder and pages are optional. Without pages, pages are crawled until an empty one.
+    targets = []
+    with open(path, newline='', encoding='utf-8') as f:
+        for row in csv.DictReader(f):
+            source = row.get('source') or detect_source(row['url'])
+            targets.append({
+                'url': row['url'],
+                'source': source,
+                'name': row['name'],
+                'folder': row.get('folder') or ADAPTERS[source].folder,
+                'pages': int(row['pages']) if row.get('pages') else None,
+            })
+    return targets
@@ -0,0 +1,79 @@
+import threading
+import time
+import requests as rq
+from requests.adapters import BaseAdapter
+from coupang_user_crawler import CoupangUserCrawler, UserHistoryStore
+
+PROFILE_HTML = ('<div class="sdp-review__profile__article__info__name">{user}</div>'
+                '<div class="js_reviewProfileModalHiddenTotalCount" data-total-count="1"></div>')
+REVIEWS_HTML = ('<div class="sdp-review__profile__article__list__reviews">'
+                '<div class="sdp-review__profile__article__list__reviews__help" data-review-id="{user}1"></div>'
+                '<div class="sdp-review__profile__article__list__reviews__star__orange" data-rating="5"></div>'
+                '<div class="sdp-review__profile__article__list__reviews__star__date">2024.07.14</div>'
+                '<div class="sdp-review__profile__article__list__reviews__content">좋아요</div></div>')
+
+
+class MockCoupang(BaseAdapter):
+    """Answers profile and review pages after `latency` seconds; each URL fails with a 503 its first `failures[user]` times."""
+
+    def __init__(self, latency=0.0, failures=None):
+        super().__init__()
+        self.latency = latency
+        self.failures = dict(failures or {})
+        self.sends = []
+        self.in_flight = self.max_in_flight = 0
+        self.lock = threading.Lock()
+
+    def send(self, request, **kwargs):
+        user = request.url.split('/profile/')[1].split('/')[0]
+        with self.lock:
+            self.sends.append((time.monotonic(), request.url))
+            self.in_flight += 1
+            self.max_in_flight = max(self.max_in_flight, self.in_flight)
+            failed = self.failures.get(user, 0) > 0
+            if failed:
+                self.failures[user] -= 1
+        time.sleep(self.latency)
+        with self.lock:
+            self.in_flight -= 1
+        response = rq.Response()
+        response.status_code = 503 if failed else 200
+        response.url = request.url
+        response.encoding = 'utf-8'
+        response._content = (REVIEWS_HTML if '/reviews?' in request.url else PROFILE_HTML).format(user=user).encode('utf-8')
+        return response
+
+    def close(self):
+        pass
+
+
+def crawler_with(adapter, tmp_path, **kwargs):
+    crawler = CoupangUserCrawler(UserHistoryStore(str(tmp_path / 'users.sqlite')), base_url='http://mock', jitter=0.0, **kwargs)
+    crawler.session.mount('http://', adapter)
+    return crawler
+
+
+def test_requests_are_spaced_but_overlap(tmp_path):
+    adapter = MockCoupang(latency=0.2)
+    crawler = crawler_with(adapter, tmp_path, workers=8, delay=0.05)
+    start = time.monotonic()
+    stats = crawler.collect_reviews_of_users_from_product('http://mock/product', [f'u{i}' for i in range(8)])
+    elapsed = time.monotonic() - start
+    assert stats == {'skipped': 0, 'collected': 8, 'failed': 0}
+    send_times = sorted(t for t, _ in adapter.sends)
+    assert len(send_times) == 24
+    assert min(b - a for a, b in zip(send_times, send_times[1:])) >= 0.05 - 0.005
+    # Waiting threads do not hold up the requests already sent, so 24 requests of 0.2s overlap
+    assert adapter.max_in_flight > 1
+    assert elapsed < 24 * 0.2 / 2
+
+
+def test_failed_pages_are_retried(tmp_path):
+    adapter = MockCoupang(failures={'flaky': 2, 'down': 100})
+    crawler = crawler_with(adapter, tmp_path, workers=2, delay=0.01, max_attempts=3)
+    stats = crawler.collect_reviews_of_users_from_product('http://mock/product', ['flaky', 'down'])
+    assert stats == {'skipped': 0, 'collected': 1, 'failed': 1}
+    urls = [url for _, url in adapter.sends]
+    assert urls.count('http://mock/vp/product/reviews/profile/flaky') == 3
+    assert urls.count('http://mock/vp/product/reviews/profile/down') == 3
+    assert len(crawler.store.user_reviews(['flaky'])) == 1